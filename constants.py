@@ -8,13 +8,23 @@ DATETIME_FMT_No_S = '%Y-%m-%d %H:%M'
 DATETIME_FMT_MS = '%Y-%m-%d %H:%M:%S.%f'
 
 # File Formats
-SUPPORTED_FILE_FORMATS = ['csv', 'xlsx']
+SUPPORTED_FILE_FORMATS = ['csv', 'xlsx', 'parquet']
+
+# Content of the trades files: entry/exit rows, one row per trade, all rows
+TRADES_OUTPUTS = ['events', 'ledger', 'bars']
 # OUTPUT_FILE_FORMAT = ['xlsx']  # Preferred format(s) for the output: csv, xlsx or both. Ex: ['csv', 'xlsx']
 
+# Historical data storage backends
+SUPPORTED_DB_BACKENDS = ['postgresql', 'parquet', 'memmap']
+
 # Exchanges
 SUPPORTED_EXCHANGES = ['Binance', 'Bybit']
 # SUPPORTED_EXCHANGES = ccxt.exchanges
 
+# Maximum number of candles returned by one fetch_ohlcv() call, by ccxt exchange id
+OHLCV_PAGE_LIMITS = {'binance': 1500, 'binanceusdm': 1500, 'binancecoinm': 1500, 'bybit': 200}
+DEFAULT_OHLCV_PAGE_LIMIT = 500
+
 # Valid Intervals. Some intervals are not supported by some exchanges
 VALID_INTERVALS = ['1m', '3m', '5m', '15m', '30m', '1h', '2h', '4h', '6h', '12h', '1d', '1w', '1M']
 
@@ -27,6 +37,9 @@ VALID_STRATEGIES = ['HA_VWAP', 'MACD_BB_Freeman', 'MACD', 'MACD_X', 'ScalpEmaRsi
 # Implemented Exit Strategies
 VALID_EXIT_STRATEGIES = ['FixedPCT', 'ExitOnNextEntry', 'VWAP_Touch']
 
+# Statistics maximized by the optimizations (see optimization/objectives.py)
+OPTIMIZATION_OBJECTIVES = ['Total P/L', 'Win Rate', 'Return / Drawdown']
+
 # JSON configuration schema to validate the config.json file
 CONFIG_SCHEMA = {
     '$schema': 'https://json-schema.org/draft/2020-12/schema',
@@ -41,6 +54,37 @@ CONFIG_SCHEMA = {
                 'tradable_ratio': {'type': 'number', 'exclusiveMinimum': 0, 'maximum': 1.0},
                 'entry_as_maker': {'type': 'boolean', 'default': False},
                 'initial_capital': {'type': 'number', 'exclusiveMinimum': 0},
+                'early_stop': {
+                    'description': 'Rules stopping a test case before the end of its range, its statistics are the '
+                                   'ones at the stop and its trades are not saved. Unset rules (null) are not checked.',
+                    'type': 'object',
+                    'properties': {
+                        'max_drawdown_pct': {
+                            'description': 'Stop when the equity falls this % below its peak',
+                            'type': ['number', 'null'],
+                            'exclusiveMinimum': 0,
+                            'maximum': 100
+                        },
+                        'wallet_floor_pct': {
+                            'description': 'Stop when the equity falls below this % of the initial capital',
+                            'type': ['number', 'null'],
+                            'exclusiveMinimum': 0,
+                            'maximum': 100
+                        },
+                        'min_trades': {
+                            'description': 'Stop when less than this number of trades are closed after '
+                                           'min_trades_range_pct % of the range',
+                            'type': ['integer', 'null'],
+                            'minimum': 1
+                        },
+                        'min_trades_range_pct': {
+                            'type': 'number',
+                            'exclusiveMinimum': 0,
+                            'maximum': 100,
+                            'default': 50
+                        }
+                    }
+                }
             },
             'required': ['tradable_ratio', 'entry_as_maker', 'initial_capital']
         },
@@ -52,7 +96,7 @@ CONFIG_SCHEMA = {
                     'default': True
                 },
                 'test_cases_file_path': {
-                    'description': 'File containing test cases',
+                    'description': 'File containing test cases: xlsx, csv, jsonl or yaml',
                     'type': 'string'
                 },
                 'historical_files_path': {
@@ -64,11 +108,30 @@ CONFIG_SCHEMA = {
                     'type': 'string'
                 },
                 'output_file_format': {
-                    'description': 'Preferred format(s) for the output: csv, xlsx or both. Ex: [\'csv\', \'xlsx\']',
+                    'description': 'Preferred format(s) for the output: csv, xlsx, parquet. Ex: [\'csv\', \'xlsx\']',
                     'type': 'array',
                     'items': {'type': 'string', 'enum': SUPPORTED_FILE_FORMATS},
                     'minItems': 1,
                     'uniqueItems': True
+                },
+                'trades_output': {
+                    'description': 'Content of the trades file of each test case: the entry and exit rows (events), '
+                                   'one row per trade (ledger) or all the rows with their candles and indicators (bars)',
+                    'type': 'string',
+                    'enum': TRADES_OUTPUTS,
+                    'default': 'events'
+                },
+                'trades_context_bars': {
+                    'description': 'With trades_output = events, number of rows saved before and after each event',
+                    'type': 'integer',
+                    'minimum': 0,
+                    'default': 0
+                },
+                'result_store': {
+                    'description': 'Skip the test cases already run with the same params, settings, candles and code, '
+                                   'their statistics are reused (stats/ResultStore.py). Lets a stopped run resume.',
+                    'type': 'boolean',
+                    'default': False
                 }
             },
             'required': [
@@ -82,7 +145,49 @@ CONFIG_SCHEMA = {
         'exchange': {
             'type': 'object',
             'properties': {
-                'use_testnet': {'type': 'boolean', 'default': False}
+                'use_testnet': {'type': 'boolean', 'default': False},
+                'markets_cache_ttl_hours': {
+                    'description': 'Number of hours the markets (pairs, fees) cached on disk are used before '
+                                   'being reloaded from the exchange',
+                    'type': 'number',
+                    'minimum': 0,
+                    'default': 24
+                },
+                'offline': {
+                    'description': 'Never call the exchange to load markets, only use the markets cached on disk',
+                    'type': 'boolean',
+                    'default': False
+                },
+                'download_workers': {
+                    'description': 'Number of pages of candles downloaded in parallel, '
+                                   'requests are still limited by the exchange rate limit',
+                    'type': 'integer',
+                    'minimum': 1,
+                    'default': 8
+                },
+                'use_fake_exchange': {
+                    'description': 'Replace all exchanges by the local fake exchange (offline tests and benchmarks)',
+                    'type': 'boolean',
+                    'default': False
+                },
+                'fake': {
+                    'description': 'Settings of the local fake exchange, see exchanges/FakeExchange.py',
+                    'type': 'object',
+                    'properties': {
+                        'latency': {'type': 'number', 'minimum': 0, 'default': 0.2},
+                        'ohlcv_page_limit': {'type': 'integer', 'minimum': 1, 'default': 1000},
+                        'rate_limit': {'type': 'number', 'exclusiveMinimum': 0, 'default': 50},
+                        'max_requests_per_second': {'type': 'number', 'exclusiveMinimum': 0},
+                        'error_rate': {'type': 'number', 'minimum': 0, 'maximum': 1, 'default': 0},
+                        'gaps': {
+                            'type': 'array',
+                            'items': {'type': 'array', 'items': {'type': 'string'}, 'minItems': 2, 'maxItems': 2}
+                        },
+                        'listing_date': {'type': 'string', 'default': '2019-09-01'},
+                        'dataset_path': {'type': 'string'},
+                        'seed': {'type': 'integer', 'default': 0}
+                    }
+                }
             },
             'required': ['use_testnet']
         },
@@ -94,6 +199,80 @@ CONFIG_SCHEMA = {
                     'type': 'boolean',
                     'default': True
                 },
+                'backend': {
+                    'description': 'Storage used for the historical data: PostgreSQL database, local parquet files '
+                                   'or local memory mapped files',
+                    'type': 'string',
+                    'enum': SUPPORTED_DB_BACKENDS,
+                    'default': 'postgresql'
+                },
+                'parquet_path': {
+                    'description': 'Folder location of the parquet files when backend = parquet',
+                    'type': 'string'
+                },
+                'memmap_path': {
+                    'description': 'Folder location of the memory mapped files when backend = memmap',
+                    'type': 'string'
+                },
+                'save_trades': {
+                    'description': 'Write the trades of each test case (one row per trade) to the '
+                                   'Test_Results_Trades table, with the statistics',
+                    'type': 'boolean',
+                    'default': True
+                },
+                'derive_intervals_from_1m': {
+                    'description': 'Build candles of intervals other than 1m from the 1m table instead of '
+                                   'reading/downloading a table for each interval',
+                    'type': 'boolean',
+                    'default': False
+                },
+                'work_queue': {
+                    'description': 'Queue sharing the test cases between worker processes or machines '
+                                   '(main.py --enqueue and --queue-worker)',
+                    'type': 'object',
+                    'properties': {
+                        'backend': {
+                            'description': 'PostgreSQL database (address, port and credentials of the database '
+                                           'section) or local SQLite file',
+                            'type': 'string',
+                            'enum': ['postgresql', 'sqlite'],
+                            'default': 'postgresql'
+                        },
+                        'db_name': {'type': 'string', 'default': 'Work_Queue'},
+                        'sqlite_path': {'type': 'string', 'default': 'work_queue.db'},
+                        'claim_size': {
+                            'description': 'Number of test cases claimed at once by a worker',
+                            'type': 'integer',
+                            'minimum': 1,
+                            'default': 4
+                        },
+                        'heartbeat_interval': {
+                            'description': 'Seconds between two heartbeats of a worker',
+                            'type': 'number',
+                            'exclusiveMinimum': 0,
+                            'default': 30
+                        },
+                        'stall_timeout': {
+                            'description': 'Seconds without heartbeat after which the test cases of a worker '
+                                           'are queued again',
+                            'type': 'number',
+                            'exclusiveMinimum': 0,
+                            'default': 300
+                        },
+                        'max_attempts': {
+                            'description': 'Number of times a test case is claimed before being marked as failed',
+                            'type': 'integer',
+                            'minimum': 1,
+                            'default': 3
+                        },
+                        'poll_interval': {
+                            'description': 'Seconds between two checks of the queue when there is nothing to claim',
+                            'type': 'number',
+                            'exclusiveMinimum': 0,
+                            'default': 5
+                        }
+                    }
+                },
                 'address': {'type': 'string', 'default': 'localhost'},
                 'port': {'type': 'integer', 'default': 5432},
                 'username': {'type': 'string'},
@@ -101,6 +280,92 @@ CONFIG_SCHEMA = {
             },
             'required': ['historical_data_stored_in_db', 'address', 'port', 'username', 'password']
         },
+        'optimization': {
+            'type': 'object',
+            'properties': {
+                'walk_forward': {
+                    'description': 'Windows of the walk-forward optimization (main.py --walk-forward)',
+                    'type': 'object',
+                    'properties': {
+                        'in_sample_days': {
+                            'description': 'Length of the windows on which the strategy settings are optimized',
+                            'type': 'number',
+                            'exclusiveMinimum': 0,
+                            'default': 90
+                        },
+                        'out_of_sample_days': {
+                            'description': 'Length of the windows on which the best settings are evaluated, '
+                                           'the windows are moved forward by this length',
+                            'type': 'number',
+                            'exclusiveMinimum': 0,
+                            'default': 30
+                        },
+                        'anchored': {
+                            'description': 'All in-sample windows start at the beginning of the test case range',
+                            'type': 'boolean',
+                            'default': False
+                        },
+                        'objective': {
+                            'description': 'Statistic maximized on the in-sample windows',
+                            'type': 'string',
+                            'enum': OPTIMIZATION_OBJECTIVES,
+                            'default': 'Total P/L'
+                        }
+                    }
+                },
+                'search': {
+                    'description': 'Search of the best settings among the swept parameters of a test case '
+                                   '(main.py --optimize): successive halving then Tree-structured Parzen Estimator',
+                    'type': 'object',
+                    'properties': {
+                        'objective': {
+                            'description': 'Statistic maximized by the search',
+                            'type': 'string',
+                            'enum': OPTIMIZATION_OBJECTIVES,
+                            'default': 'Total P/L'
+                        },
+                        'initial_candidates': {
+                            'description': 'Number of random candidates of the successive halving',
+                            'type': 'integer',
+                            'minimum': 1,
+                            'default': 27
+                        },
+                        'reduction_factor': {
+                            'description': 'The successive halving keeps the best 1/reduction_factor candidates '
+                                           'and multiplies the length of the date range by reduction_factor',
+                            'type': 'integer',
+                            'minimum': 2,
+                            'default': 3
+                        },
+                        'min_days': {
+                            'description': 'Length of the shortest date range of the successive halving',
+                            'type': 'number',
+                            'exclusiveMinimum': 0,
+                            'default': 30
+                        },
+                        'trials': {
+                            'description': 'Number of candidates proposed by the Tree-structured Parzen Estimator '
+                                           'after the successive halving',
+                            'type': 'integer',
+                            'minimum': 0,
+                            'default': 50
+                        },
+                        'prune': {
+                            'description': 'Candidates proposed by the Tree-structured Parzen Estimator are first '
+                                           'run on the shortest date range, and stopped if their score is below '
+                                           'the median score of that range',
+                            'type': 'boolean',
+                            'default': True
+                        },
+                        'seed': {
+                            'description': 'Seed of the random candidates, for reproducible searches',
+                            'type': ['integer', 'null'],
+                            'default': None
+                        }
+                    }
+                }
+            }
+        },
     },
     'required': ['trades', 'output', 'exchange', 'database']
 }
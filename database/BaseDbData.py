@@ -2,18 +2,25 @@ import sqlalchemy
 from sqlalchemy_utils import database_exists
 from sqlalchemy.engine.reflection import Inspector
 from Configuration import Configuration
+import utils
 
 
 class BaseDbData:
     URL_TEMPLATE = 'postgresql://<username>:<password>@<address>:<port>/<db_name>'
 
-    def __init__(self, exchange_name):
+    def __init__(self, exchange_name, engine=None):
+        """
+            engine: engine of this database already created by another object (Ex: the DbDataLoader for its
+                    DbSchemaManager), so that they share its connection pool. Created if None.
+        """
         self.config = Configuration.get_config()
         # Database
         self.db_name = exchange_name.capitalize().replace('_testnet', '_Testnet')
         self.db_url = self.get_db_url(self.db_name)
-        self.validate_db()
-        self.engine = sqlalchemy.create_engine(self.db_url)
+        if engine is None:
+            self.validate_db()
+            engine = sqlalchemy.create_engine(self.db_url)
+        self.engine = engine
         self.inspector = Inspector.from_engine(self.engine)
         #self.metadata = sqlalchemy.MetaData(self.engine)
 
@@ -34,6 +41,13 @@ class BaseDbData:
     def get_table_name(pair, interval):
         return f"Candles_{pair.replace('/', '')}_{interval}"
 
+    # Get the PostgreSQL interval literal for this interval. Ex: '15m' => '15 minutes'
+    @staticmethod
+    def get_sql_interval(interval):
+        amount, unit = utils.parse_interval(interval)
+        units = {'m': 'minutes', 'h': 'hours', 'd': 'days', 'w': 'weeks', 'M': 'months'}
+        return f'{amount} {units[unit]}'
+
     def exec_sql_query(self, query):
         connection = self.engine.connect()
         result = connection.execute(query)
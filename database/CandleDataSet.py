@@ -0,0 +1,92 @@
+"""
+    Candles of a test range (exchange, pair, from, to) shared by all the test cases run on this range.
+    Each interval is read once from the database or the exchange, with the largest number of prior
+    candles needed by the test cases of the range. Each test case then gets the candles starting at its
+    own number of prior candles, the same candles it would have read on its own.
+    Test cases can also run on a part of the range (Ex: the windows of a walk-forward optimization),
+    they get the candles of their own range, with their prior candles read from the candles before it.
+    Indicators computed on these candles are also cached, so that test cases using the same indicator
+    settings (Ex: a parameter sweep over the thresholds of a strategy) compute them once.
+"""
+from collections import OrderedDict
+
+import pandas as pd
+
+import utils
+
+
+class CandleDataSet:
+    # Copy on write is always enabled from pandas 3: slices share the candles until a strategy modifies them
+    COPY_ON_WRITE = int(pd.__version__.split('.')[0]) >= 3
+
+    # Maximum number of indicators kept in the cache, the least recently used ones are dropped first
+    INDICATOR_CACHE_SIZE = 64
+
+    def __init__(self, from_time, to_time, priors):
+        """
+            priors: {interval: include_prior}, the largest include_prior used by the test cases for each interval
+        """
+        self.from_time = from_time
+        self.to_time = to_time
+        self.priors = dict(priors)
+        self.frames = {}
+        self.loaded_priors = {}
+        self.indicators = OrderedDict()
+        self.fingerprints = {}
+
+    @staticmethod
+    def get_start_time(from_time, interval, include_prior):
+        # Same first candle as the database readers and the exchanges
+        if include_prior > 0:
+            return utils.adjust_from_time(from_time, interval, include_prior)
+        return from_time
+
+    def get_candle_data(self, interval, include_prior, fetch, from_time=None, to_time=None):
+        """
+            Returns the candles of interval between from_time and to_time (the whole range by default),
+            starting include_prior candles before from_time.
+            fetch(interval, include_prior, from_time, to_time) is only called the first time an interval is used.
+        """
+        from_time = from_time if from_time is not None else self.from_time
+        to_time = to_time if to_time is not None else self.to_time
+        if from_time < self.from_time or to_time > self.to_time:
+            raise Exception(f'[{from_time}, {to_time}] is outside of the candles range [{self.from_time}, {self.to_time}].')
+
+        if interval not in self.frames or include_prior > self.loaded_priors[interval]:
+            prior = max(include_prior, self.priors.get(interval, 0))
+            self.frames[interval] = fetch(interval, prior, self.from_time, self.to_time)
+            self.loaded_priors[interval] = prior
+
+        df = self.frames[interval]
+        if df is None:
+            return None
+        start_time = self.get_start_time(from_time, interval, include_prior)
+        df = df.iloc[df.index.searchsorted(start_time):df.index.searchsorted(to_time, side='right')]
+        return df if self.COPY_ON_WRITE else df.copy()
+
+    @staticmethod
+    def copy_indicator(values):
+        # Strategies get their own copy, they are free to modify it
+        if isinstance(values, tuple):
+            return tuple(x.copy() for x in values)
+        return values.copy()
+
+    def get_indicator(self, key, compute):
+        """
+            Returns the indicator identified by key, calling compute() the first time it is requested
+        """
+        if key in self.indicators:
+            self.indicators.move_to_end(key)
+        else:
+            self.indicators[key] = compute()
+            if len(self.indicators) > self.INDICATOR_CACHE_SIZE:
+                self.indicators.popitem(last=False)
+        return self.copy_indicator(self.indicators[key])
+
+    def get_fingerprint(self, key, compute):
+        """
+            Returns the fingerprint of the candles identified by key, calling compute() the first time it is requested
+        """
+        if key not in self.fingerprints:
+            self.fingerprints[key] = compute()
+        return self.fingerprints[key]
@@ -0,0 +1,121 @@
+"""
+    Class used to derive higher interval candles (3m, 5m, ..., 1d, 1w, 1M) from 1m candles.
+    Bars are aligned the same way the exchanges align them:
+        - minutes, hours and days are aligned on the unix epoch (1970-01-01 00:00)
+        - weeks start on Monday 00:00
+        - months start on the 1st of the month 00:00
+    Resampled results are cached in memory so that multiple test cases using the same
+    pair/interval/date range do not recompute them.
+"""
+from collections import OrderedDict
+from datetime import timedelta
+
+import pandas as pd
+
+import utils
+
+
+class CandleResampler:
+    # Maximum number of resampled DataFrames kept in memory
+    MAX_CACHE_ENTRIES = 32
+
+    # OHLCV aggregation rules
+    AGGREGATION = {
+        'open_time': 'first',
+        'open': 'first',
+        'high': 'max',
+        'low': 'min',
+        'close': 'last',
+        'volume': 'sum'
+    }
+
+    _cache = OrderedDict()
+
+    @staticmethod
+    def get_pandas_freq(interval):
+        amount, unit = utils.parse_interval(interval)
+        if unit in ['m', 'h', 'd']:
+            # Fixed length frequency so that the bars can be aligned on the epoch
+            return f'{utils.convert_interval_to_min(interval)}min'
+        elif unit == 'w':
+            return f'{amount}W-MON'
+        else:
+            return f'{amount}MS'
+
+    @classmethod
+    def get_bar_start(cls, timestamp, interval):
+        """
+            Returns the open time of the bar of this interval that contains timestamp
+        """
+        amount, unit = utils.parse_interval(interval)
+        timestamp = pd.Timestamp(timestamp)
+        if unit in ['m', 'h', 'd']:
+            bar_length = pd.Timedelta(minutes=utils.convert_interval_to_min(interval))
+            epoch = pd.Timestamp(1970, 1, 1)
+            return epoch + ((timestamp - epoch) // bar_length) * bar_length
+        elif unit == 'w':
+            # Weekly bars start on Mondays, 1970-01-05 is the first Monday after the epoch
+            bar_length = pd.Timedelta(weeks=amount)
+            first_monday = pd.Timestamp(1970, 1, 5)
+            return first_monday + ((timestamp - first_monday) // bar_length) * bar_length
+        else:
+            months = timestamp.year * 12 + timestamp.month - 1
+            months -= months % amount
+            return pd.Timestamp(months // 12, months % 12 + 1, 1)
+
+    @classmethod
+    def get_bar_end(cls, timestamp, interval):
+        """
+            Returns the open time of the last 1m candle of the bar of this interval that contains timestamp
+        """
+        amount, unit = utils.parse_interval(interval)
+        bar_start = cls.get_bar_start(timestamp, interval)
+        if unit == 'M':
+            bar_end = bar_start + pd.DateOffset(months=amount)
+        else:
+            bar_end = bar_start + pd.Timedelta(minutes=utils.convert_interval_to_min(interval))
+        return bar_end - timedelta(minutes=1)
+
+    @classmethod
+    def resample(cls, df_1m, interval):
+        """
+            Aggregate a DataFrame of 1m OHLCV candles into candles of the requested interval.
+            Bars for which no 1m candle exists are dropped (same behavior as a gap in the exchange data).
+        """
+        if df_1m is None or len(df_1m.index) == 0:
+            return df_1m
+
+        _, unit = utils.parse_interval(interval)
+        freq = cls.get_pandas_freq(interval)
+        aggregation = {k: v for k, v in cls.AGGREGATION.items() if k in df_1m.columns}
+        if unit in ['m', 'h', 'd']:
+            resampler = df_1m.resample(freq, origin='epoch', label='left', closed='left')
+        else:
+            # W-MON and MS bins are labeled by default on their closing edge,
+            # label/close them on the Monday or 1st of the month opening the bar
+            resampler = df_1m.resample(freq, label='left', closed='left')
+
+        df = resampler.agg(aggregation)
+        df = df.dropna(subset=['open'])
+        df.index.name = df_1m.index.name
+        return df
+
+    @classmethod
+    def get_cached(cls, key):
+        df = cls._cache.get(key)
+        if df is None:
+            return None
+        cls._cache.move_to_end(key)
+        # Strategies add columns to the DataFrame they receive, never hand out the cached instance
+        return df.copy()
+
+    @classmethod
+    def add_to_cache(cls, key, df):
+        cls._cache[key] = df.copy()
+        cls._cache.move_to_end(key)
+        while len(cls._cache) > cls.MAX_CACHE_ENTRIES:
+            cls._cache.popitem(last=False)
+
+    @classmethod
+    def clear_cache(cls):
+        cls._cache.clear()
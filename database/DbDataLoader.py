@@ -4,12 +4,16 @@
 import datetime as dt
 import time
 
-import ccxt
 import pandas as pd
 
 import constants
 import utils
 from database.BaseDbData import BaseDbData
+from database.CandleResampler import CandleResampler
+from database.DbSchemaManager import DbSchemaManager
+from exchanges import exchange_utils
+from exchanges.FakeExchange import FakeExchange
+from exchanges.RequestScheduler import RequestScheduler
 from sqlalchemy.engine.reflection import Inspector
 
 
@@ -20,12 +24,20 @@ class DbDataLoader(BaseDbData):
         # Exchange
         self.exchange_name = exchange_name
         exchange_class_name = exchange_name.replace('_Testnet', '').lower()
-        self.exchange = getattr(ccxt, exchange_class_name)()
+        if exchange_utils.is_fake_exchange(exchange_class_name) and exchange_class_name != FakeExchange.id:
+            raise Exception(f'exchange.use_fake_exchange is set, fake candles cannot be loaded '
+                            f'into the [{exchange_name}] database. Use the Fake exchange database.')
+        self.exchange = exchange_utils.create_ccxt_exchange(exchange_class_name)
         if '_Testnet' in exchange_name:
             self.exchange.set_sandbox_mode(True)
         else:
             self.exchange.set_sandbox_mode(False)
-        self.exchange.timeout = 300000  # number in milliseconds, default 10000
+        # Number in milliseconds, default 10000. Requests that time out are retried by the request scheduler
+        self.exchange.timeout = 30000
+        # Shared with the other users of this exchange, exchange.rateLimit is the number of milliseconds between requests
+        self.scheduler = RequestScheduler.get_scheduler(self.exchange.id, 'ohlcv', 1000 / self.exchange.rateLimit)
+        # Creates the partitioned candle tables and their partitions before candles are written, on the same engine
+        self.schema_manager = DbSchemaManager(exchange_name, self.engine)
 
     def validate_interval(self, interval):
         valid_intervals = list(self.exchange.timeframes.keys())
@@ -39,9 +51,12 @@ class DbDataLoader(BaseDbData):
         if market is None:
             raise Exception(f'\nInvalid [{pair}] for exchange {self.exchange_name}.')
 
-    def load_candle_data(self, pair, from_time, interval, verbose=False):
+    def load_candle_data(self, pair, from_time, interval, verbose=False, to_time=None, resume=True):
         """
             from_time: must be a datetime object
+            to_time: optional datetime object, candles opened after to_time are not loaded
+            resume: when the table already holds candles after from_time (Ex: an interrupted load),
+                    start after the last candle stored. Use False to load candles before existing ones.
         """
 
         if self.exchange_name == 'Binance' and pair.endswith('USD'):
@@ -56,44 +71,51 @@ class DbDataLoader(BaseDbData):
         # self.delete_all_pair_interval_data(pair, interval)
 
         table_name = self.get_table_name(pair, interval)
+        self.validate_utc(table_name)
+        partitioned = self.schema_manager.create_candle_table(pair, interval)
         start_time = from_time
-        last_datetime_stamp = start_time.timestamp() * 1000
+        last_datetime_stamp = utils.datetime_to_ms(start_time)
+        if resume and to_time is None:
+            max_timestamp = self.get_max_timestamp(pair, interval)
+            if max_timestamp is not None and max_timestamp >= last_datetime_stamp:
+                last_datetime_stamp = max_timestamp + 1000
+        to_time_stamp = utils.datetime_to_ms(to_time) if to_time else None
 
-        while True:
+        while to_time_stamp is None or last_datetime_stamp <= to_time_stamp:
             if verbose:
                 # from_time_str = from_time.strftime('%Y-%m-%d')
                 # to_time_str = to_time.strftime('%Y-%m-%d')
                 print(f'Loading {pair} data from {self.exchange_name} into the [{table_name}] table.',
-                      f'From[{dt.datetime.fromtimestamp(last_datetime_stamp / 1000)}] => ', end='')
+                      f'From[{utils.ms_to_datetime(last_datetime_stamp)}] => ', end='')
             try:
-                result = self.exchange.fetch_ohlcv(
+                # Temporary errors (timeouts, rate limits) are retried by the scheduler
+                result = self.scheduler.execute(
+                    self.exchange.fetch_ohlcv,
                     symbol=pair,
                     timeframe=interval,
-                    since=int(last_datetime_stamp)
+                    since=last_datetime_stamp
                 )
-                print('done.')
+                if verbose:
+                    print('done.')
             except Exception as e:
-                print('failed.')
-                print(f"load_candle_data(): pair={pair}, from_time={from_time}, interval={interval}.")
-                print(e)
-                return
+                if verbose:
+                    print('failed.')
+                # Candles already written are kept, loading again resumes after the last one
+                raise Exception(f'load_candle_data(): pair={pair}, from_time={from_time}, interval={interval}. '
+                                f'Loading stopped at {utils.ms_to_datetime(last_datetime_stamp)}. {e}') from e
 
-            df = pd.DataFrame(result, columns=['open_time', 'open', 'high', 'low', 'close', 'volume'])
-            if df is None or (len(df.index) == 0):
+            df = utils.ohlcv_to_dataframe(result, timestamp_column='open_time')
+            if to_time_stamp is not None:
+                df = df[df.open_time <= to_time_stamp]
+            if len(df.index) == 0:
                 break
-            df.index = [dt.datetime.fromtimestamp(x / 1000) for x in df.open_time]
-
-            # Set proper data types
-            df['open'] = df['open'].astype(float)
-            df['high'] = df['high'].astype(float)
-            df['low'] = df['low'].astype(float)
-            df['close'] = df['close'].astype(float)
-            df['volume'] = df['volume'].astype(float)
 
             # Write data into the table in PostgreSQL database
+            if partitioned:
+                self.schema_manager.ensure_partitions(pair, interval, min(df.index), max(df.index))
             df.to_sql(table_name, self.engine, index=True, if_exists='append')
             # Add 1s to the last row we received
-            last_datetime_stamp = float(max(df.open_time) + 1000)  # Add (1000ms = 1s) to last data received
+            last_datetime_stamp = int(df.open_time.max()) + 1000  # Add (1000ms = 1s) to last data received
 
         # Make the index column the Primary Key
         # query1 = f'ALTER TABLE IF EXISTS public."{table_name}" DROP CONSTRAINT IF EXISTS "{table_name}_pkey"; '
@@ -103,6 +125,43 @@ class DbDataLoader(BaseDbData):
         # self.exec_sql_query(query2)
 
 
+    def validate_utc(self, table_name):
+        """
+            Candles are indexed in UTC, they cannot be appended to a table still indexed in local time
+        """
+        if self.schema_manager.is_local_time(table_name):
+            raise Exception(f'[{self.db_name}].[{table_name}] is indexed in local time. '
+                            f'Run database/migrate_db_tables.py to shift it to UTC before loading candles.')
+
+    def repair_gaps(self, pair, interval, gaps, verbose=True):
+        """
+            Refetch from the exchange only the candles missing between the boundaries of each gap.
+            gaps: DataFrame returned by DbDataReader.get_gaps()
+            Returns the number of gaps that could not be filled (no data available on the exchange).
+        """
+        unrepaired = 0
+        for gap in gaps.itertuples(index=False):
+            gap_start = gap.gap_start.to_pydatetime() + dt.timedelta(seconds=1)
+            gap_end = gap.gap_end.to_pydatetime() - dt.timedelta(seconds=1)
+            before = self.count_candles(pair, interval, gap_start, gap_end)
+            try:
+                self.load_candle_data(pair, gap_start, interval, verbose=verbose, to_time=gap_end)
+            except Exception as e:
+                # Keep repairing the other gaps, this one is reported as not repaired
+                print(e)
+            if self.count_candles(pair, interval, gap_start, gap_end) == before:
+                unrepaired += 1
+        return unrepaired
+
+    def count_candles(self, pair, interval, from_time, to_time):
+        table_name = self.get_table_name(pair, interval)
+        query = f'SELECT COUNT(*) FROM public."{table_name}" ' \
+                f"WHERE index BETWEEN TIMESTAMP'{from_time.strftime(constants.DATETIME_FMT)}' " \
+                f"AND TIMESTAMP'{to_time.strftime(constants.DATETIME_FMT)}'"
+        for row in self.exec_sql_query(query):
+            return int(row[0])
+        return 0
+
     # delete all data in the database for this pair and this interval
     def delete_all_pair_interval_data(self, pair, interval):
         table_name = self.get_table_name(pair, interval)
@@ -122,27 +181,103 @@ class DbDataLoader(BaseDbData):
                 result = self.exec_sql_query(query)
                 if result.rowcount > 0:
                     for row in result:
-                        return int(row[0])
+                        return int(row[0]) if row[0] is not None else None
             return None
 
-    def load_pair_data_all_timeframes(self, pair):
+    def get_max_index(self, table_name):
+        """
+            Returns the open time (index column) of the last candle stored in this table
+        """
+        if self.inspector.has_table(table_name, schema='public'):
+            query = f'select max(index) from public."{table_name}"'
+            result = self.exec_sql_query(query)
+            for row in result:
+                return row[0]
+        return None
+
+    def materialize_interval(self, pair, interval, chunk_size=500000, verbose=True):
+        """
+            Build (or extend) the table of this interval from the 1m table instead of downloading it
+            from the exchange. The last stored bar is rebuilt since it may have been aggregated
+            from an incomplete set of 1m candles.
+        """
+        source_table = self.get_table_name(pair, '1m')
+        table_name = self.get_table_name(pair, interval)
+        if not self.inspector.has_table(source_table, schema='public'):
+            raise Exception(f'[{self.db_name}].[{source_table}] does not exist. Load the 1m candles first.')
+        self.validate_utc(source_table)
+        self.validate_utc(table_name)
+
+        where = ''
+        last_bar = self.get_max_index(table_name)
+        if last_bar is not None:
+            last_bar_str = last_bar.strftime(constants.DATETIME_FMT)
+            self.exec_sql_query(f'DELETE FROM public."{table_name}" WHERE index >= TIMESTAMP\'{last_bar_str}\'')
+            where = f"WHERE index >= TIMESTAMP'{last_bar_str}'"
+
+        if verbose:
+            print(f'Materializing [{self.db_name}].[{table_name}] from [{source_table}] => ', end='')
+
+        query = f'SELECT index, open_time, open, high, low, close, volume FROM public."{source_table}" ' \
+                f'{where} ORDER BY index ASC'
+        nb_bars = 0
+        carry_over = None
+        for chunk in pd.read_sql(query, self.engine, index_col='index', chunksize=chunk_size):
+            if carry_over is not None:
+                chunk = pd.concat([carry_over, chunk])
+            df = CandleResampler.resample(chunk, interval)
+            if len(df.index) == 0:
+                carry_over = chunk
+                continue
+            # The last bar may continue in the next chunk, keep its 1m candles for the next iteration
+            carry_over = chunk.loc[chunk.index >= df.index[-1]]
+            df = df.iloc[:-1]
+            nb_bars += self.write_materialized_bars(pair, interval, df)
+
+        if carry_over is not None:
+            nb_bars += self.write_materialized_bars(pair, interval, CandleResampler.resample(carry_over, interval))
+
+        if verbose:
+            print(f'{nb_bars} bars written.')
+
+    def write_materialized_bars(self, pair, interval, df):
+        if len(df.index) == 0:
+            return 0
+        df = df.astype({'open_time': 'int64'})
+        if self.schema_manager.create_candle_table(pair, interval):
+            self.schema_manager.ensure_partitions(pair, interval, min(df.index), max(df.index))
+        df.to_sql(self.get_table_name(pair, interval), self.engine, index=True, if_exists='append')
+        return len(df.index)
+
+    def load_pair_data_all_timeframes(self, pair, derive_from_1m=None):
         """
             select max(open_time) from public."Candles_BTCUSDT_1M"
             # self.delete_all_pair_interval_data(pair, interval)
+            derive_from_1m: only download the 1m candles and build all other intervals from them.
+                            Defaults to the database.derive_intervals_from_1m config value.
         """
+        if derive_from_1m is None:
+            derive_from_1m = self.config['database'].get('derive_intervals_from_1m', False)
+
         execution_start = time.time()
-        for interval in reversed(constants.VALID_INTERVALS):
+        intervals = ['1m'] if derive_from_1m else reversed(constants.VALID_INTERVALS)
+        for interval in intervals:
             max_timestamp = self.get_max_timestamp(pair, interval)
             if max_timestamp and isinstance(max_timestamp, int):
-                from_time = dt.datetime.fromtimestamp(max_timestamp/1000) + dt.timedelta(seconds=1)
+                from_time = utils.ms_to_datetime(max_timestamp) + dt.timedelta(seconds=1)
             else:
                 if self.exchange_name == 'Binance' and pair.endswith('USD'):
                     # Cannot fetch more than 200 days. CCXT adds an end_time = today
                     # Binance does not allow more than 200 days between start and end time
-                    from_time = dt.datetime.now() - dt.timedelta(days=200)
+                    from_time = utils.utc_now() - dt.timedelta(days=200)
                 else:
                     from_time = dt.datetime(2015, 1, 1)
             self.load_candle_data(pair, from_time, interval, True)
+
+        if derive_from_1m:
+            for interval in constants.VALID_INTERVALS:
+                if interval != '1m':
+                    self.materialize_interval(pair, interval)
+
         exec_time = utils.format_execution_time(time.time() - execution_start)
         print(f'Load completed. Execution Time: {exec_time}\n')
-
@@ -7,6 +7,7 @@ import pandas as pd
 import constants
 import utils
 from database.BaseDbData import BaseDbData
+from database.CandleResampler import CandleResampler
 
 
 class DbDataReader(BaseDbData):
@@ -14,7 +15,10 @@ class DbDataReader(BaseDbData):
     def __init__(self, exchange_name):
         super().__init__(exchange_name)
 
-    def get_candle_data(self, pair, from_time, to_time, interval, include_prior=0, verbose=True):
+    def get_candle_data(self, pair, from_time, to_time, interval, include_prior=0, verbose=True, columns=None):
+        """
+            columns: subset of the OHLCV columns to read. Ex: ['close']. All columns are read by default.
+        """
         # self.validate_pair(pair)
         # self.validate_interval(interval)
 
@@ -24,22 +28,84 @@ class DbDataReader(BaseDbData):
         else:
             start_time = from_time
 
-        table_name = self.get_table_name(pair, interval)
-        start_time_str = start_time.strftime(constants.DATETIME_FMT)
-        to_time_str = to_time.strftime(constants.DATETIME_FMT)
-        query = f"SELECT index, open, high, low, close, volume FROM public.\"{table_name}\"  " \
-                f"WHERE index BETWEEN TIMESTAMP'{start_time_str}' AND TIMESTAMP'{to_time_str}' ORDER BY index ASC"
+        # Derive higher intervals from the 1m table when configured to, or when this interval is not stored
+        if interval != '1m' and (self.config['database'].get('derive_intervals_from_1m', False) or
+                                 not self.inspector.has_table(self.get_table_name(pair, interval), schema='public')):
+            df = self.get_resampled_candle_data(pair, from_time, start_time, to_time, interval, verbose)
+            return df[columns] if columns else df
 
+        table_name = self.get_table_name(pair, interval)
         if verbose:
             from_time_str = from_time.strftime(constants.DATE_FMT)
             to_time_str = to_time.strftime(constants.DATE_FMT)
             print(f'Fetching {self.db_name}[{pair}] data from database. Interval [{interval}],',
                   f' From[{from_time_str}], To[{to_time_str}]')
-            # print(query)
+
+        return self.read_candle_table(table_name, start_time, to_time, columns)
+
+    def read_candle_table(self, table_name, start_time, to_time, columns=None):
+        columns = columns if columns else ['open', 'high', 'low', 'close', 'volume']
+        start_time_str = start_time.strftime(constants.DATETIME_FMT)
+        to_time_str = to_time.strftime(constants.DATETIME_FMT)
+        query = f"SELECT index, {', '.join(columns)} FROM public.\"{table_name}\"  " \
+                f"WHERE index BETWEEN TIMESTAMP'{start_time_str}' AND TIMESTAMP'{to_time_str}' ORDER BY index ASC"
+        # print(query)
 
         # Load data into the DataFrame using the read_sql() method from pandas
         data_df = pd.read_sql(query, self.engine)
         data_df.set_index(['index'], inplace=True)
         # print(data_df.tail().to_string())
         # exit(0)
-        return data_df
\ No newline at end of file
+        return data_df
+
+    def get_resampled_candle_data(self, pair, from_time, start_time, to_time, interval, verbose=True):
+        """
+            Build the candles for this interval from the 1m table.
+            The 1m range read is extended to the boundaries of the first and last bars
+            so that they are aggregated from complete data.
+        """
+        key = (self.db_name, pair, interval, start_time, to_time)
+        df = CandleResampler.get_cached(key)
+
+        if verbose:
+            from_time_str = from_time.strftime(constants.DATE_FMT)
+            to_time_str = to_time.strftime(constants.DATE_FMT)
+            source = 'resampling cache' if df is not None else 'database 1m candles'
+            print(f'Fetching {self.db_name}[{pair}] data from {source}. Interval [{interval}],',
+                  f' From[{from_time_str}], To[{to_time_str}]')
+
+        if df is None:
+            first_bar_start = CandleResampler.get_bar_start(start_time, interval)
+            last_bar_end = CandleResampler.get_bar_end(to_time, interval)
+            df_1m = self.read_candle_table(self.get_table_name(pair, '1m'), first_bar_start, last_bar_end)
+            df = CandleResampler.resample(df_1m, interval)
+            # Same bounds as a query on a table storing this interval
+            df = df.loc[(df.index >= start_time) & (df.index <= to_time)]
+            CandleResampler.add_to_cache(key, df)
+        return df
+
+    def get_gaps(self, pair, interval, from_time=None, to_time=None):
+        """
+            Find the gaps in the candles of this pair/interval without loading the table.
+            The LEAD() window function pairs each candle with the next one and only
+            the pairs more than one interval apart are returned.
+            Returns a DataFrame with columns:
+                gap_start: last candle before the gap
+                gap_end: first candle after the gap
+                missing: number of missing candles (approximate for monthly candles)
+        """
+        table_name = self.get_table_name(pair, interval)
+        sql_interval = self.get_sql_interval(interval)
+        where = []
+        if from_time is not None:
+            where.append(f"index >= TIMESTAMP'{from_time.strftime(constants.DATETIME_FMT)}'")
+        if to_time is not None:
+            where.append(f"index <= TIMESTAMP'{to_time.strftime(constants.DATETIME_FMT)}'")
+        where = f"WHERE {' AND '.join(where)}" if where else ''
+        query = f"SELECT gap_start, gap_end, " \
+                f"ROUND(EXTRACT(EPOCH FROM gap_end - gap_start) / " \
+                f"EXTRACT(EPOCH FROM INTERVAL '{sql_interval}'))::bigint - 1 AS missing " \
+                f"FROM (SELECT index AS gap_start, LEAD(index) OVER (ORDER BY index) AS gap_end " \
+                f"FROM public.\"{table_name}\" {where}) AS candles " \
+                f"WHERE gap_end > gap_start + INTERVAL '{sql_interval}' ORDER BY gap_start ASC"
+        return pd.read_sql(query, self.engine)
@@ -0,0 +1,146 @@
+"""
+    Class that writes test results (statistics rows, trade summaries, ...) to the database
+    from a background thread. Rows are queued by the backtest loop and written in batches
+    with multi-row INSERT statements, so that running a test never waits on a database round-trip.
+    Queued rows are flushed when the batch is full, after FLUSH_INTERVAL seconds and on shutdown.
+    Columns added to the results since a table was created (Ex: Stop Reason) are added to the table before rows
+    are appended to it. When a batch cannot be written, its rows are written again one test case (one submitted
+    DataFrame) at a time, so that a bad row only loses the rows of its own test case. The rows that could not be
+    written are reported again when the writers are closed.
+"""
+import atexit
+import threading
+import time
+import traceback
+from queue import Queue, Empty
+
+import pandas as pd
+
+from database.DbSchemaManager import DbSchemaManager
+
+class DbResultsWriter:
+    # Number of queued rows that triggers a write
+    BATCH_SIZE = 200
+    # Maximum number of seconds rows stay in the queue
+    FLUSH_INTERVAL = 5
+    # Rows per INSERT statement
+    INSERT_CHUNK_SIZE = 500
+
+    # One writer per database
+    _writers = {}
+    _lock = threading.Lock()
+
+    _CLOSE = object()
+
+    def __init__(self, engine):
+        self.engine = engine
+        # Created by the writer thread on first write
+        self.schema_manager = None
+        # Columns known to exist in each table
+        self.table_columns = {}
+        # Number of rows that could not be written to each table
+        self.failed_rows = {}
+        self.queue = Queue()
+        self.thread = threading.Thread(target=self.run, name=f'DbResultsWriter[{engine.url.database}]', daemon=True)
+        self.thread.start()
+
+    @classmethod
+    def get_writer(cls, engine):
+        key = str(engine.url)
+        with cls._lock:
+            if len(cls._writers) == 0:
+                atexit.register(cls.close_all)
+            if key not in cls._writers:
+                cls._writers[key] = DbResultsWriter(engine)
+            return cls._writers[key]
+
+    @classmethod
+    def close_all(cls):
+        with cls._lock:
+            writers = list(cls._writers.values())
+            cls._writers.clear()
+        for writer in writers:
+            writer.close()
+            for table_name, nb_rows in writer.failed_rows.items():
+                print(f'\nWARNING: {nb_rows} rows could not be written to table [{table_name}] of '
+                      f'[{writer.engine.url.database}], see the errors above.')
+
+    def submit(self, table_name, df):
+        """
+            Queue rows to be appended to table_name. df is written with its index (to_sql index=True).
+        """
+        self.queue.put((table_name, df))
+
+    def flush(self):
+        """
+            Block until all rows queued so far have been written
+        """
+        done = threading.Event()
+        self.queue.put(done)
+        done.wait()
+
+    def close(self):
+        self.queue.put(self._CLOSE)
+        self.thread.join()
+
+    def run(self):
+        pending = {}
+        nb_pending = 0
+        last_flush = time.time()
+        while True:
+            timeout = max(0.0, self.FLUSH_INTERVAL - (time.time() - last_flush))
+            try:
+                item = self.queue.get(timeout=timeout)
+            except Empty:
+                item = None
+
+            if isinstance(item, tuple):
+                table_name, df = item
+                pending.setdefault(table_name, []).append(df)
+                nb_pending += len(df.index)
+
+            if item is self._CLOSE or isinstance(item, threading.Event) or \
+                    nb_pending >= self.BATCH_SIZE or time.time() - last_flush >= self.FLUSH_INTERVAL:
+                self.write_batches(pending)
+                pending = {}
+                nb_pending = 0
+                last_flush = time.time()
+
+            if isinstance(item, threading.Event):
+                item.set()
+            elif item is self._CLOSE:
+                return
+
+    def write_batches(self, pending):
+        for table_name, dfs in pending.items():
+            try:
+                self.write_rows(table_name, pd.concat(dfs))
+            except Exception:
+                if len(dfs) == 1:
+                    self.add_failure(table_name, dfs[0])
+                    continue
+                # The rows of a batch are written in a single transaction, write the rows of each test case apart
+                for df in dfs:
+                    try:
+                        self.write_rows(table_name, df)
+                    except Exception:
+                        self.add_failure(table_name, df)
+
+    def write_rows(self, table_name, df):
+        self.add_missing_columns(table_name, df)
+        df.to_sql(table_name, self.engine, index=True, if_exists='append',
+                  method='multi', chunksize=self.INSERT_CHUNK_SIZE)
+
+    def add_failure(self, table_name, df):
+        # Never let a failed write stop the writer thread. Some tables (Ex: the trades) are only in the database.
+        self.failed_rows[table_name] = self.failed_rows.get(table_name, 0) + len(df.index)
+        print(f'\nUnable to write {len(df.index)} rows to table [{table_name}].')
+        traceback.print_exc()
+
+    def add_missing_columns(self, table_name, df):
+        columns = self.table_columns.get(table_name, set())
+        if not set(df.columns).issubset(columns):
+            if self.schema_manager is None:
+                self.schema_manager = DbSchemaManager(self.engine.url.database, self.engine)
+            self.schema_manager.add_missing_columns(table_name, df.dtypes.to_dict())
+            self.table_columns[table_name] = columns | set(df.columns)
@@ -0,0 +1,241 @@
+"""
+    Class that manages the schema of the candle tables in the PostgreSQL database.
+    Candle tables are partitioned by range on the index (candle open time) column:
+        - monthly partitions for the 1m interval
+        - yearly partitions for all other intervals
+    and have a BRIN index on the index column. Queries on a time range (WHERE index BETWEEN ...)
+    only scan the partitions overlapping that range.
+    Candles are indexed by their open time in UTC. Tables loaded when candles were indexed in local time
+    are shifted to UTC by shift_table_to_utc(), the open_time column holds the open time in ms since the epoch.
+    The tables of the test results (created by DataFrame.to_sql) get the columns added to the results since
+    they were created.
+"""
+import datetime as dt
+
+import pandas as pd
+import sqlalchemy
+
+from database.BaseDbData import BaseDbData
+from stats.ResultStore import ResultStore
+from stats.ResultsAccumulator import ResultsAccumulator
+
+
+class DbSchemaManager(BaseDbData):
+
+    CANDLE_COLUMNS = ['index', 'open_time', 'open', 'high', 'low', 'close', 'volume']
+    STATISTICS_TABLE = 'Test_Results_Statistics'
+    # Open time in UTC of a candle, the value of its index column
+    UTC_INDEX = "(to_timestamp(open_time / 1000.0) AT TIME ZONE 'UTC')"
+
+    def __init__(self, exchange_name, engine=None):
+        super().__init__(exchange_name, engine)
+        # Partitions known to exist, avoids issuing DDL statements for each page of candles loaded
+        self.partitions = set()
+        # Tables known to be indexed in UTC
+        self.utc_tables = set()
+
+    @staticmethod
+    def get_partition_bounds(interval, timestamp):
+        """
+            Returns the [start, end) bounds of the partition containing this timestamp
+        """
+        if interval == '1m':
+            start = dt.datetime(timestamp.year, timestamp.month, 1)
+            end = dt.datetime(start.year + (start.month // 12), start.month % 12 + 1, 1)
+        else:
+            start = dt.datetime(timestamp.year, 1, 1)
+            end = dt.datetime(timestamp.year + 1, 1, 1)
+        return start, end
+
+    @staticmethod
+    def get_partition_name(table_name, interval, start):
+        suffix = start.strftime('%Y_%m') if interval == '1m' else start.strftime('%Y')
+        return f'{table_name}_p{suffix}'
+
+    def exec_ddl(self, *queries):
+        # Execute all statements in a single transaction
+        with self.engine.begin() as connection:
+            for query in queries:
+                connection.execute(sqlalchemy.text(query))
+
+    def is_partitioned(self, table_name):
+        query = f"SELECT COUNT(*) FROM pg_partitioned_table p JOIN pg_class c ON p.partrelid = c.oid " \
+                f"WHERE c.relname = '{table_name}'"
+        with self.engine.connect() as connection:
+            return connection.execute(sqlalchemy.text(query)).scalar() > 0
+
+    def table_exists(self, table_name):
+        query = f"SELECT to_regclass('public.\"{table_name}\"') IS NOT NULL"
+        with self.engine.connect() as connection:
+            return bool(connection.execute(sqlalchemy.text(query)).scalar())
+
+    def get_create_table_queries(self, table_name):
+        return [
+            f'CREATE TABLE IF NOT EXISTS public."{table_name}" ('
+            f'index timestamp without time zone NOT NULL, '
+            f'open_time bigint, '
+            f'open double precision, '
+            f'high double precision, '
+            f'low double precision, '
+            f'close double precision, '
+            f'volume double precision'
+            f') PARTITION BY RANGE (index)',
+            f'CREATE INDEX IF NOT EXISTS "{table_name}_index_brin" ON public."{table_name}" USING brin (index)'
+        ]
+
+    def get_create_partition_query(self, table_name, interval, timestamp):
+        start, end = self.get_partition_bounds(interval, timestamp)
+        partition_name = self.get_partition_name(table_name, interval, start)
+        return partition_name, \
+            f'CREATE TABLE IF NOT EXISTS public."{partition_name}" PARTITION OF public."{table_name}" ' \
+            f"FOR VALUES FROM ('{start.strftime('%Y-%m-%d')}') TO ('{end.strftime('%Y-%m-%d')}')"
+
+    def get_partition_starts(self, interval, from_time, to_time):
+        start, _ = self.get_partition_bounds(interval, from_time)
+        while start <= to_time:
+            yield start
+            _, start = self.get_partition_bounds(interval, start)
+
+    def create_candle_table(self, pair, interval):
+        """
+            Create the partitioned candle table of this pair/interval if it does not exist.
+            Existing non partitioned tables are left as is, use migrate_table() to convert them.
+            Returns True if the table is partitioned.
+        """
+        table_name = self.get_table_name(pair, interval)
+        if self.table_exists(table_name):
+            return self.is_partitioned(table_name)
+        self.exec_ddl(*self.get_create_table_queries(table_name))
+        return True
+
+    def ensure_partitions(self, pair, interval, from_time, to_time):
+        """
+            Create the partitions required to store candles between from_time and to_time
+        """
+        table_name = self.get_table_name(pair, interval)
+        partitions = {}
+        for start in self.get_partition_starts(interval, from_time, to_time):
+            partition_name, query = self.get_create_partition_query(table_name, interval, start)
+            if partition_name not in self.partitions:
+                partitions[partition_name] = query
+        if len(partitions) > 0:
+            self.exec_ddl(*partitions.values())
+            self.partitions.update(partitions.keys())
+
+    def migrate_table(self, pair, interval, verbose=True):
+        """
+            Convert an existing candle table (created by DataFrame.to_sql) into a partitioned table.
+            The data is copied into the new table and the old table dropped in a single transaction.
+        """
+        table_name = self.get_table_name(pair, interval)
+        if not self.table_exists(table_name) or self.is_partitioned(table_name):
+            return
+
+        old_table_name = f'{table_name}_unpartitioned'
+        with self.engine.connect() as connection:
+            min_index, max_index = connection.execute(sqlalchemy.text(
+                f'SELECT MIN(index), MAX(index) FROM public."{table_name}"')).fetchone()
+
+        if verbose:
+            print(f'Migrating [{self.db_name}].[{table_name}] to a partitioned table.')
+
+        columns = ', '.join(self.CANDLE_COLUMNS)
+        queries = [f'ALTER TABLE public."{table_name}" RENAME TO "{old_table_name}"']
+        queries += self.get_create_table_queries(table_name)
+        if min_index is not None:
+            for start in self.get_partition_starts(interval, min_index, max_index):
+                queries.append(self.get_create_partition_query(table_name, interval, start)[1])
+        queries += [
+            f'INSERT INTO public."{table_name}" ({columns}) SELECT {columns} FROM public."{old_table_name}"',
+            f'DROP TABLE public."{old_table_name}"'
+        ]
+        self.exec_ddl(*queries)
+
+    def is_local_time(self, table_name):
+        """
+            Returns True if the candles of this table are indexed in local time. The first candle is checked,
+            candles loaded in local time are the oldest ones.
+        """
+        if table_name in self.utc_tables or not self.table_exists(table_name):
+            return False
+        query = f'SELECT index <> {self.UTC_INDEX} FROM public."{table_name}" ' \
+                f'WHERE open_time = (SELECT MIN(open_time) FROM public."{table_name}") LIMIT 1'
+        with self.engine.connect() as connection:
+            local_time = bool(connection.execute(sqlalchemy.text(query)).scalar())
+        if not local_time:
+            self.utc_tables.add(table_name)
+        return local_time
+
+    def shift_table_to_utc(self, pair, interval, verbose=True):
+        """
+            Set the index of the candles indexed in local time to their open time in UTC, in a single transaction.
+            Candles already indexed in UTC (Ex: appended after the candles were indexed in UTC) are left as is.
+        """
+        table_name = self.get_table_name(pair, interval)
+        if not self.is_local_time(table_name):
+            return
+
+        if verbose:
+            print(f'Shifting the candles of [{self.db_name}].[{table_name}] from local time to UTC.')
+        with self.engine.connect() as connection:
+            min_index, max_index = connection.execute(sqlalchemy.text(
+                f'SELECT MIN({self.UTC_INDEX}), MAX({self.UTC_INDEX}) FROM public."{table_name}"')).fetchone()
+        if self.is_partitioned(table_name):
+            # Candles moved across the bounds of a partition
+            self.ensure_partitions(pair, interval, min_index, max_index)
+        self.exec_ddl(f'UPDATE public."{table_name}" SET index = {self.UTC_INDEX} WHERE index <> {self.UTC_INDEX}')
+        self.utc_tables.add(table_name)
+
+    @staticmethod
+    def get_sql_type(dtype):
+        # Types of the columns of DataFrame.to_sql
+        if pd.api.types.is_bool_dtype(dtype):
+            return 'boolean'
+        if pd.api.types.is_integer_dtype(dtype):
+            return 'bigint'
+        if pd.api.types.is_float_dtype(dtype):
+            return 'double precision'
+        if pd.api.types.is_datetime64_any_dtype(dtype):
+            return 'timestamp without time zone'
+        return 'text'
+
+    def add_missing_columns(self, table_name, columns, verbose=True):
+        """
+            Add to an existing table the columns it does not have. columns: {column name: pandas dtype}.
+            Returns the names of the columns added.
+        """
+        inspector = sqlalchemy.inspect(self.engine)
+        if not inspector.has_table(table_name):
+            return []
+        existing = {c['name'] for c in inspector.get_columns(table_name)}
+        missing = [name for name in columns.keys() if name not in existing]
+        if len(missing) > 0:
+            # Other processes may add the same columns
+            if_not_exists = 'IF NOT EXISTS ' if self.engine.dialect.name == 'postgresql' else ''
+            self.exec_ddl(*[f'ALTER TABLE "{table_name}" ADD COLUMN {if_not_exists}"{name}" '
+                            f'{self.get_sql_type(columns[name])}' for name in missing])
+            if verbose:
+                print(f'Columns {missing} added to [{self.db_name}].[{table_name}].')
+        return missing
+
+    def migrate_results_tables(self, verbose=True):
+        """
+            Add the Statistics columns added since the results table was created (Ex: Stop Reason),
+            and the key column of the result store
+        """
+        columns = dict(ResultsAccumulator.COLUMNS, **{ResultStore.KEY_COLUMN: 'object'})
+        self.add_missing_columns(self.STATISTICS_TABLE, columns, verbose)
+
+    def migrate_all_tables(self, verbose=True):
+        """
+            Migrate all candle tables of the database to partitioned tables indexed in UTC.
+            Table names are: Candles_<pair>_<interval>
+        """
+        for table_name in self.inspector.get_table_names(schema='public'):
+            if not table_name.startswith('Candles_') or table_name.endswith('_unpartitioned'):
+                continue
+            parts = table_name.split('_')
+            if len(parts) != 3:  # Partitions: Candles_<pair>_<interval>_p<period>
+                continue
+            self.migrate_table(parts[1], parts[2], verbose)
+            self.shift_table_to_utc(parts[1], parts[2], verbose)
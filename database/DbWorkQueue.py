@@ -0,0 +1,246 @@
+"""
+    Class that shares the test cases of a run between several worker processes or machines through a queue table
+    (Work_Queue) in a PostgreSQL or SQLite database.
+    The coordinator (main.py --enqueue) inserts one job per test case, then waits for the jobs to be done and
+    collects their Statistics rows. Workers (main.py --queue-worker) claim pending jobs, run them and report their
+    results. Jobs are claimed with SELECT ... FOR UPDATE SKIP LOCKED on PostgreSQL, so that concurrent workers never
+    claim the same job nor wait for each other. On SQLite, the claiming UPDATE statement holds the database write lock.
+    Workers update the heartbeat of their running jobs every heartbeat_interval seconds. The jobs of a worker whose
+    heartbeat is older than stall_timeout seconds (crashed process, lost machine) are queued again, up to
+    max_attempts times, then marked as failed.
+"""
+import json
+import os
+import socket
+import threading
+import time
+import traceback
+
+import numpy as np
+import pandas as pd
+import sqlalchemy
+from sqlalchemy_utils import database_exists, create_database
+
+from Configuration import Configuration
+from database.BaseDbData import BaseDbData
+
+
+class DbWorkQueue:
+    TABLE_NAME = 'Work_Queue'
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    # Params of a test case which are dates, serialized as strings in the jobs
+    DATE_PARAMS = ['From_Time', 'To_Time']
+
+    def __init__(self, db_url, queue_name='default', heartbeat_interval=30, stall_timeout=300, max_attempts=3,
+                 claim_size=4, poll_interval=5):
+        """
+            claim_size: number of jobs claimed at once by a worker, jobs of the same dataset share their candles
+            poll_interval: seconds between two checks of the queue when there is no job to claim
+        """
+        self.queue_name = queue_name
+        self.heartbeat_interval = heartbeat_interval
+        self.stall_timeout = stall_timeout
+        self.max_attempts = max_attempts
+        self.claim_size = claim_size
+        self.poll_interval = poll_interval
+        if db_url.startswith('postgresql') and not database_exists(db_url):
+            create_database(db_url)
+        self.engine = sqlalchemy.create_engine(db_url)
+        self.is_postgresql = self.engine.dialect.name == 'postgresql'
+        self.create_table()
+        # Identifies the jobs claimed by this process
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}'
+        self.heartbeat_stop = None
+
+    @classmethod
+    def from_config(cls, queue_name='default'):
+        config = Configuration.get_config()
+        settings = config['database'].get('work_queue', {})
+        if settings.get('backend', 'postgresql') == 'sqlite':
+            db_url = f"sqlite:///{settings.get('sqlite_path', 'work_queue.db')}"
+        else:
+            db_url = BaseDbData.URL_TEMPLATE.replace('<db_name>', settings.get('db_name', 'Work_Queue'))
+            db_url = db_url.replace('<address>', config['database']['address'])
+            db_url = db_url.replace('<port>', str(config['database']['port']))
+            db_url = db_url.replace('<username>', config['database']['username'])
+            db_url = db_url.replace('<password>', config['database']['password'])
+        return cls(db_url, queue_name,
+                   heartbeat_interval=settings.get('heartbeat_interval', 30),
+                   stall_timeout=settings.get('stall_timeout', 300),
+                   max_attempts=settings.get('max_attempts', 3),
+                   claim_size=settings.get('claim_size', 4),
+                   poll_interval=settings.get('poll_interval', 5))
+
+    def execute(self, query, **params):
+        """
+            Execute query in its own transaction, returns the number of rows affected
+        """
+        with self.engine.begin() as connection:
+            return connection.execute(sqlalchemy.text(query), params).rowcount
+
+    def fetch_all(self, query, **params):
+        """
+            Execute query in its own transaction, returns the rows it returns
+        """
+        with self.engine.begin() as connection:
+            return connection.execute(sqlalchemy.text(query), params).fetchall()
+
+    def create_table(self):
+        id_column = 'id bigserial PRIMARY KEY' if self.is_postgresql else 'id integer PRIMARY KEY AUTOINCREMENT'
+        self.execute(
+            f'CREATE TABLE IF NOT EXISTS "{self.TABLE_NAME}" ('
+            f'{id_column}, '
+            f'queue text NOT NULL, '
+            f'test_num integer, '
+            f'params text NOT NULL, '
+            f'status text NOT NULL, '
+            f'worker text, '
+            f'attempts integer NOT NULL DEFAULT 0, '
+            f'heartbeat double precision, '
+            f'result text, '
+            f'error text)')
+        self.execute(f'CREATE INDEX IF NOT EXISTS "{self.TABLE_NAME}_queue_status" '
+                     f'ON "{self.TABLE_NAME}" (queue, status, id)')
+
+    @staticmethod
+    def to_json(value):
+        def default(x):
+            # numpy numbers (Ex: values read from the test cases file), dates
+            return x.item() if isinstance(x, np.generic) else str(x)
+        return json.dumps(value, default=default)
+
+    @classmethod
+    def params_to_json(cls, params):
+        return cls.to_json({k: v for k, v in params.items() if k not in ['Candle_Data', 'Statistics']})
+
+    @classmethod
+    def params_from_json(cls, text):
+        params = json.loads(text)
+        for name in cls.DATE_PARAMS:
+            params[name] = pd.Timestamp(params[name])
+        return params
+
+    def enqueue(self, params_list):
+        """
+            Replace the jobs of the queue by one pending job per test case, claimed in the order of params_list
+        """
+        with self.engine.begin() as connection:
+            connection.execute(sqlalchemy.text(f'DELETE FROM "{self.TABLE_NAME}" WHERE queue = :queue'),
+                               {'queue': self.queue_name})
+            connection.execute(sqlalchemy.text(
+                f'INSERT INTO "{self.TABLE_NAME}" (queue, test_num, params, status) '
+                f'VALUES (:queue, :test_num, :params, :status)'),
+                [{'queue': self.queue_name, 'test_num': params['Test_Num'], 'params': self.params_to_json(params),
+                  'status': self.PENDING} for params in params_list])
+        print(f'{len(params_list)} test cases queued in [{self.queue_name}].')
+
+    def claim(self, limit=None):
+        """
+            Claim up to limit (claim_size by default) pending jobs for this worker, returns a list of (job id, params)
+        """
+        limit = limit if limit is not None else self.claim_size
+        lock = 'FOR UPDATE SKIP LOCKED' if self.is_postgresql else ''
+        jobs = self.fetch_all(
+            f'UPDATE "{self.TABLE_NAME}" SET status = :running, worker = :worker, attempts = attempts + 1, '
+            f'heartbeat = :now '
+            f'WHERE id IN (SELECT id FROM "{self.TABLE_NAME}" WHERE queue = :queue AND status = :pending '
+            f'ORDER BY id LIMIT :limit {lock}) AND status = :pending '
+            f'RETURNING id, params',
+            running=self.RUNNING, pending=self.PENDING, worker=self.worker_id, now=time.time(),
+            queue=self.queue_name, limit=limit)
+        return [(job_id, self.params_from_json(params)) for job_id, params in sorted(jobs)]
+
+    def complete(self, job_id, row):
+        """
+            Store the Statistics row of a job. Returns False if the job is no longer claimed by this worker
+            (Ex: queued again after a stall and claimed by another worker).
+        """
+        return self.finish(job_id, self.DONE, result=self.to_json(row))
+
+    def fail(self, job_id, error):
+        return self.finish(job_id, self.FAILED, error=error)
+
+    def finish(self, job_id, status, result=None, error=None):
+        return self.execute(
+            f'UPDATE "{self.TABLE_NAME}" SET status = :status, result = :result, error = :error '
+            f'WHERE id = :id AND worker = :worker AND status = :running',
+            status=status, result=result, error=error, id=job_id, worker=self.worker_id, running=self.RUNNING) > 0
+
+    def heartbeat(self):
+        self.execute(f'UPDATE "{self.TABLE_NAME}" SET heartbeat = :now WHERE worker = :worker AND status = :running',
+                     now=time.time(), worker=self.worker_id, running=self.RUNNING)
+
+    def start_heartbeat(self):
+        """
+            Update the heartbeat of the jobs claimed by this worker from a background thread,
+            so that long test cases are not taken for stalled ones
+        """
+        self.heartbeat_stop = threading.Event()
+
+        def run(stop):
+            while not stop.wait(self.heartbeat_interval):
+                try:
+                    self.heartbeat()
+                except Exception:
+                    # The next heartbeat may succeed, a missed one only matters after stall_timeout seconds
+                    traceback.print_exc()
+
+        threading.Thread(target=run, args=(self.heartbeat_stop,), name='DbWorkQueue heartbeat', daemon=True).start()
+
+    def stop_heartbeat(self):
+        if self.heartbeat_stop is not None:
+            self.heartbeat_stop.set()
+            self.heartbeat_stop = None
+
+    def requeue_stalled(self):
+        """
+            Queue again the running jobs whose heartbeat is older than stall_timeout seconds,
+            jobs already claimed max_attempts times are marked as failed. Returns the number of jobs queued again.
+        """
+        params = {'queue': self.queue_name, 'running': self.RUNNING, 'limit': time.time() - self.stall_timeout,
+                  'max_attempts': self.max_attempts}
+        stalled = 'queue = :queue AND status = :running AND heartbeat < :limit'
+        with self.engine.begin() as connection:
+            connection.execute(sqlalchemy.text(
+                f"UPDATE \"{self.TABLE_NAME}\" SET status = :failed, error = 'Stalled ' || attempts || ' times' "
+                f'WHERE {stalled} AND attempts >= :max_attempts'), dict(params, failed=self.FAILED))
+            result = connection.execute(sqlalchemy.text(
+                f'UPDATE "{self.TABLE_NAME}" SET status = :pending, worker = NULL '
+                f'WHERE {stalled} AND attempts < :max_attempts'), dict(params, pending=self.PENDING))
+        if result.rowcount > 0:
+            print(f'{result.rowcount} stalled test cases queued again.')
+        return result.rowcount
+
+    def get_counts(self):
+        """
+            Returns the number of jobs of the queue by status
+        """
+        rows = self.fetch_all(f'SELECT status, COUNT(*) FROM "{self.TABLE_NAME}" WHERE queue = :queue GROUP BY status',
+                              queue=self.queue_name)
+        counts = {status: 0 for status in [self.PENDING, self.RUNNING, self.DONE, self.FAILED]}
+        counts.update({status: count for status, count in rows})
+        return counts
+
+    def is_finished(self, counts=None):
+        counts = counts if counts is not None else self.get_counts()
+        return counts[self.PENDING] == 0 and counts[self.RUNNING] == 0
+
+    def get_results(self):
+        """
+            Returns the Statistics rows of the done jobs, and the (test #, error) of the failed jobs
+        """
+        jobs = self.fetch_all(f'SELECT test_num, status, result, error FROM "{self.TABLE_NAME}" '
+                              f'WHERE queue = :queue AND status IN (:done, :failed) ORDER BY id',
+                              queue=self.queue_name, done=self.DONE, failed=self.FAILED)
+        rows, errors = [], []
+        for test_num, status, row, error in jobs:
+            if status == self.DONE:
+                rows.append(json.loads(row))
+            else:
+                errors.append((test_num, error))
+        return rows, errors
@@ -0,0 +1,266 @@
+"""
+    Class that stores historical candle data in fixed-width binary files opened with numpy.memmap.
+    Each pair/interval is stored in 2 files:
+        <memmap_path>/<exchange>/<pair>/<interval>.<version>.candles  Column blocks: timestamp (int64 ms), open,
+                                                            high, low, close, volume (float64). Each column is
+                                                            contiguous.
+        <memmap_path>/<exchange>/<pair>/<interval>.json     Header: name of the data file, first timestamp,
+                                                            interval length, number of rows and the gap index.
+    A rewrite creates a new data file and then replaces the header, so a header always describes the data file
+    it names.
+    Candle timestamps are regular, so the row of a given time is computed arithmetically from the first timestamp
+    and the interval length, corrected by the number of candles missing before it (gap index).
+    get_candle_data() returns a DataFrame built on slices of the memory mapped columns (no query, no parsing, no copy)
+    and processes reading the same file share the OS page cache.
+"""
+import bisect
+import datetime as dt
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import constants
+import utils
+from Configuration import Configuration
+from database.CandleResampler import CandleResampler
+
+
+class MemmapDataStore:
+    FORMAT_VERSION = 2
+    # Number of times the header is read again when its data file has just been replaced by a rewrite
+    OPEN_RETRIES = 3
+    COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+
+    # Memory mapped columns opened by this process, keyed by file name
+    _open_files = {}
+
+    def __init__(self, exchange_name):
+        self.config = Configuration.get_config()
+        self.db_name = exchange_name.capitalize().replace('_testnet', '_Testnet')
+        self.root_path = self.config['database'].get('memmap_path',
+                                                     os.path.join(self.config['output']['historical_files_path'],
+                                                                  'memmap'))
+
+    def get_filename_no_ext(self, pair, interval):
+        return os.path.join(self.root_path, self.db_name, pair.replace('/', ''), interval)
+
+    def has_data(self, pair, interval):
+        return os.path.exists(self.get_filename_no_ext(pair, interval) + '.json')
+
+    @staticmethod
+    def get_step_ms(interval):
+        _, unit = utils.parse_interval(interval)
+        if unit == 'M':
+            raise Exception(f'Interval [{interval}] does not have a fixed length and cannot be memory mapped.')
+        return utils.convert_interval_to_min(interval) * 60 * 1000
+
+    def read_header(self, filename):
+        with open(filename + '.json') as f:
+            header = json.load(f)
+        # Files written before the versioned data files
+        header.setdefault('data_file', os.path.basename(filename) + '.candles')
+        return header
+
+    def open_file(self, pair, interval):
+        """
+            Returns the header and the memory mapped columns of this pair/interval.
+            Files are only mapped once per process and remapped if they have been rewritten: the mapping is kept
+            for the data file named by the header.
+        """
+        filename = self.get_filename_no_ext(pair, interval)
+        for attempt in range(self.OPEN_RETRIES):
+            header = self.read_header(filename)
+            opened = self._open_files.get(filename)
+            if opened is not None and opened['header']['data_file'] == header['data_file']:
+                return opened['header'], opened['columns']
+            try:
+                columns = self.map_columns(os.path.join(os.path.dirname(filename), header['data_file']),
+                                           header['rows'])
+            except FileNotFoundError:
+                # Removed by a rewrite after the header was read, the new header names the new data file
+                if attempt == self.OPEN_RETRIES - 1:
+                    raise
+                continue
+            self._open_files[filename] = {'header': header, 'columns': columns}
+            return header, columns
+
+    def map_columns(self, data_file, rows):
+        if rows == 0:
+            columns = {'timestamp': np.empty(0, dtype=np.int64)}
+            columns.update({col: np.empty(0, dtype=np.float64) for col in self.COLUMNS})
+            return columns
+        columns = {'timestamp': np.memmap(data_file, dtype=np.int64, mode='r', offset=0, shape=(rows,))}
+        for i, col in enumerate(self.COLUMNS, 1):
+            columns[col] = np.memmap(data_file, dtype=np.float64, mode='r', offset=i * rows * 8, shape=(rows,))
+        return columns
+
+    @staticmethod
+    def get_row(header, slot):
+        """
+            Returns the first row with a slot >= slot. Slot = number of intervals since the first timestamp.
+            The gap index stores, for each gap, the slot of the first candle after it and the number of candles
+            missing before that slot.
+        """
+        if slot <= 0:
+            return 0
+        gap_slots = header['gap_slots']
+        gap_missing = header['gap_missing']
+        j = bisect.bisect_right(gap_slots, slot) - 1
+        missing = gap_missing[j] if j >= 0 else 0
+        row = slot - missing
+        # slot falls within the next gap, the first row after it is the first row of the next segment
+        if j + 1 < len(gap_slots):
+            row = min(row, gap_slots[j + 1] - gap_missing[j + 1])
+        return min(row, header['rows'])
+
+    def get_row_range(self, header, start_time, to_time):
+        """
+            Returns [first_row, last_row) of the candles with start_time <= timestamp <= to_time
+        """
+        step = header['step']
+        start_ms = utils.datetime_to_ms(start_time) - header['start']
+        to_ms = utils.datetime_to_ms(to_time) - header['start']
+        first_row = self.get_row(header, -(-start_ms // step))  # ceil
+        last_row = self.get_row(header, to_ms // step + 1)
+        return first_row, max(first_row, last_row)
+
+    def get_candle_arrays(self, pair, from_time, to_time, interval):
+        """
+            Returns a dictionary of numpy arrays (views on the memory mapped file) for the candles in the time range
+        """
+        header, columns = self.open_file(pair, interval)
+        first_row, last_row = self.get_row_range(header, from_time, to_time)
+        return {k: v[first_row:last_row] for k, v in columns.items()}
+
+    def get_candle_data(self, pair, from_time, to_time, interval, include_prior=0, verbose=True, columns=None):
+        """
+            columns: subset of the OHLCV columns to return. Ex: ['close']. All columns are returned by default.
+        """
+        # Adjust from_time for example to add 200 additional prior entries for example ema200
+        if include_prior > 0:
+            start_time = utils.adjust_from_time(from_time, interval, include_prior)
+        else:
+            start_time = from_time
+
+        # Derive higher intervals from the 1m file when configured to, or when this interval is not stored
+        if interval != '1m' and (self.config['database'].get('derive_intervals_from_1m', False) or
+                                 not self.has_data(pair, interval)):
+            df = self.get_resampled_candle_data(pair, from_time, start_time, to_time, interval, verbose)
+            return df[columns] if columns else df
+
+        if verbose:
+            from_time_str = from_time.strftime(constants.DATE_FMT)
+            to_time_str = to_time.strftime(constants.DATE_FMT)
+            print(f'Fetching {self.db_name}[{pair}] data from memory mapped file. Interval [{interval}],',
+                  f' From[{from_time_str}], To[{to_time_str}]')
+
+        return self.read_range(pair, interval, start_time, to_time, columns)
+
+    def read_range(self, pair, interval, start_time, to_time, columns=None):
+        columns = columns if columns else self.COLUMNS
+        arrays = self.get_candle_arrays(pair, start_time, to_time, interval)
+        index = pd.DatetimeIndex(arrays['timestamp'].view('datetime64[ms]'), name='index')
+        # copy=False keeps each column as a view on the memory mapped file
+        return pd.DataFrame({col: arrays[col] for col in columns}, index=index, copy=False)
+
+    def get_resampled_candle_data(self, pair, from_time, start_time, to_time, interval, verbose=True):
+        key = ('memmap', self.db_name, pair, interval, start_time, to_time)
+        df = CandleResampler.get_cached(key)
+
+        if verbose:
+            from_time_str = from_time.strftime(constants.DATE_FMT)
+            to_time_str = to_time.strftime(constants.DATE_FMT)
+            source = 'resampling cache' if df is not None else 'memory mapped 1m candles'
+            print(f'Fetching {self.db_name}[{pair}] data from {source}. Interval [{interval}],',
+                  f' From[{from_time_str}], To[{to_time_str}]')
+
+        if df is None:
+            first_bar_start = CandleResampler.get_bar_start(start_time, interval)
+            last_bar_end = CandleResampler.get_bar_end(to_time, interval)
+            df_1m = self.read_range(pair, '1m', first_bar_start, last_bar_end)
+            df = CandleResampler.resample(df_1m, interval)
+            df = df.loc[(df.index >= start_time) & (df.index <= to_time)]
+            CandleResampler.add_to_cache(key, df)
+        return df
+
+    def write_candle_data(self, pair, interval, df):
+        """
+            Write candles to the memory mapped file of this pair/interval, merging them with the candles
+            already stored. The candles are written to a new data file, then the header is atomically replaced to
+            name it: processes reading the header get either the old or the new data file, never a mix of both.
+            Processes which mapped the previous data file keep their mapping after it is removed.
+        """
+        if df is None or len(df.index) == 0:
+            return
+        step = self.get_step_ms(interval)
+        df = df.loc[:, self.COLUMNS].astype(float)
+        df.index = pd.DatetimeIndex(df.index, name='index')
+
+        previous_data_file = None
+        if self.has_data(pair, interval):
+            header, columns = self.open_file(pair, interval)
+            previous_data_file = header['data_file']
+            stored_df = pd.DataFrame({col: np.array(columns[col]) for col in self.COLUMNS},
+                                     index=pd.DatetimeIndex(np.array(columns['timestamp']).view('datetime64[ms]'),
+                                                            name='index'))
+            df = pd.concat([stored_df, df])
+            df = df[~df.index.duplicated(keep='last')]
+        df = df.sort_index()
+
+        timestamps = df.index.values.astype('datetime64[ms]').astype(np.int64)
+        start = int(timestamps[0])
+        if np.any((timestamps - start) % step != 0):
+            raise Exception(f'Candle timestamps are not aligned on the [{interval}] interval.')
+
+        # Gap index: slot of the first candle after each gap and number of missing candles before it
+        slots = (timestamps - start) // step
+        gap_positions = np.nonzero(np.diff(slots) > 1)[0] + 1
+        gap_slots = slots[gap_positions]
+        gap_missing = gap_slots - gap_positions
+
+        filename = self.get_filename_no_ext(pair, interval)
+        data_file = f'{os.path.basename(filename)}.{time.time_ns()}.candles'
+        header = {
+            'version': self.FORMAT_VERSION,
+            'data_file': data_file,
+            'interval': interval,
+            'start': start,
+            'step': step,
+            'rows': len(timestamps),
+            'gap_slots': [int(x) for x in gap_slots],
+            'gap_missing': [int(x) for x in gap_missing]
+        }
+
+        folder = os.path.dirname(filename)
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, data_file), 'wb') as f:
+            f.write(timestamps.tobytes())
+            for col in self.COLUMNS:
+                f.write(df[col].to_numpy(dtype=np.float64).tobytes())
+        header_tmp = f'{filename}.{os.getpid()}.json.tmp'
+        with open(header_tmp, 'w') as f:
+            json.dump(header, f)
+        os.replace(header_tmp, filename + '.json')
+
+        if previous_data_file is not None and previous_data_file != data_file:
+            try:
+                os.remove(os.path.join(folder, previous_data_file))
+            except OSError:
+                # Already removed by another writer, or still mapped by a reader on Windows
+                pass
+
+    def import_from_reader(self, reader, pair, interval, from_time=None, to_time=None, verbose=True):
+        """
+            Build the memory mapped file from another candle data reader (DbDataReader or ParquetDataStore)
+        """
+        from_time = from_time if from_time else dt.datetime(2000, 1, 1)
+        to_time = to_time if to_time else utils.utc_now()
+        if verbose:
+            print(f'Copying {reader.db_name}[{pair}][{interval}] to memory mapped file => ', end='')
+        df = reader.get_candle_data(pair, from_time, to_time, interval, verbose=False)
+        self.write_candle_data(pair, interval, df)
+        if verbose:
+            print(f'{len(df.index)} rows copied.')
@@ -0,0 +1,171 @@
+"""
+    Class that stores historical candle data as Parquet files instead of the PostgreSQL database.
+    Files are partitioned by exchange/pair/interval/month:
+        <parquet_path>/<exchange>/<pair>/<interval>/<YYYY-MM>.parquet
+    Reads only open the monthly files overlapping the requested time range, push the time range
+    predicate down to the Parquet row groups and only read the requested columns.
+    It exposes the same get_candle_data() interface as DbDataReader.
+"""
+import datetime as dt
+import glob
+import os
+
+import pandas as pd
+import pyarrow.dataset as ds
+
+import constants
+import utils
+from Configuration import Configuration
+from database.CandleResampler import CandleResampler
+
+
+class ParquetDataStore:
+    CANDLE_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+
+    def __init__(self, exchange_name):
+        self.config = Configuration.get_config()
+        self.db_name = exchange_name.capitalize().replace('_testnet', '_Testnet')
+        self.root_path = self.config['database'].get('parquet_path',
+                                                     os.path.join(self.config['output']['historical_files_path'],
+                                                                  'parquet'))
+
+    def get_partition_path(self, pair, interval):
+        return os.path.join(self.root_path, self.db_name, pair.replace('/', ''), interval)
+
+    def get_partition_files(self, pair, interval, start_time=None, to_time=None):
+        """
+            Returns the monthly files of this pair/interval overlapping [start_time, to_time]
+        """
+        files = sorted(glob.glob(os.path.join(self.get_partition_path(pair, interval), '*.parquet')))
+        if start_time is not None:
+            start_month = start_time.strftime('%Y-%m')
+            files = [f for f in files if os.path.basename(f)[:7] >= start_month]
+        if to_time is not None:
+            to_month = to_time.strftime('%Y-%m')
+            files = [f for f in files if os.path.basename(f)[:7] <= to_month]
+        return files
+
+    def has_data(self, pair, interval):
+        return len(self.get_partition_files(pair, interval)) > 0
+
+    def get_candle_data(self, pair, from_time, to_time, interval, include_prior=0, verbose=True, columns=None):
+        """
+            columns: subset of the OHLCV columns to read. Ex: ['close']. All columns are read by default.
+        """
+        # Adjust from_time for example to add 200 additional prior entries for example ema200
+        if include_prior > 0:
+            start_time = utils.adjust_from_time(from_time, interval, include_prior)
+        else:
+            start_time = from_time
+
+        # Derive higher intervals from the 1m files when configured to, or when this interval is not stored
+        if interval != '1m' and (self.config['database'].get('derive_intervals_from_1m', False) or
+                                 not self.has_data(pair, interval)):
+            df = self.get_resampled_candle_data(pair, from_time, start_time, to_time, interval, verbose)
+            return df[columns] if columns else df
+
+        if verbose:
+            from_time_str = from_time.strftime(constants.DATE_FMT)
+            to_time_str = to_time.strftime(constants.DATE_FMT)
+            print(f'Fetching {self.db_name}[{pair}] data from parquet files. Interval [{interval}],',
+                  f' From[{from_time_str}], To[{to_time_str}]')
+
+        return self.read_partitions(pair, interval, start_time, to_time, columns)
+
+    def read_partitions(self, pair, interval, start_time, to_time, columns=None):
+        columns = columns if columns else self.CANDLE_COLUMNS
+        files = self.get_partition_files(pair, interval, start_time, to_time)
+        if len(files) == 0:
+            df = pd.DataFrame(columns=columns, dtype=float)
+            df.index = pd.DatetimeIndex([], name='index')
+            return df
+
+        dataset = ds.dataset(files, format='parquet')
+        table = dataset.to_table(
+            columns=['index'] + list(columns),
+            filter=(ds.field('index') >= pd.Timestamp(start_time)) & (ds.field('index') <= pd.Timestamp(to_time))
+        )
+        df = table.to_pandas()
+        if 'index' in df.columns:
+            df.set_index('index', inplace=True)
+        df.sort_index(inplace=True)
+        return df
+
+    def get_resampled_candle_data(self, pair, from_time, start_time, to_time, interval, verbose=True):
+        key = ('parquet', self.db_name, pair, interval, start_time, to_time)
+        df = CandleResampler.get_cached(key)
+
+        if verbose:
+            from_time_str = from_time.strftime(constants.DATE_FMT)
+            to_time_str = to_time.strftime(constants.DATE_FMT)
+            source = 'resampling cache' if df is not None else 'parquet 1m candles'
+            print(f'Fetching {self.db_name}[{pair}] data from {source}. Interval [{interval}],',
+                  f' From[{from_time_str}], To[{to_time_str}]')
+
+        if df is None:
+            first_bar_start = CandleResampler.get_bar_start(start_time, interval)
+            last_bar_end = CandleResampler.get_bar_end(to_time, interval)
+            df_1m = self.read_partitions(pair, '1m', first_bar_start, last_bar_end)
+            df = CandleResampler.resample(df_1m, interval)
+            df = df.loc[(df.index >= start_time) & (df.index <= to_time)]
+            CandleResampler.add_to_cache(key, df)
+        return df
+
+    def get_max_index(self, pair, interval):
+        """
+            Returns the open time of the last candle stored for this pair and interval
+        """
+        files = self.get_partition_files(pair, interval)
+        if len(files) == 0:
+            return None
+        df = pd.read_parquet(files[-1], columns=['close'])
+        return df.index.max().to_pydatetime() if len(df.index) > 0 else None
+
+    def write_candle_data(self, pair, interval, df):
+        """
+            Write candles into the monthly files of this pair/interval.
+            Rows already stored for the same timestamps are replaced.
+        """
+        if df is None or len(df.index) == 0:
+            return
+        df = df.loc[:, [c for c in self.CANDLE_COLUMNS if c in df.columns]].astype(float)
+        df.index = pd.DatetimeIndex(df.index, name='index')
+
+        path = self.get_partition_path(pair, interval)
+        os.makedirs(path, exist_ok=True)
+        for month, month_df in df.groupby(df.index.strftime('%Y-%m')):
+            filename = os.path.join(path, f'{month}.parquet')
+            if os.path.exists(filename):
+                month_df = pd.concat([pd.read_parquet(filename), month_df])
+                month_df = month_df[~month_df.index.duplicated(keep='last')]
+            month_df.sort_index().to_parquet(filename, index=True)
+
+    def import_from_db(self, pair, interval, from_time=None, to_time=None, verbose=True):
+        """
+            Copy candles stored in the PostgreSQL database into parquet files.
+            Only the candles after the last one already stored are copied by default.
+        """
+        from database.DbDataReader import DbDataReader
+        db_reader = DbDataReader(self.db_name)
+        if from_time is None:
+            max_index = self.get_max_index(pair, interval)
+            from_time = max_index + dt.timedelta(seconds=1) if max_index else dt.datetime(2000, 1, 1)
+        if to_time is None:
+            to_time = utils.utc_now()
+
+        table_name = db_reader.get_table_name(pair, interval)
+        if verbose:
+            print(f'Copying [{self.db_name}].[{table_name}] to parquet files => ', end='')
+        df = db_reader.read_candle_table(table_name, from_time, to_time)
+        self.write_candle_data(pair, interval, df)
+        if verbose:
+            print(f'{len(df.index)} rows copied.')
+
+    def load_from_exchange(self, pair, from_time, to_time, interval, verbose=True):
+        """
+            Download candles directly from the exchange into parquet files (no database server required)
+        """
+        from exchanges.ExchangeCCXT import ExchangeCCXT
+        exchange = ExchangeCCXT.get_instance(self.db_name.replace('_Testnet', '').lower(), pair)
+        df = exchange.get_candle_data(pair, from_time, to_time, interval, write_to_file=False, verbose=verbose)
+        self.write_candle_data(pair, interval, df)
@@ -0,0 +1,96 @@
+"""
+    Load test of the candle loaders against the local fake exchange (no network required).
+    The fake exchange injects latency, rate limit errors, random timeouts and a gap, the loaded candles
+    must be exactly the candles served by the exchange: no duplicates, no missing candles outside of the gap.
+    Run as a script to also print the times. Set LOAD_INTO_DB = True to also load the PostgreSQL database of
+    the Fake exchange (server required).
+"""
+import contextlib
+import copy
+import datetime as dt
+import tempfile
+import time
+
+from Configuration import Configuration
+from database.ParquetDataStore import ParquetDataStore
+from exchanges.ExchangeCCXT import ExchangeCCXT
+
+LOAD_INTO_DB = False
+
+PAIR = 'BTCUSDT'
+INTERVAL = '1m'
+FROM_TIME = dt.datetime(2022, 1, 1)
+TO_TIME = dt.datetime(2022, 2, 1)
+GAP = (dt.datetime(2022, 1, 10), dt.datetime(2022, 1, 10, 5, 59))
+EXPECTED_ROWS = int((TO_TIME - FROM_TIME).total_seconds() // 60) + 1 - 360
+
+
+@contextlib.contextmanager
+def fake_exchange_config():
+    """
+        Settings of the fake exchange and of the parquet files used by the checks,
+        the config is restored when they are done
+    """
+    config = Configuration.get_config()
+    saved = copy.deepcopy({section: config[section] for section in ['exchange', 'database']})
+    config['exchange']['fake'] = {
+        'latency': 0.1,
+        'ohlcv_page_limit': 1000,
+        'rate_limit': 50,
+        'max_requests_per_second': 25,
+        'error_rate': 0.05,
+        'gaps': [[str(GAP[0]), str(GAP[1])]],
+        'seed': 1
+    }
+    config['database']['parquet_path'] = tempfile.mkdtemp()
+    try:
+        yield config
+    finally:
+        config.update(saved)
+
+
+def test_exchange_loader(workers_list=(1, 4, 16)):
+    with fake_exchange_config():
+        for workers in workers_list:
+            exchange = ExchangeCCXT('Fake', PAIR)
+            exchange.download_workers = workers
+            start = time.time()
+            df = exchange.get_candle_data(PAIR, FROM_TIME, TO_TIME, INTERVAL, write_to_file=False)
+            elapsed = time.time() - start
+            print(f'ExchangeCCXT  Workers={workers:<3} Rows={len(df.index)} '
+                  f'Requests={exchange.exchange.requests_count} Errors={exchange.exchange.errors_count} '
+                  f'Time={elapsed:.2f}s Rows/s={len(df.index) / elapsed:,.0f}')
+            assert len(df.index) == EXPECTED_ROWS, f'Expected {EXPECTED_ROWS} rows, got {len(df.index)}'
+            assert df.index.is_unique and df.index.is_monotonic_increasing
+            assert len(df.loc[GAP[0]:GAP[1]].index) == 0
+
+
+def test_parquet_loader():
+    with fake_exchange_config():
+        store = ParquetDataStore('Fake')
+        start = time.time()
+        store.load_from_exchange(PAIR, FROM_TIME, TO_TIME, INTERVAL, verbose=False)
+        elapsed = time.time() - start
+        df = store.get_candle_data(PAIR, FROM_TIME, TO_TIME, INTERVAL, verbose=False)
+        print(f'ParquetDataStore Rows={len(df.index)} Time={elapsed:.2f}s')
+        assert len(df.index) == EXPECTED_ROWS
+
+
+def check_db_loader():
+    from database.DbDataLoader import DbDataLoader
+    from database.DbDataReader import DbDataReader
+    with fake_exchange_config():
+        loader = DbDataLoader('Fake')
+        start = time.time()
+        loader.load_candle_data(PAIR, FROM_TIME, INTERVAL, verbose=False, to_time=TO_TIME, resume=False)
+        print(f'DbDataLoader Time={time.time() - start:.2f}s')
+        gaps = DbDataReader('Fake').get_gaps(PAIR, INTERVAL, FROM_TIME, TO_TIME)
+        assert len(gaps.index) == 1, gaps.to_string()
+
+
+if __name__ == '__main__':
+    test_exchange_loader()
+    test_parquet_loader()
+    if LOAD_INTO_DB:
+        check_db_loader()
+    print('OK')
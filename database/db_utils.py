@@ -0,0 +1,41 @@
+"""
+    Helper functions shared by the historical data storage backends
+"""
+import threading
+
+from Configuration import Configuration
+
+# Readers are shared by all the strategies run by a process, so that each process opens
+# a single database engine (connection pool) per exchange
+_readers = {}
+# Readers are also requested by the thread prefetching the candles of the next test cases (main.py --prefetch)
+_readers_lock = threading.Lock()
+
+
+def get_candle_data_reader(exchange_name):
+    """
+        Returns the reader of historical candle data for the backend selected by database.backend
+        in the config file. All readers expose the same get_candle_data() method.
+        The reader is created on first use and reused by the next calls for the same exchange.
+    """
+    config = Configuration.get_config()
+    backend = config['database'].get('backend', 'postgresql')
+    key = (backend, exchange_name.lower())
+    with _readers_lock:
+        if key not in _readers:
+            _readers[key] = create_candle_data_reader(backend, exchange_name)
+        return _readers[key]
+
+
+def create_candle_data_reader(backend, exchange_name):
+    if backend == 'parquet':
+        from database.ParquetDataStore import ParquetDataStore
+        return ParquetDataStore(exchange_name)
+    elif backend == 'memmap':
+        from database.MemmapDataStore import MemmapDataStore
+        return MemmapDataStore(exchange_name)
+    elif backend == 'postgresql':
+        from database.DbDataReader import DbDataReader
+        return DbDataReader(exchange_name)
+    else:
+        raise Exception(f'Unsupported database backend: [{backend}].')
@@ -26,13 +26,40 @@ from database.DbDataLoader import DbDataLoader
 # loader.load_pair_data_all_timeframes(pair)
 
 
-# Example 3: Load all pairs, for all exchanges
+# Example 3: load 1m pair data only and derive all other timeframes from it
+# pair = 'BTCUSDT'
+# loader = DbDataLoader('Bybit')
+# loader.load_pair_data_all_timeframes(pair, derive_from_1m=True)
+
+
+# Example 4: copy pair data from the database into parquet files (database.backend = parquet)
+# from database.ParquetDataStore import ParquetDataStore
+# store = ParquetDataStore('Bybit')
+# for interval in constants.VALID_INTERVALS:
+#     store.import_from_db('BTCUSDT', interval)
+
+
+# Example 5: build the memory mapped 1m file of a pair from the database (database.backend = memmap)
+# from database.DbDataReader import DbDataReader
+# from database.MemmapDataStore import MemmapDataStore
+# MemmapDataStore('Bybit').import_from_reader(DbDataReader('Bybit'), 'BTCUSDT', '1m')
+
+
+# Example 6: Load all pairs, for all exchanges
+# A pair that cannot be loaded is reported and skipped, loading it again resumes after its last candle
 exchanges = ['Binance', 'Bybit']
 pairs = ['BTCUSDT', 'ETHUSDT']
+failed = []
 for exchange in exchanges:
     for pair in pairs:
-        loader = DbDataLoader(exchange)
-        loader.load_pair_data_all_timeframes(pair)
+        try:
+            loader = DbDataLoader(exchange)
+            loader.load_pair_data_all_timeframes(pair)
+        except Exception as e:
+            print(f'\nUnable to load {pair} from {exchange}: {e}')
+            failed.append(f'{exchange} {pair}')
+if len(failed) > 0:
+    print(f'\nNot loaded (run again to resume): {", ".join(failed)}')
 
 
 
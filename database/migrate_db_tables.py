@@ -0,0 +1,23 @@
+"""
+    Code used to convert the candle tables of the PostgreSQL database into tables
+    partitioned by time (monthly for 1m, yearly for higher intervals) with a BRIN index,
+    and to shift the candles loaded when they were indexed in local time to UTC.
+    The results tables get the columns added to the results since they were created.
+    New tables created by the DbDataLoader are partitioned and indexed in UTC,
+    this is only required for existing tables.
+"""
+
+import time
+
+import utils
+from database.DbSchemaManager import DbSchemaManager
+
+exchanges = ['Binance', 'Bybit']
+
+execution_start = time.time()
+for exchange in exchanges:
+    schema_manager = DbSchemaManager(exchange)
+    schema_manager.migrate_all_tables()
+    schema_manager.migrate_results_tables()
+exec_time = utils.format_execution_time(time.time() - execution_start)
+print(f'Migration completed. Execution Time: {exec_time}\n')
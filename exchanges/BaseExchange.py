@@ -4,11 +4,9 @@
 """
 import math
 from abc import ABC, abstractmethod
-from os.path import exists
 
-import constants
-import utils
 from Configuration import Configuration
+from exchanges.CandleFileCache import CandleFileCache
 
 
 class BaseExchange(ABC):
@@ -39,50 +37,25 @@ class BaseExchange(ABC):
     def get_taker_fee(self, pair):
         pass
 
-    def get_exchange_data_filename_no_ext(self, pair, from_time, to_time, interval, prior=0, include_time=False):
-        if include_time:
-            from_str = from_time.strftime('%Y-%m-%d %H.%M')
-            to_str = to_time.strftime('%Y-%m-%d %H.%M')
-        else:
-            from_str = from_time.strftime('%Y-%m-%d')
-            to_str = to_time.strftime('%Y-%m-%d')
-        filename = f"{self.config['output']['historical_files_path']}\\{self.NAME} {pair} [{interval}] {from_str} to {to_str}"
-        if prior > 0:
-            filename += " [-{prior}] "
-        return filename
-
-    def save_candle_data(self, pair, from_time, to_time, interval, df, prior=0, include_time=False, verbose=True):
-
-        filename = self.get_exchange_data_filename_no_ext(pair, from_time, to_time, interval, prior, include_time)
-
-        if 'csv' in self.config['output']['output_file_format']:
-            filename = filename + '.csv'
-            df.to_csv(filename, index=True, header=True)
-            if verbose:
-                print(f'File created => [{filename}]')
-        if 'xlsx' in self.config['output']['output_file_format']:
-            filename = filename + '.xlsx'
-            df.to_excel(filename, index=True, header=True)
-            # to_excel_formatted(df, filename)
-            if verbose:
-                print(f'File created => [{filename}]')
-
-    # returns dataframe if file already exists locally and None otherwise
-    def get_cached_exchange_data(self, pair, from_time, to_time, interval, prior=0, include_time=False):
-        filename = self.get_exchange_data_filename_no_ext(pair, from_time, to_time, interval, prior, include_time)
+    # Download the candles opened between start_time and to_time (include_prior already applied)
+    @abstractmethod
+    def fetch_candle_data(self, pair, start_time, to_time, interval, verbose=False):
+        pass
 
-        if 'csv' in self.config['output']['output_file_format']:
-            filename += '.csv'
-            if exists(filename):
-                df = utils.read_csv_to_dataframe(filename)
-                # print(df.head().to_string())
-                return df
-        elif 'xlsx' in self.config['output']['output_file_format']:
-            filename += '.xlsx'
-            if exists(filename):
-                return utils.read_excel_to_dataframe(filename)
-        else:
-            return None
+    def get_cached_candle_data(self, pair, start_time, to_time, interval, write_to_file=True, verbose=False):
+        """
+            Returns the candles between start_time and to_time, using the locally cached data.
+            Only the ranges missing from the cache are downloaded with fetch_candle_data().
+        """
+        if not write_to_file:
+            return self.fetch_candle_data(pair, start_time, to_time, interval, verbose)
+
+        cache = CandleFileCache(self.NAME, pair, interval)
+        if verbose and len(cache.get_missing_ranges(start_time, to_time)) == 0:
+            print(f'Using locally cached data for {pair} from {self.NAME}.',
+                  f'Interval [{interval}], From[{start_time}], To[{to_time}]')
+        return cache.get_candle_data(start_time, to_time,
+                                     lambda start, end: self.fetch_candle_data(pair, start, end, interval, verbose))
 
     def validate_interval(self, interval):
         valid_intervals = list(self.interval_map.keys())
@@ -1,14 +1,12 @@
 import time
 
-import pandas as pd
-import datetime as dt
-
 from requests import ReadTimeout
 from urllib3.exceptions import ReadTimeoutError
 
 import api_keys
 import utils
 from exchanges.BaseExchange import BaseExchange
+from exchanges.RequestScheduler import RequestScheduler
 from binance.client import Client
 from binance.enums import HistoricalKlinesType
 
@@ -19,6 +17,8 @@ from binance.enums import HistoricalKlinesType
 class Binance(BaseExchange):
     NAME = 'Binance'
 
+    REQUESTS_PER_SECOND = 5
+
     # Dictionary of pairs used by exchange to define intervals for candle data
     # Binance valid intervals - 1m, 3m, 5m, 15m, 30m, 1h, 2h, 4h, 6h, 8h, 12h, 1d, 3d, 1w, 1M
     interval_map = {
@@ -42,6 +42,7 @@ class Binance(BaseExchange):
         self.my_api_key = api_keys.BINANCE_API_KEY
         self.my_api_secret = api_keys.BINANCE_API_SECRET_KEY
         self.client = Client(api_keys.BINANCE_API_KEY, api_keys.BINANCE_API_SECRET_KEY)
+        self.scheduler = RequestScheduler.get_scheduler(self.NAME, 'klines', self.REQUESTS_PER_SECOND)
         # overwrite request timeout
         # self.client.REQUEST_TIMEOUT = 10  # default 10 seconds
 
@@ -52,83 +53,42 @@ class Binance(BaseExchange):
         return 0.0004 * 0.9  # 10% rebate for paying fees in BNB
 
     # from_time and to_time are being passed as pandas._libs.tslibs.timestamps.Timestamp
-    # Note: Binance uses 13 digit timestamps as opposed to 10 in our code.
-    #       We need to multiply and divide by 1000 to adjust for it
     def get_candle_data(self, test_num, pair, from_time, to_time, interval, include_prior=0, write_to_file=True,
                         verbose=False):
         self.validate_interval(interval)
 
-        # Use locally saved data if it exists
-        include_time = False if interval != "1" else True
-        cached_df = self.get_cached_exchange_data(pair, from_time, to_time, interval, prior=include_prior,
-                                                  include_time=include_time)
-
-        from_time_str = from_time.strftime('%Y-%m-%d')
-        to_time_str = to_time.strftime('%Y-%m-%d')
-        if cached_df is not None:
-            if verbose:
-                print(
-                    f'Using locally cached data for {pair} from {self.NAME}. Interval [{interval}], From[{from_time_str}], To[{to_time_str}]')
-            return cached_df
-
-        if verbose:
-            print(
-                f'Fetching {pair} data from {self.NAME}. Interval [{interval}], From[{from_time_str}], To[{to_time_str}]')
-
         start_time = from_time
 
         # Adjust from_time for example to add 200 additional prior entries for ema200
         if include_prior > 0:
             start_time = utils.adjust_from_time(from_time, interval, include_prior)
 
-        start_datetime_stamp = start_time.timestamp() * 1000
-        to_time_stamp = to_time.timestamp() * 1000
+        # Use locally saved data, only the ranges missing from the cache are downloaded
+        return self.get_cached_candle_data(pair, start_time, to_time, interval, write_to_file, verbose)
 
-        result = self.client.get_historical_klines(
+    # Note: Binance uses 13 digit timestamps as opposed to 10 in our code.
+    #       We need to multiply and divide by 1000 to adjust for it
+    def fetch_candle_data(self, pair, start_time, to_time, interval, verbose=False):
+        if verbose:
+            print(
+                f'Fetching {pair} data from {self.NAME}. Interval [{interval}], From[{start_time}], To[{to_time}]')
+
+        result = self.scheduler.execute(
+            self.client.get_historical_klines,
             pair,
             self.interval_map[interval],
-            int(start_datetime_stamp),
-            int(to_time_stamp),
+            utils.datetime_to_ms(start_time),
+            utils.datetime_to_ms(to_time),
             limit=1000,
             klines_type=HistoricalKlinesType.FUTURES
         )
         self.CURRENT_REQUESTS_COUNT += 1
 
-        # delete unwanted data - just keep date, open, high, low, close, volume
-        for line in result:
-            del line[6:]
-
-        tmp_df = pd.DataFrame(result, columns=['date', 'open', 'high', 'low', 'close', 'volume'])
-        # tmp_df.set_index('date', inplace=True)
-
-        tmp_df.index = [dt.datetime.fromtimestamp(x / 1000) for x in tmp_df.date]
-
-        # Drop rows that have a timestamp greater than to_time
-        # df = df[df.open_time <= int(to_time.timestamp())]
-
-        # Add pair column
-        tmp_df['pair'] = pair
-
-        # Only keep relevant columns OHLC(V)
-        # tmp_df = tmp_df[['pair', 'open', 'close', 'high', 'low', 'volume']]
-        tmp_df = tmp_df.loc[:, ['pair', 'open', 'high', 'low', 'close', 'volume']]
-
-        # Set proper data types
-        tmp_df['open'] = tmp_df['open'].astype(float)
-        tmp_df['high'] = tmp_df['high'].astype(float)
-        tmp_df['low'] = tmp_df['low'].astype(float)
-        tmp_df['close'] = tmp_df['close'].astype(float)
-        tmp_df['volume'] = tmp_df['volume'].astype(float)
-
-        # print(tmp_df.head().to_string())
-        # print(len(tmp_df))
-        # print(tmp_df.tail().to_string())
+        if len(result) == 0:
+            return None
 
-        # Write to file
-        if write_to_file:
-            self.save_candle_data(pair, from_time, to_time, interval, tmp_df, prior=include_prior,
-                                  include_time=True if interval == '1' else False, verbose=False)
-        return tmp_df
+        # Only the first 6 values are kept: date, open, high, low, close, volume
+        return utils.ohlcv_to_dataframe(result, pair)
 
 
 # Testing Class
@@ -1,4 +1,3 @@
-import datetime as dt
 import logging
 import math
 import time
@@ -12,6 +11,7 @@ from pybit import HTTP
 import api_keys
 import utils
 from exchanges.BaseExchange import BaseExchange
+from exchanges.RequestScheduler import RequestScheduler
 
 
 class Bybit(BaseExchange):
@@ -42,8 +42,9 @@ class Bybit(BaseExchange):
     }
 
     # Use these values to handle timeouts in subclasses
-    RETRY_WAIT_TIME = 10  # Wait time in seconds
+    RETRY_WAIT_TIME = 10  # Wait time in seconds before the first retry, doubled at each retry
     MAX_RETRIES = 20
+    REQUESTS_PER_SECOND = 10
 
     def __init__(self):
         super().__init__()
@@ -89,6 +90,9 @@ class Bybit(BaseExchange):
             logging_level=logging_level,
             spot=spot)
 
+        self.scheduler = RequestScheduler.get_scheduler(self.NAME, 'kline', self.REQUESTS_PER_SECOND,
+                                                        max_retries=self.MAX_RETRIES, base_delay=self.RETRY_WAIT_TIME)
+
         # self.load_markets()
 
     def load_markets(self):
@@ -116,75 +120,48 @@ class Bybit(BaseExchange):
         self.validate_pair(pair)
         self.validate_interval(interval)
 
-        # Use locally saved data if it exists
-        cached_df = self.get_cached_exchange_data(pair, from_time, to_time, interval, prior=include_prior)
+        start_time = from_time
+
+        # Adjust from_time for example to add 200 additional prior entries for ema200
+        if include_prior > 0:
+            start_time = utils.adjust_from_time(from_time, interval, include_prior)
 
-        from_time_str = from_time.strftime('%Y-%m-%d')
-        to_time_str = to_time.strftime('%Y-%m-%d')
-        if cached_df is not None:
-            if verbose:
-                print(f'Using locally cached data for {pair} from {self.NAME}.',
-                      f'Interval [{interval}], From[{from_time_str}], To[{to_time_str}]')
-            return cached_df
+        # Use locally saved data, only the ranges missing from the cache are downloaded
+        return self.get_cached_candle_data(pair, start_time, to_time, interval, write_to_file, verbose)
 
+    def fetch_candle_data(self, pair, start_time, to_time, interval, verbose=False):
         # The issue with Bybit API is that you can get a maximum of 200 bars from it.
         # So if you need to get data for a large portion of the time you have to call it multiple times.
 
         if verbose:
             print(
-                f'Fetching {pair} data from {self.NAME}. Interval [{interval}], From[{from_time_str}], To[{to_time_str}]')
-
-        df_list = []
-        start_time = from_time
+                f'Fetching {pair} data from {self.NAME}. Interval [{interval}], From[{start_time}], To[{to_time}]')
 
-        # Adjust from_time for example to add 200 additional prior entries for ema200
-        if include_prior > 0:
-            start_time = utils.adjust_from_time(from_time, interval, include_prior)
-
-        last_datetime_stamp = start_time.timestamp()
-        to_time_stamp = to_time.timestamp()
+        rows = []
+        last_datetime_stamp = utils.datetime_to_ms(start_time) // 1000
+        to_time_stamp = utils.datetime_to_ms(to_time) // 1000
 
         while last_datetime_stamp < to_time_stamp:
-            result = self.session_authenticated.query_kline(
+            result = self.scheduler.execute(
+                self.session_authenticated.query_kline,
                 symbol=pair,
                 interval=self.interval_map[interval],
                 **{'from': last_datetime_stamp})[
                 'result']
             self.CURRENT_REQUESTS_COUNT += 1
-            tmp_df = pd.DataFrame(result)
 
-            if tmp_df is None or (len(tmp_df.index) == 0):
+            if result is None or len(result) == 0:
                 break
 
-            tmp_df.index = [dt.datetime.fromtimestamp(x) for x in tmp_df.open_time]
-            # tmp_df.index = [dt.datetime.utcfromtimestamp(x) for x in tmp_df.open_time]
-            df_list.append(tmp_df)
-            last_datetime_stamp = float(max(tmp_df.open_time) + 1)  # Add 1 sec to last data received
+            # Drop rows that have a timestamp greater than to_time
+            rows += [[x['open_time'], x['open'], x['high'], x['low'], x['close'], x['volume']]
+                     for x in result if x['open_time'] <= to_time_stamp]
+            last_datetime_stamp = max(x['open_time'] for x in result) + 1  # Add 1 sec to last data received
 
             # time.sleep(2) # Sleep for x seconds, to avoid being locked out
 
-        if df_list is None or len(df_list) == 0:
+        if len(rows) == 0:
             return None
 
-        df = pd.concat(df_list)
-
-        # Drop rows that have a timestamp greater than to_time
-        df = df[df.open_time <= int(to_time.timestamp())]
-
-        # Only keep relevant columns OHLC(V)
-        df.rename(columns={'symbol': 'pair'}, inplace=True)
-        df = df.loc[:, ['pair', 'open', 'high', 'low', 'close', 'volume']]
-        # df = df[['pair', 'open', 'high', 'low', 'close', 'volume']]
-
-        # Set proper data types
-        df['open'] = df['open'].astype(float)
-        df['high'] = df['high'].astype(float)
-        df['low'] = df['low'].astype(float)
-        df['close'] = df['close'].astype(float)
-        df['volume'] = df['volume'].astype(float)
-
-        # Write to file
-        if write_to_file:
-            self.save_candle_data(pair, from_time, to_time, interval, df, prior=include_prior,
-                                  include_time=True if interval == '1' else False, verbose=False)
-        return df
+        # Bybit timestamps are in seconds
+        return utils.ohlcv_to_dataframe(rows, pair, unit='s')
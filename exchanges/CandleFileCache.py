@@ -0,0 +1,356 @@
+"""
+    Range aware cache of the candles downloaded from the exchanges.
+    For each exchange/pair/interval the cache keeps a list of segments, each segment holding all
+    the candles of a time range [start, end], in the folder:
+        <historical_files_path>/cache/<exchange>/<pair>/<interval>/
+    with an index.json file describing the segments. Segments are parquet files with typed columns
+    and a datetime64 index, ranges are read with a filter on the index instead of loading the whole file.
+    Any sub-range of the cached ranges is served from the segment files, only the parts of a request
+    that are not covered are downloaded. New ranges are merged with the segments they overlap or touch,
+    so the segments of a pair/interval never overlap.
+    Files of the previous cache (<exchange> <pair> [<interval>] <from> to <to> [-prior].csv/xlsx) are
+    imported the first time a pair/interval is used, they are left in place.
+    Candles are indexed by their open time in UTC. Caches created when candles were indexed in local time
+    are converted to UTC when they are first opened.
+    Several processes may share the cache: the index is read again and updated under a lock on the index.lock
+    file of the pair/interval folder.
+"""
+import contextlib
+import datetime as dt
+import glob
+import json
+import os
+import re
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+import pandas as pd
+
+import utils
+from Configuration import Configuration
+
+
+class CandleFileCache:
+    INDEX_FILE = 'index.json'
+    LOCK_FILE = 'index.lock'
+    SEGMENT_FMT = '%Y%m%d%H%M%S'
+    SEGMENT_EXT = '.parquet'
+    # Name of the index column in the segment files
+    INDEX_NAME = 'date'
+
+    FLOAT_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+
+    # Suffix of the previous cache file names: <from> to <to> [-prior].csv/xlsx
+    LEGACY_SUFFIX_REGEX = re.compile(r'^(\d{4}-\d{2}-\d{2}(?: \d{2}\.\d{2})?) to (\d{4}-\d{2}-\d{2}(?: \d{2}\.\d{2})?)'
+                                     r'(?: \[-(\d+|\{prior\})\])?\s*\.(csv|xlsx)$')
+
+    # Ranges closer than this are considered contiguous
+    TOLERANCE = dt.timedelta(seconds=1)
+
+    def __init__(self, exchange_name, pair, interval):
+        self.config = Configuration.get_config()
+        self.exchange_name = exchange_name
+        self.pair = pair.replace('/', '-')
+        self.interval = interval
+        self.path = os.path.join(self.config['output']['historical_files_path'], 'cache',
+                                 exchange_name, self.pair, interval)
+        self.legacy_imported = False
+        self.utc = True
+        self.lock_depth = 0
+        self.lock_file = None
+        with self.locked():
+            self.segments = self.read_index()
+            if not self.utc:
+                self.convert_segments_to_utc()
+            if not self.legacy_imported:
+                self.import_legacy_files()
+
+    @contextlib.contextmanager
+    def locked(self):
+        """
+            Hold the lock of this pair/interval folder, shared by all the processes using the cache.
+            The lock is reentrant within an instance.
+        """
+        if self.lock_depth == 0:
+            os.makedirs(self.path, exist_ok=True)
+            self.lock_file = open(os.path.join(self.path, self.LOCK_FILE), 'a+')
+            if fcntl is not None:
+                fcntl.flock(self.lock_file.fileno(), fcntl.LOCK_EX)
+            else:
+                while True:
+                    try:
+                        # Locks the first byte of the file, LK_LOCK only retries for 10 seconds
+                        self.lock_file.seek(0)
+                        msvcrt.locking(self.lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        time.sleep(0.1)
+        self.lock_depth += 1
+        try:
+            yield
+        finally:
+            self.lock_depth -= 1
+            if self.lock_depth == 0:
+                if fcntl is None:
+                    self.lock_file.seek(0)
+                    msvcrt.locking(self.lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+                # Closing the file releases the flock
+                self.lock_file.close()
+                self.lock_file = None
+
+    @staticmethod
+    def remove_file(filename):
+        # The file may already have been removed by another process
+        try:
+            os.remove(filename)
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def get_interval_duration(interval):
+        minutes = utils.convert_interval_to_min(interval)
+        # Months have no fixed duration, use the longest one
+        return dt.timedelta(minutes=minutes) if minutes > 0 else dt.timedelta(days=31)
+
+    def read_index(self):
+        filename = os.path.join(self.path, self.INDEX_FILE)
+        if not os.path.exists(filename):
+            return []
+        with open(filename) as f:
+            index = json.load(f)
+        self.legacy_imported = index.get('legacy_imported', False)
+        self.utc = index.get('utc', False)
+        segments = index['segments']
+        for segment in segments:
+            segment['start'] = dt.datetime.fromisoformat(segment['start'])
+            segment['end'] = dt.datetime.fromisoformat(segment['end'])
+        return segments
+
+    def write_index(self):
+        os.makedirs(self.path, exist_ok=True)
+        segments = [{'start': s['start'].isoformat(), 'end': s['end'].isoformat(), 'file': s['file']}
+                    for s in self.segments]
+        filename = os.path.join(self.path, self.INDEX_FILE)
+        with open(filename + '.tmp', 'w') as f:
+            json.dump({'interval': self.interval, 'utc': self.utc, 'legacy_imported': self.legacy_imported,
+                       'segments': segments}, f, indent=2)
+        os.replace(filename + '.tmp', filename)
+
+    def get_missing_ranges(self, start_time, to_time):
+        """
+            Returns the list of (start, end) ranges of [start_time, to_time] not covered by the cache
+        """
+        missing = []
+        current = start_time
+        for segment in self.segments:
+            if segment['end'] < current:
+                continue
+            if segment['start'] > to_time:
+                break
+            if segment['start'] > current + self.TOLERANCE:
+                missing.append((current, segment['start'] - self.TOLERANCE))
+            current = max(current, segment['end'] + self.TOLERANCE)
+        if current <= to_time:
+            missing.append((current, to_time))
+        return missing
+
+    def write_segment_file(self, filename, df):
+        df = df.copy()
+        df.index = pd.DatetimeIndex(df.index, name=self.INDEX_NAME)
+        for column in self.FLOAT_COLUMNS:
+            if column in df.columns:
+                df[column] = df[column].astype('float64')
+        os.makedirs(self.path, exist_ok=True)
+        filename = os.path.join(self.path, filename)
+        df.to_parquet(filename + '.tmp', index=True)
+        os.replace(filename + '.tmp', filename)
+
+    def convert_segment(self, segment):
+        # Segments cached as csv before the parquet format was used
+        csv_file = segment['file']
+        df = self.read_segment_file(csv_file)
+        segment['file'] = os.path.splitext(csv_file)[0] + self.SEGMENT_EXT
+        self.write_segment_file(segment['file'], df)
+        self.write_index()
+        self.remove_file(os.path.join(self.path, csv_file))
+
+    def get_segment_filename(self, start_time, to_time):
+        return f'{start_time.strftime(self.SEGMENT_FMT)}_{to_time.strftime(self.SEGMENT_FMT)}{self.SEGMENT_EXT}'
+
+    def convert_segments_to_utc(self):
+        """
+            Convert the segments of a cache created when candles were indexed in local time
+        """
+        old_files = []
+        for segment in self.segments:
+            df = self.read_segment_file(segment['file']) if segment['file'] else None
+            segment['start'] = utils.local_to_utc(segment['start'])
+            segment['end'] = utils.local_to_utc(segment['end'])
+            if df is not None:
+                df.index = utils.local_to_utc(df.index)
+                old_files.append(segment['file'])
+                segment['file'] = self.get_segment_filename(segment['start'], segment['end'])
+                self.write_segment_file(segment['file'], df)
+        self.utc = True
+        self.write_index()
+        for filename in old_files:
+            if filename not in [s['file'] for s in self.segments]:
+                self.remove_file(os.path.join(self.path, filename))
+
+    def read_segment_file(self, filename):
+        if filename.endswith('.csv'):
+            return utils.read_csv_to_dataframe(os.path.join(self.path, filename))
+        df = pd.read_parquet(os.path.join(self.path, filename))
+        df.index.name = None
+        return df
+
+    def read_segment(self, segment, start_time=None, to_time=None):
+        if segment['file'] is None:
+            return None
+        if not segment['file'].endswith(self.SEGMENT_EXT):
+            self.convert_segment(segment)
+        filters = None
+        if start_time is not None:
+            filters = [(self.INDEX_NAME, '>=', pd.Timestamp(start_time)), (self.INDEX_NAME, '<=', pd.Timestamp(to_time))]
+        df = pd.read_parquet(os.path.join(self.path, segment['file']), filters=filters)
+        df.index.name = None
+        return df
+
+    def read(self, start_time, to_time):
+        """
+            Returns the cached candles between start_time and to_time or None if there are none
+        """
+        df_list = []
+        for segment in self.segments:
+            if segment['end'] >= start_time and segment['start'] <= to_time:
+                df = self.read_segment(segment, start_time, to_time)
+                if df is not None and len(df.index) > 0:
+                    df_list.append(df)
+        if len(df_list) == 0:
+            return None
+        return pd.concat(df_list)
+
+    def add(self, start_time, to_time, df):
+        """
+            Add the candles downloaded for the range [start_time, to_time].
+            The range is merged with the segments it overlaps or touches into a single new segment.
+            Candles that may still change (the current bar) are not cached, the covered range is cut before them.
+            The index is read again under the lock, so that segments added by other processes are merged too.
+        """
+        last_closed = utils.utc_now() - self.get_interval_duration(self.interval)
+        to_time = min(to_time, last_closed)
+        if to_time < start_time:
+            return
+        if df is not None:
+            df = df[(df.index >= start_time) & (df.index <= to_time)]
+
+        with self.locked():
+            self.segments = self.read_index()
+            self.add_segment(start_time, to_time, df)
+
+    def add_segment(self, start_time, to_time, df):
+        merged, kept = [], []
+        for segment in self.segments:
+            if segment['start'] <= to_time + self.TOLERANCE and segment['end'] >= start_time - self.TOLERANCE:
+                merged.append(segment)
+            else:
+                kept.append(segment)
+
+        df_list = [self.read_segment(segment) for segment in merged] + [df]
+        df_list = [x for x in df_list if x is not None and len(x.index) > 0]
+        start_time = min([start_time] + [s['start'] for s in merged])
+        to_time = max([to_time] + [s['end'] for s in merged])
+
+        segment = {'start': start_time, 'end': to_time, 'file': None}
+        if len(df_list) > 0:
+            df = pd.concat(df_list)
+            # Freshly downloaded candles replace the cached ones
+            df = df[~df.index.duplicated(keep='last')].sort_index()
+            segment['file'] = self.get_segment_filename(start_time, to_time)
+            self.write_segment_file(segment['file'], df)
+
+        self.segments = sorted(kept + [segment], key=lambda s: s['start'])
+        self.write_index()
+
+        # Old segment files are only removed once the index no longer references them
+        for old_segment in merged:
+            if old_segment['file'] is not None and old_segment['file'] != segment['file']:
+                self.remove_file(os.path.join(self.path, old_segment['file']))
+
+    def get_legacy_files(self):
+        """
+            Returns the list of (filename, suffix) of the previous cache files of this exchange/pair/interval.
+            The previous cache joined the folder and the file name with a backslash,
+            outside of Windows the files were created in the working directory.
+        """
+        folder = self.config['output']['historical_files_path']
+        name = f'{self.exchange_name} {self.pair} [{self.interval}] '
+        files = []
+        for prefix in [os.path.join(folder, name), f'{folder}\\{name}']:
+            files += [(filename, filename[len(prefix):]) for filename in glob.glob(glob.escape(prefix) + '*')]
+        return files
+
+    def import_legacy_files(self):
+        """
+            Import the files of the previous cache of this exchange/pair/interval into the segments.
+            The covered range of each file is the range requested when it was downloaded.
+            These files were indexed in local time, they are converted to UTC.
+        """
+        for filename, suffix in self.get_legacy_files():
+            match = self.LEGACY_SUFFIX_REGEX.match(suffix)
+            if match is None:
+                continue
+            from_str, to_str, prior, file_format = match.groups()
+            time_fmt = '%Y-%m-%d %H.%M' if len(from_str) > 10 else '%Y-%m-%d'
+            from_time = dt.datetime.strptime(from_str, time_fmt)
+            to_time = dt.datetime.strptime(to_str, time_fmt)
+            if prior is not None and prior.isdigit():
+                from_time = utils.adjust_from_time(from_time, self.interval, int(prior))
+
+            if file_format == 'csv':
+                df = utils.read_csv_to_dataframe(filename)
+            else:
+                df = utils.read_excel_to_dataframe(filename)
+                df.index = pd.to_datetime(df.index)
+            if len(df.index) > 0:
+                from_time = min(from_time, df.index[0].to_pydatetime())
+            df.index = utils.local_to_utc(pd.DatetimeIndex(df.index))
+            print(f'Importing cached data file [{filename}].')
+            self.add(utils.local_to_utc(from_time), utils.local_to_utc(to_time), df)
+
+        self.legacy_imported = True
+        if len(self.segments) > 0:
+            self.write_index()
+
+    def get_candle_data(self, start_time, to_time, fetch):
+        """
+            Returns the candles between start_time and to_time, calling fetch(start, end) to download
+            only the ranges missing from the cache. fetch returns a DataFrame indexed by candle open time or None.
+        """
+        with self.locked():
+            # Ranges downloaded by other processes since this instance was created
+            self.segments = self.read_index()
+        recent = []
+        for missing_start, missing_end in self.get_missing_ranges(start_time, to_time):
+            df = fetch(missing_start, missing_end)
+            self.add(missing_start, missing_end, df)
+            # Candles too recent to be cached are still returned
+            if df is not None and len(df.index) > 0:
+                cached_end = max([s['end'] for s in self.segments], default=None)
+                if cached_end is None or cached_end < df.index[-1]:
+                    recent.append(df[df.index > cached_end] if cached_end is not None else df)
+
+        with self.locked():
+            # The segments read may have been merged by another process since they were added
+            self.segments = self.read_index()
+            df = self.read(start_time, to_time)
+        if len(recent) > 0:
+            df = pd.concat(([df] if df is not None else []) + recent)
+            df = df[~df.index.duplicated(keep='last')].sort_index()
+        return df
@@ -1,20 +1,50 @@
-import datetime as dt
-from os.path import exists
-
-import ccxt
-import pandas as pd
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import constants
 import utils
 from Configuration import Configuration
+from exchanges import exchange_utils
+from exchanges.BaseExchange import BaseExchange
+from exchanges.MarketsCache import MarketsCache
+from exchanges.RequestScheduler import RequestScheduler
 
 
 class ExchangeCCXT:
     NAME = None
 
+    # Instances shared by all test cases, keyed by (name, default type, use testnet)
+    _instances = {}
+    # Instances are also requested by the thread prefetching the candles of the next test cases (main.py --prefetch)
+    _lock = threading.Lock()
+
+    # Same local candle cache as the other exchanges, only the ranges missing from it are fetched
+    get_cached_candle_data = BaseExchange.get_cached_candle_data
+
+    @classmethod
+    def get_instance(cls, name, pair):
+        """
+            Returns the ExchangeCCXT instance for this exchange and the market type of this pair,
+            creating it on first use. Markets are only loaded once per instance.
+        """
+        use_testnet = Configuration.get_config()['exchange']['use_testnet']
+        key = (name, cls.get_default_type(name, pair), use_testnet)
+        with cls._lock:
+            if key not in cls._instances:
+                cls._instances[key] = ExchangeCCXT(name, pair)
+            return cls._instances[key]
+
+    @staticmethod
+    def get_default_type(name, pair):
+        # Binance coin margined contracts (Ex: BTCUSD) are 'delivery' markets
+        if name.lower() == 'binance' and pair.endswith('USD'):
+            return 'delivery'
+        return 'future'
+
     def __init__(self, name, pair):
         self.config = Configuration.get_config()
-        self.exchange = getattr(ccxt, name)()
+        self.exchange = exchange_utils.create_ccxt_exchange(name)
         self.NAME = self.exchange.name
         self.use_testnet = self.config['exchange']['use_testnet']
 
@@ -37,14 +67,71 @@ class ExchangeCCXT:
             # Mainnet
             self.exchange.set_sandbox_mode(False)
 
-        self.exchange.timeout = 300000  # number in milliseconds, default 10000
-
-        if self.exchange.name == 'Binance' and pair.endswith('USD'):
-            #pair = pair.replace('USD', '/USD')
-            self.exchange.options['defaultType'] = 'delivery'
+        # Number in milliseconds, default 10000. Requests that time out are retried by the request scheduler
+        self.exchange.timeout = 30000
+
+        self.exchange.options['defaultType'] = self.get_default_type(name, pair)
+        # Markets are read from the markets cache, load_markets() is only called when it is missing or expired
+        MarketsCache.load_markets(self.exchange, self.exchange.options['defaultType'], self.use_testnet)
+
+        # Shared by all download threads and loaders of this exchange,
+        # exchange.rateLimit is the number of milliseconds between requests
+        self.scheduler = RequestScheduler.get_scheduler(self.exchange.id, 'ohlcv', 1000 / self.exchange.rateLimit)
+        self.download_workers = self.config['exchange'].get('download_workers', 8)
+
+    def get_page_limit(self):
+        # Maximum number of candles per fetch_ohlcv() call
+        page_limit = getattr(self.exchange, 'ohlcv_page_limit', None)
+        if page_limit is None:
+            page_limit = constants.OHLCV_PAGE_LIMITS.get(self.exchange.id, constants.DEFAULT_OHLCV_PAGE_LIMIT)
+        return page_limit
+
+    def fetch_ohlcv_window(self, symbol, interval, since, until, page_limit):
+        """
+            Fetch the candles opened in [since, until) (timestamps in ms).
+            A window normally fits in a single page, if the exchange returns less candles than expected
+            the remaining part of the window is fetched sequentially.
+        """
+        # Shortest possible bar duration, months are at least 28 days
+        step = self.exchange.parse_timeframe(interval) * 1000
+        if interval.endswith('M'):
+            step = step * 28 // 30
+        rows = []
+        while since < until:
+            result = self.scheduler.execute(self.exchange.fetch_ohlcv, symbol=symbol, timeframe=interval,
+                                            since=int(since), limit=page_limit)
+            result = [row for row in result if since <= row[0] < until]
+            if len(result) == 0:
+                break
+            rows += result
+            if result[-1][0] + step >= until:
+                break
+            since = result[-1][0] + 1
+        return rows
+
+    def fetch_ohlcv_pages(self, symbol, interval, start_stamp, to_stamp):
+        """
+            Fetch all candles opened between start_stamp and to_stamp (timestamps in ms, inclusive).
+            The range is split up front into disjoint windows of one page each, which are downloaded in parallel
+            (bounded by the request scheduler), then stitched together. Rows outside of their window are dropped,
+            so there are no duplicates between windows.
+            Returns the list of [timestamp, open, high, low, close, volume] rows sorted by timestamp.
+        """
+        page_limit = self.get_page_limit()
+        # No candles exist after now
+        to_stamp = min(to_stamp, int(time.time() * 1000))
+        page_span = self.exchange.parse_timeframe(interval) * 1000 * page_limit
+        windows = [(since, min(since + page_span, to_stamp + 1))
+                   for since in range(int(start_stamp), int(to_stamp) + 1, page_span)]
+
+        if len(windows) <= 1 or self.download_workers <= 1:
+            pages = [self.fetch_ohlcv_window(symbol, interval, since, until, page_limit) for since, until in windows]
         else:
-            self.exchange.options['defaultType'] = 'future'
-        self.exchange.load_markets()
+            with ThreadPoolExecutor(max_workers=min(self.download_workers, len(windows))) as executor:
+                pages = list(executor.map(lambda window: self.fetch_ohlcv_window(
+                    symbol, interval, window[0], window[1], page_limit), windows))
+
+        return [row for page in pages for row in page]
 
     def get_candle_data(self, pair, from_time, to_time, interval, include_prior=0, write_to_file=True,
                         verbose=False):
@@ -54,122 +141,26 @@ class ExchangeCCXT:
         if self.exchange.name == 'Binance' and pair.endswith("USD"):
             pair = pair.replace('USD', '/USD')
 
-
-        # Use locally saved data if it exists
-        cached_df = self.get_cached_exchange_data(pair, from_time, to_time, interval, prior=include_prior)
-
-        from_time_str = from_time.strftime('%Y-%m-%d')
-        to_time_str = to_time.strftime('%Y-%m-%d')
-        if cached_df is not None:
-            if verbose:
-                print(f'Using locally cached data for {pair} from {self.NAME}.',
-                      f'Interval [{interval}], From[{from_time_str}], To[{to_time_str}]')
-            return cached_df
-
-        # The issue with Bybit API is that you can get a maximum of 200 bars from it.
-        # So if you need to get data for a large portion of the time you have to call it multiple times.
-
-        if verbose:
-            print(f'Fetching {pair} data from {self.NAME}. Interval [{interval}],',
-                  f' From[{from_time_str}], To[{to_time_str}]')
-
-        df_list = []
         start_time = from_time
 
         # Adjust from_time for example to add 200 additional prior entries for example ema200
         if include_prior > 0:
             start_time = utils.adjust_from_time(from_time, interval, include_prior)
 
-        last_datetime_stamp = start_time.timestamp() * 1000
-        to_time_stamp = to_time.timestamp() * 1000
-
-        while last_datetime_stamp < to_time_stamp:
-            result = self.exchange.fetch_ohlcv(
-                symbol=pair,
-                timeframe=interval,
-                since=int(last_datetime_stamp)
-            )
-            tmp_df = pd.DataFrame(result, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
+        return self.get_cached_candle_data(pair, start_time, to_time, interval, write_to_file, verbose)
 
-            # Add pair column
-            tmp_df['pair'] = pair
+    def fetch_candle_data(self, pair, start_time, to_time, interval, verbose=False):
+        # Exchanges return a limited number of bars per call (Ex: 200 for Bybit, 1500 for Binance).
+        # So the range is split in pages that are fetched in parallel.
 
-            if tmp_df is None or (len(tmp_df.index) == 0):
-                break
-
-            tmp_df.index = [dt.datetime.fromtimestamp(x / 1000) for x in tmp_df.timestamp]
-            df_list.append(tmp_df)
-            last_datetime_stamp = float(max(tmp_df.timestamp) + 1000)  # Add (1000ms = 1 sec) to last data received
-
-        if df_list is None or len(df_list) == 0:
-            return None
-
-        df = pd.concat(df_list)
-
-        # Drop rows that have a timestamp greater than to_time
-        df = df[df.timestamp <= int(to_time.timestamp() * 1000)]
-
-        # Only keep relevant columns OHLCV and re-order
-        df = df.loc[:, ['pair', 'open', 'high', 'low', 'close', 'volume']]
-
-        # Set proper data types
-        df['open'] = df['open'].astype(float)
-        df['high'] = df['high'].astype(float)
-        df['low'] = df['low'].astype(float)
-        df['close'] = df['close'].astype(float)
-        df['volume'] = df['volume'].astype(float)
-
-        # Write to file
-        if write_to_file:
-            self.save_candle_data(pair, from_time, to_time, interval, df, prior=include_prior,
-                                  include_time=True if interval == '1' else False, verbose=False)
-        return df
+        if verbose:
+            print(f'Fetching {pair} data from {self.NAME}. Interval [{interval}],',
+                  f' From[{start_time}], To[{to_time}]')
 
-    def get_exchange_data_filename_no_ext(self, pair, from_time, to_time, interval, prior=0, include_time=False):
-        pair = pair.replace('/', '-')
-        if include_time:
-            from_str = from_time.strftime('%Y-%m-%d %H.%M')
-            to_str = to_time.strftime('%Y-%m-%d %H.%M')
-        else:
-            from_str = from_time.strftime('%Y-%m-%d')
-            to_str = to_time.strftime('%Y-%m-%d')
-        filename = f"{self.config['output']['historical_files_path']}\\{self.NAME} {pair} [{interval}] {from_str} to {to_str}"
-        if prior > 0:
-            filename += f" [-{prior}]"
-        return filename
-
-    def save_candle_data(self, pair, from_time, to_time, interval, df, prior=0, include_time=False, verbose=True):
-
-        filename = self.get_exchange_data_filename_no_ext(pair, from_time, to_time, interval, prior, include_time)
-
-        if 'csv' in self.config['output']['output_file_format']:
-            filename = filename + '.csv'
-            df.to_csv(filename, index=True, header=True)
-            if verbose:
-                print(f'File created => [{filename}]')
-        if 'xlsx' in self.config['output']['output_file_format']:
-            filename = filename + '.xlsx'
-            df.to_excel(filename, index=True, header=True)
-            # to_excel_formatted(df, filename)
-            if verbose:
-                print(f'File created => [{filename}]')
-
-    # returns dataframe if file already exists locally and None otherwise
-    def get_cached_exchange_data(self, pair, from_time, to_time, interval, prior=0, include_time=False):
-        filename = self.get_exchange_data_filename_no_ext(pair, from_time, to_time, interval, prior, include_time)
-
-        if 'csv' in self.config['output']['output_file_format']:
-            filename += '.csv'
-            if exists(filename):
-                df = utils.read_csv_to_dataframe(filename)
-                # print(df.head().to_string())
-                return df
-        elif 'xlsx' in self.config['output']['output_file_format']:
-            filename += '.xlsx'
-            if exists(filename):
-                return utils.read_excel_to_dataframe(filename)
-        else:
+        result = self.fetch_ohlcv_pages(pair, interval, utils.datetime_to_ms(start_time), utils.datetime_to_ms(to_time))
+        if len(result) == 0:
             return None
+        return utils.ohlcv_to_dataframe(result, pair)
 
     def validate_interval(self, interval):
         valid_intervals = list(self.exchange.timeframes.keys())
@@ -0,0 +1,243 @@
+"""
+    Local stand-in for a ccxt exchange, used to benchmark and test data ingestion without network.
+    It implements the subset of the ccxt exchange interface used by this project (fetch_ohlcv, load_markets,
+    set_markets, market, timeframes, parse_timeframe) and serves candles after an artificial latency from:
+        - a recorded dataset: <dataset_path>/<symbol>_<timeframe>.parquet or .csv
+          (candles indexed by open time in UTC, see save_dataset())
+        - otherwise deterministic synthetic candles
+    Settings are read from the exchange.fake section of the config file:
+        latency: seconds waited by each request
+        ohlcv_page_limit: maximum number of candles returned by fetch_ohlcv()
+        rate_limit: number of milliseconds between requests advertised to the clients (ccxt rateLimit)
+        max_requests_per_second: requests above this rate fail with RateLimitExceeded (no limit by default)
+        error_rate: fraction of the requests failing with RequestTimeout or RateLimitExceeded
+        gaps: list of [from, to] date ranges without any candle (exchange outages)
+        listing_date: no candles before this date
+        dataset_path: folder of the recorded datasets
+        seed: seed of the random errors, the same seed always fails the same requests
+"""
+import os
+import random
+import threading
+import time
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+import utils
+from Configuration import Configuration
+
+
+# Same class names as the ccxt errors, so that they are handled the same way by the request scheduler
+class NetworkError(Exception):
+    pass
+
+
+class RequestTimeout(NetworkError):
+    pass
+
+
+class RateLimitExceeded(NetworkError):
+    pass
+
+
+class FakeExchange:
+    id = 'fake'
+    name = 'Fake'
+
+    timeframes = {'1m': '1m', '3m': '3m', '5m': '5m', '15m': '15m', '30m': '30m', '1h': '1h', '2h': '2h',
+                  '4h': '4h', '6h': '6h', '12h': '12h', '1d': '1d', '1w': '1w', '1M': '1M'}
+
+    SYMBOLS = ['BTCUSDT', 'ETHUSDT', 'BTC/USD', 'ETH/USD', 'BTCUSD', 'ETHUSD']
+
+    # Weekly candles open on Mondays, 1970-01-05 is the first Monday after the epoch
+    WEEK_ORIGIN_MS = 4 * 86400000
+
+    def __init__(self, latency=None, ohlcv_page_limit=None, rate_limit=None, max_requests_per_second=None,
+                 error_rate=None, gaps=None, listing_date=None, dataset_path=None, seed=None):
+        """
+            Arguments override the exchange.fake settings of the config file
+        """
+        settings = Configuration.get_config()['exchange'].get('fake', {})
+
+        def get_setting(value, key, default):
+            return value if value is not None else settings.get(key, default)
+
+        self.latency = get_setting(latency, 'latency', 0.2)
+        self.ohlcv_page_limit = get_setting(ohlcv_page_limit, 'ohlcv_page_limit', 1000)
+        self.rateLimit = get_setting(rate_limit, 'rate_limit', 50)
+        self.max_requests_per_second = get_setting(max_requests_per_second, 'max_requests_per_second', None)
+        self.error_rate = get_setting(error_rate, 'error_rate', 0)
+        self.gaps = [(utils.datetime_to_ms(start), utils.datetime_to_ms(end))
+                     for start, end in get_setting(gaps, 'gaps', [])]
+        self.listing_stamp = utils.datetime_to_ms(get_setting(listing_date, 'listing_date', '2019-09-01'))
+        self.dataset_path = get_setting(dataset_path, 'dataset_path', None)
+        self.random = random.Random(get_setting(seed, 'seed', 0))
+
+        self.timeout = 10000
+        self.enableRateLimit = False
+        self.options = {}
+        self.markets = {}
+        self.currencies = {}
+        self.datasets = {}
+        self.requests_count = 0
+        self.errors_count = 0
+        self.request_times = deque()
+        self.lock = threading.Lock()
+
+    def set_sandbox_mode(self, enabled):
+        pass
+
+    def load_markets(self, reload=False):
+        time.sleep(self.latency)
+        markets = {}
+        for symbol in self.SYMBOLS:
+            markets[symbol] = {'id': symbol.replace('/', ''), 'symbol': symbol, 'maker': 0.0002, 'taker': 0.0004}
+        self.set_markets(markets)
+        return self.markets
+
+    def set_markets(self, markets, currencies=None):
+        self.markets = markets
+        self.currencies = currencies if currencies else {}
+
+    def market(self, symbol):
+        return self.markets.get(symbol)
+
+    @staticmethod
+    def parse_timeframe(timeframe):
+        amount, unit = utils.parse_interval(timeframe)
+        seconds = {'m': 60, 'h': 3600, 'd': 86400, 'w': 604800, 'M': 2592000}
+        return amount * seconds[unit]
+
+    @staticmethod
+    def get_dataset_filename(dataset_path, symbol, timeframe):
+        return os.path.join(dataset_path, f"{symbol.replace('/', '-')}_{timeframe}")
+
+    @classmethod
+    def save_dataset(cls, df, symbol, timeframe, dataset_path):
+        """
+            Record candles (Ex: read from the database or the exchange_data cache) to be served by the fake exchange
+        """
+        os.makedirs(dataset_path, exist_ok=True)
+        df = df.loc[:, utils.OHLCV_COLUMNS].astype('float64')
+        df.index = pd.DatetimeIndex(df.index, name='date')
+        df.to_parquet(cls.get_dataset_filename(dataset_path, symbol, timeframe) + '.parquet', index=True)
+
+    def get_dataset(self, symbol, timeframe):
+        """
+            Returns the (timestamps, values) arrays of the recorded dataset of this symbol/timeframe or None
+        """
+        if self.dataset_path is None:
+            return None
+        key = (symbol, timeframe)
+        if key not in self.datasets:
+            filename = self.get_dataset_filename(self.dataset_path, symbol, timeframe)
+            if os.path.exists(filename + '.parquet'):
+                df = pd.read_parquet(filename + '.parquet')
+            elif os.path.exists(filename + '.csv'):
+                df = utils.read_csv_to_dataframe(filename + '.csv')
+            else:
+                df = None
+            if df is not None:
+                df = df.sort_index()
+                timestamps = pd.DatetimeIndex(df.index).as_unit('ms').asi8
+                self.datasets[key] = (timestamps, df.loc[:, utils.OHLCV_COLUMNS].to_numpy(dtype=np.float64))
+            else:
+                self.datasets[key] = None
+        return self.datasets[key]
+
+    def get_timestamps(self, timeframe, since, count):
+        """
+            Returns the open time of the count candles opened at or after since
+        """
+        amount, unit = utils.parse_interval(timeframe)
+        if unit == 'M':
+            first = np.datetime64(pd.Timestamp(since, unit='ms').to_period('M').to_timestamp(), 'M')
+            if first.astype('datetime64[ms]').astype(np.int64) < since:
+                first += 1
+            first += (-first.astype(np.int64)) % amount  # Months since the epoch multiple of amount
+            months = first + np.arange(count) * amount
+            return months.astype('datetime64[ms]').astype(np.int64)
+        step = self.parse_timeframe(timeframe) * 1000
+        origin = self.WEEK_ORIGIN_MS if unit == 'w' else 0
+        first = origin + -(-(since - origin) // step) * step
+        return first + np.arange(count, dtype=np.int64) * step
+
+    def is_available(self, timestamps):
+        available = timestamps >= self.listing_stamp
+        for start, end in self.gaps:
+            available &= (timestamps < start) | (timestamps > end)
+        return available
+
+    @staticmethod
+    def get_price(timestamps):
+        # Deterministic random walk like prices, the same timestamp always gets the same price
+        minutes = timestamps // 60000
+        return 20000 + 1000 * np.sin(minutes / 1440.0) + 50 * np.sin(minutes * 0.7)
+
+    def get_synthetic_candles(self, timeframe, since, limit, now):
+        timestamps = np.empty(0, dtype=np.int64)
+        while len(timestamps) < limit and since < now:
+            chunk = self.get_timestamps(timeframe, since, limit)
+            since = int(chunk[-1]) + 1
+            chunk = chunk[(chunk < now) & self.is_available(chunk)]
+            timestamps = np.concatenate([timestamps, chunk])
+        timestamps = timestamps[:limit]
+        close = self.get_price(timestamps)
+        open_ = self.get_price(timestamps - self.parse_timeframe(timeframe) * 1000)
+        high = np.maximum(open_, close) * 1.001
+        low = np.minimum(open_, close) * 0.999
+        volume = 100 + (timestamps // 60000) % 50
+        return timestamps, np.column_stack([open_, high, low, close, volume])
+
+    def get_recorded_candles(self, dataset, since, limit):
+        timestamps, values = dataset
+        first = np.searchsorted(timestamps, since)
+        last = first
+        selected = []
+        # Skip the candles inside the configured gaps
+        while len(selected) < limit and last < len(timestamps):
+            last = min(len(timestamps), last + limit)
+            indices = np.arange(first, last)
+            selected.extend(indices[self.is_available(timestamps[first:last])].tolist())
+            first = last
+        selected = selected[:limit]
+        return timestamps[selected], values[selected]
+
+    def check_rate_limit(self, now):
+        if self.max_requests_per_second is None:
+            return
+        # Sliding window of the requests sent in the last second
+        while len(self.request_times) > 0 and now - self.request_times[0] >= 1:
+            self.request_times.popleft()
+        if len(self.request_times) >= self.max_requests_per_second:
+            self.errors_count += 1
+            raise RateLimitExceeded(f'{self.name} 429 Too Many Requests')
+        self.request_times.append(now)
+
+    def fetch_ohlcv(self, symbol, timeframe='1m', since=None, limit=None, params={}):
+        with self.lock:
+            self.requests_count += 1
+            self.check_rate_limit(time.monotonic())
+            error = self.random.random() < self.error_rate
+        time.sleep(self.latency)
+        if error:
+            with self.lock:
+                self.errors_count += 1
+            if self.random.random() < 0.5:
+                raise RequestTimeout(f'{self.name} GET /klines timed out')
+            raise RateLimitExceeded(f'{self.name} 429 Too Many Requests')
+
+        if self.market(symbol) is None:
+            raise Exception(f'{self.name} does not have market symbol {symbol}')
+        limit = min(limit, self.ohlcv_page_limit) if limit else self.ohlcv_page_limit
+        now = int(time.time() * 1000)
+        since = since if since is not None else now - limit * self.parse_timeframe(timeframe) * 1000
+
+        dataset = self.get_dataset(symbol, timeframe)
+        if dataset is not None:
+            timestamps, values = self.get_recorded_candles(dataset, since, limit)
+        else:
+            timestamps, values = self.get_synthetic_candles(timeframe, since, limit, now)
+        return [[int(t)] + row for t, row in zip(timestamps, values.tolist())]
@@ -0,0 +1,87 @@
+"""
+    Cache of the markets (pairs, precisions, maker/taker fees) returned by ccxt load_markets().
+    Markets are kept in memory for the life of the process and persisted to disk in:
+        <historical_files_path>/markets/<exchange>_<default type>[_testnet].json
+    The disk cache is refreshed from the exchange once it is older than exchange.markets_cache_ttl_hours.
+    With exchange.offline = true the disk cache is always used, regardless of its age.
+"""
+import json
+import os
+import time
+
+from Configuration import Configuration
+
+
+class MarketsCache:
+    DEFAULT_TTL_HOURS = 24
+
+    # In process cache: key => {'timestamp':, 'markets':, 'currencies':}
+    _cache = {}
+
+    @staticmethod
+    def get_key(exchange_id, default_type, use_testnet):
+        key = f'{exchange_id}_{default_type}'
+        return key + '_testnet' if use_testnet else key
+
+    @staticmethod
+    def get_filename(key):
+        config = Configuration.get_config()
+        return os.path.join(config['output']['historical_files_path'], 'markets', f'{key}.json')
+
+    @classmethod
+    def load_markets(cls, exchange, default_type, use_testnet):
+        """
+            Set the markets of the ccxt exchange object from the cache,
+            only calling exchange.load_markets() when the cache is missing or expired.
+        """
+        config = Configuration.get_config()
+        offline = config['exchange'].get('offline', False)
+        ttl = config['exchange'].get('markets_cache_ttl_hours', cls.DEFAULT_TTL_HOURS) * 3600
+        key = cls.get_key(exchange.id, default_type, use_testnet)
+
+        entry = cls._cache.get(key)
+        if entry is None:
+            entry = cls.read_from_disk(key)
+        if entry is not None and (offline or time.time() - entry['timestamp'] < ttl):
+            cls._cache[key] = entry
+            exchange.set_markets(entry['markets'], entry['currencies'])
+            return exchange.markets
+
+        if offline:
+            raise Exception(f'No cached markets found for [{key}]. '
+                            f'Unable to run offline, run once with exchange.offline = false to fill the cache.')
+
+        try:
+            exchange.load_markets()
+        except Exception as e:
+            if entry is None:
+                raise e
+            # Exchange unreachable, an expired cache is better than no cache
+            print(f'Unable to refresh the markets of {exchange.name}, using cached markets. {e}')
+            exchange.set_markets(entry['markets'], entry['currencies'])
+            return exchange.markets
+
+        entry = {'timestamp': time.time(), 'markets': exchange.markets, 'currencies': exchange.currencies}
+        cls._cache[key] = entry
+        cls.write_to_disk(key, entry)
+        return exchange.markets
+
+    @classmethod
+    def read_from_disk(cls, key):
+        filename = cls.get_filename(key)
+        if not os.path.exists(filename):
+            return None
+        try:
+            with open(filename) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            # Corrupted file, it will be overwritten by the next refresh
+            return None
+
+    @classmethod
+    def write_to_disk(cls, key, entry):
+        filename = cls.get_filename(key)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with open(filename + '.tmp', 'w') as f:
+            json.dump(entry, f, default=str)
+        os.replace(filename + '.tmp', filename)
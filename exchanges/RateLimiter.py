@@ -0,0 +1,37 @@
+"""
+    Thread safe token bucket used to limit the number of requests sent to an exchange.
+    Tokens are added at a constant rate up to the capacity of the bucket,
+    each request consumes one token and waits when the bucket is empty.
+"""
+import threading
+import time
+
+
+class RateLimiter:
+
+    def __init__(self, rate, capacity=1):
+        """
+            rate: number of requests allowed per second
+            capacity: maximum number of requests that can be sent in a burst
+        """
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def set_rate(self, rate):
+        with self.lock:
+            self.rate = float(rate)
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
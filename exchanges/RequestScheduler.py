@@ -0,0 +1,122 @@
+"""
+    Scheduler of the requests sent to the exchanges, shared by all exchange classes and data loaders.
+    Each exchange/endpoint has its own token bucket, so all threads and objects calling the same endpoint
+    share its rate limit. Failed requests are retried with a jittered exponential backoff when the error
+    is temporary (timeouts, network errors, HTTP 429 Too Many Requests, ...).
+    The rate is adaptive: it is halved each time the exchange answers that the rate limit is exceeded,
+    then slowly raised back to its maximum while requests succeed.
+"""
+import random
+import threading
+import time
+
+from exchanges.RateLimiter import RateLimiter
+
+
+class RequestScheduler:
+    MAX_RETRIES = 8
+    BASE_DELAY = 1  # Seconds waited before the first retry, doubled at each retry
+    MAX_DELAY = 60  # Maximum number of seconds waited between retries
+
+    # The rate is never lowered below this fraction of the maximum rate
+    MIN_RATE_RATIO = 0.05
+    # Fraction of the maximum rate recovered after each successful request
+    RATE_RECOVERY_RATIO = 0.02
+
+    # Exception class names (including parent classes) of errors that are worth retrying.
+    # Matched by name so that ccxt, requests, urllib3 and pybit errors are handled without importing them here.
+    RETRYABLE_ERRORS = {'NetworkError', 'RequestTimeout', 'ExchangeNotAvailable', 'DDoSProtection',
+                        'RateLimitExceeded', 'Timeout', 'ReadTimeout', 'ConnectTimeout', 'ReadTimeoutError',
+                        'ConnectTimeoutError', 'ProtocolError', 'ConnectionError', 'TimeoutError'}
+    RATE_LIMIT_ERRORS = {'DDoSProtection', 'RateLimitExceeded'}
+    # HTTP 429 Too Many Requests, 418 IP banned after too many requests (Binance), 10006 too many visits (Bybit)
+    RATE_LIMIT_STATUS_CODES = {429, 418, 10006}
+
+    # One scheduler per (exchange, endpoint)
+    _schedulers = {}
+    _lock = threading.Lock()
+
+    def __init__(self, name, rate, capacity=1, max_retries=None, base_delay=None):
+        """
+            name: used in the messages printed when requests are retried
+            rate: maximum number of requests per second
+            capacity: maximum number of requests sent in a burst
+        """
+        self.name = name
+        self.max_rate = float(rate)
+        self.rate = float(rate)
+        self.limiter = RateLimiter(rate, capacity)
+        self.max_retries = max_retries if max_retries is not None else self.MAX_RETRIES
+        self.base_delay = base_delay if base_delay is not None else self.BASE_DELAY
+        self.lock = threading.Lock()
+
+    @classmethod
+    def get_scheduler(cls, exchange_name, endpoint, rate, capacity=1, max_retries=None, base_delay=None):
+        """
+            Returns the scheduler of this exchange/endpoint, creating it on first use
+        """
+        key = (exchange_name.lower(), endpoint)
+        with cls._lock:
+            if key not in cls._schedulers:
+                cls._schedulers[key] = RequestScheduler(f'{exchange_name} {endpoint}', rate, capacity,
+                                                        max_retries, base_delay)
+            return cls._schedulers[key]
+
+    @classmethod
+    def get_error_names(cls, error):
+        return {c.__name__ for c in type(error).__mro__}
+
+    @classmethod
+    def get_status_code(cls, error):
+        status_code = getattr(error, 'status_code', None)
+        response = getattr(error, 'response', None)
+        if status_code is None and response is not None:
+            status_code = getattr(response, 'status_code', None)
+        return status_code
+
+    @classmethod
+    def is_rate_limit_error(cls, error):
+        return len(cls.get_error_names(error) & cls.RATE_LIMIT_ERRORS) > 0 or \
+            cls.get_status_code(error) in cls.RATE_LIMIT_STATUS_CODES
+
+    @classmethod
+    def is_retryable(cls, error):
+        return len(cls.get_error_names(error) & cls.RETRYABLE_ERRORS) > 0 or cls.is_rate_limit_error(error)
+
+    def get_retry_delay(self, attempt):
+        # Full jitter: threads that failed together do not retry together
+        return random.uniform(0, min(self.MAX_DELAY, self.base_delay * 2 ** attempt))
+
+    def on_success(self):
+        if self.rate < self.max_rate:
+            with self.lock:
+                self.rate = min(self.max_rate, self.rate + self.max_rate * self.RATE_RECOVERY_RATIO)
+                self.limiter.set_rate(self.rate)
+
+    def on_rate_limited(self):
+        with self.lock:
+            self.rate = max(self.max_rate * self.MIN_RATE_RATIO, self.rate / 2)
+            self.limiter.set_rate(self.rate)
+
+    def execute(self, func, *args, **kwargs):
+        """
+            Call func(*args, **kwargs) when the rate limit allows it, retrying temporary errors.
+            The last error is raised once MAX_RETRIES retries have failed.
+        """
+        attempt = 0
+        while True:
+            self.limiter.acquire()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                if not self.is_retryable(e) or attempt >= self.max_retries:
+                    raise
+                if self.is_rate_limit_error(e):
+                    self.on_rate_limited()
+                delay = self.get_retry_delay(attempt)
+                attempt += 1
+                print(f'\n{self.name}: {type(e).__name__} {e}. Retry {attempt}/{self.max_retries} in {delay:.1f}s.')
+                time.sleep(delay)
+                continue
+            self.on_success()
+            return result
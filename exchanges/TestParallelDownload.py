@@ -0,0 +1,48 @@
+"""
+    Compare the sequential and parallel download of candles from a local fake exchange.
+    Both downloads must return exactly the same candles. Run as a script, the fake exchange injects latency and the
+    times are printed: the parallel download should be about min(download_workers, 1000 / rateLimit * latency)
+    times faster. Only the candles are checked, not the times.
+"""
+import datetime as dt
+import time
+
+from exchanges.ExchangeCCXT import ExchangeCCXT
+
+PAIR = 'BTCUSDT'
+FROM_TIME = dt.datetime(2022, 1, 1)
+TO_TIME = dt.datetime(2022, 1, 20)
+INTERVAL = '1m'
+
+
+def download(latency, workers_list):
+    """
+        Returns the candles downloaded with each number of workers of workers_list
+    """
+    exchange = ExchangeCCXT('Fake', PAIR)
+    exchange.exchange.latency = latency
+    exchange.exchange.ohlcv_page_limit = 1000
+
+    results = {}
+    for workers in workers_list:
+        exchange.download_workers = workers
+        exchange.exchange.requests_count = 0
+        start = time.time()
+        results[workers] = exchange.get_candle_data(PAIR, FROM_TIME, TO_TIME, INTERVAL, write_to_file=False)
+        print(f'Workers={workers} Rows={len(results[workers].index)} Requests={exchange.exchange.requests_count} '
+              f'Time={time.time() - start:.2f}s')
+    return results
+
+
+def test_parallel_download(latency=0.0):
+    results = download(latency, [1, 8])
+    df_seq, df_par = results[1], results[8]
+    assert df_seq.equals(df_par), 'Parallel download differs from the sequential download'
+    assert df_par.index.is_unique and df_par.index.is_monotonic_increasing
+    expected_rows = int((TO_TIME - FROM_TIME).total_seconds() // 60) + 1
+    assert len(df_par.index) == expected_rows, f'Expected {expected_rows} rows, got {len(df_par.index)}'
+
+
+if __name__ == '__main__':
+    test_parallel_download(latency=0.3)
+    print('OK')
@@ -0,0 +1,22 @@
+"""
+    Helper functions shared by the exchange classes and the data loaders
+"""
+import ccxt
+
+from Configuration import Configuration
+from exchanges.FakeExchange import FakeExchange
+
+
+def is_fake_exchange(name):
+    return name.lower() == FakeExchange.id or Configuration.get_config()['exchange'].get('use_fake_exchange', False)
+
+
+def create_ccxt_exchange(name):
+    """
+        Returns the ccxt exchange object of this exchange id (Ex: 'binance', 'bybit').
+        The local fake exchange is returned for the 'fake' id, or for all exchanges when
+        exchange.use_fake_exchange is set in the config file (offline tests and benchmarks).
+    """
+    if is_fake_exchange(name):
+        return FakeExchange()
+    return getattr(ccxt, name)()
@@ -1,11 +1,26 @@
+import argparse
+import math
+import multiprocessing.util
+import threading
 import time
+import traceback
 import warnings
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
+from queue import Queue
+
+import pandas as pd
 
 import constants
 import utils
 from Configuration import Configuration
-from params import validate_params, load_test_cases_from_file
+from database.CandleDataSet import CandleDataSet
+from database.DbResultsWriter import DbResultsWriter
+from database.DbWorkQueue import DbWorkQueue
+from optimization.Optimizer import Optimizer
+from optimization.WalkForward import WalkForward
+from params import validate_params, load_test_cases, expand_test_cases
 
 # Do not remove these imports even if PyCharm says they're unused
 from strategies.MACD_BB_Freeman import MACD_BB_Freeman
@@ -17,7 +32,7 @@ from strategies.UltimateScalper import UltimateScalper
 from strategies.HA_VWAP import HA_VWAP
 
 # Ignore warnings when reading xlsx file containing list of values for dropdown
-from stats import stats_utils
+from stats.ResultsAccumulator import ResultsAccumulator
 
 
 # Do not delete
@@ -40,57 +55,414 @@ def backtest(params):
     print(f'Test #{params["Test_Num"]} Execution Time: {exec_time}\n')
 
 
-def main():
+def get_test_case_params(index, row, config):
+    return {
+        'Test_Num': int(index)
+        , 'Original_Test_Num': int(row.get('Original Test #', index))
+        , 'Exchange': row.Exchange
+        , 'Pair': row.Pair
+        , 'From_Time': row.From
+        , 'To_Time': row.To
+        , 'Interval': row.Interval
+        , 'Initial_Capital': float(config['trades']['initial_capital'])
+        , 'Take_Profit_PCT': row['TP %']
+        , 'Stop_Loss_PCT': row['SL %']
+        , 'Strategy': row['Strategy']
+        , 'Exit_Strategy': row['Exit_Strategy']
+        , 'StrategySettings': row['Optional Strategy Settings']
+    }
+
+
+def init_worker():
+    """
+        Run once by each process of the pool, before its first test case.
+        The config, database readers (engines), exchange instances and their caches are created on first use
+        by the worker and then reused by all the test cases it runs.
+    """
+    Configuration.get_config()
+    # Disable ResourceWarning, pybit library seems to not be closing its ssl.SSLSocket properly
+    warnings.simplefilter("ignore", ResourceWarning)
+    # Pool workers do not run atexit handlers, write the statistics still queued for the database on exit
+    multiprocessing.util.Finalize(None, DbResultsWriter.close_all, exitpriority=10)
+
+
+def get_dataset_key(params):
+    return params['Exchange'].lower(), params['Pair'], params['From_Time'], params['To_Time']
+
+
+def plan_datasets(params_list):
+    """
+        Group the test cases by dataset (exchange, pair, date range), in the order of their first test case.
+        Within a dataset, test cases are ordered by strategy and indicator settings.
+        Returns a list of (priors, params_list), priors being the largest include_prior of each interval
+        read by the test cases of the group, so that each interval is loaded once per group.
+    """
+    groups = {}
+    for params in params_list:
+        priors, group = groups.setdefault(get_dataset_key(params), ({}, {}))
+        # Unsupported strategies are reported by validate_params() when the test case is run
+        strategy_class = globals().get(params['Strategy'])
+        indicator_key = None
+        if strategy_class is not None:
+            for interval, include_prior in strategy_class.get_candle_data_intervals(params):
+                priors[interval] = max(priors.get(interval, 0), include_prior)
+            indicator_key = strategy_class.get_indicator_settings_key(params)
+        # Test cases calculating the same indicators are run one after the other, so that the indicators
+        # cached by the CandleDataSet are reused before being dropped
+        group.setdefault((params['Strategy'], indicator_key), []).append(params)
+    return [(priors, [params for same_indicators in group.values() for params in same_indicators])
+            for priors, group in groups.values()]
+
+
+def split_datasets(groups, workers):
+    """
+        Split the largest groups so that all the workers are used, each part still loads its candles once
+    """
+    nb_test_cases = sum(len(params_list) for _, params_list in groups)
+    size = math.ceil(nb_test_cases / workers)
+    return [(priors, params_list[i:i + size]) for priors, params_list in groups
+            for i in range(0, len(params_list), size)]
+
+
+def run_dataset(priors, params_list, statistics, dataset=None, output_writer=None):
+    """
+        dataset: CandleDataSet of the test cases, already loaded by the pipelined runner
+        output_writer: OutputWriter writing the trades files of the pipelined runner
+    """
+    if dataset is None:
+        dataset = CandleDataSet(params_list[0]['From_Time'], params_list[0]['To_Time'], priors)
+    for params in params_list:
+        params['Candle_Data'] = dataset
+        params['Statistics'] = statistics
+        if output_writer is not None:
+            params['Output_Writer'] = output_writer
+        backtest(params)
+        del params['Candle_Data']
+        params.pop('Output_Writer', None)
+    return statistics
+
+
+def run_dataset_in_worker(group):
+    """
+        Run the test cases of a dataset in a worker process and return their rows of Statistics
+    """
+    priors, params_list = group
+    return run_dataset(priors, params_list, ResultsAccumulator())
+
+
+def run_test_cases(groups, statistics):
+    for priors, params_list in groups:
+        run_dataset(priors, params_list, statistics)
+    return statistics
+
+
+class OutputWriter:
+    """
+        Writes the output files of the test cases from a background thread, in the order they are submitted.
+        submit() blocks when MAX_PENDING writes are already queued, so that the DataFrames waiting to be written
+        do not pile up in memory when writing is slower than running the test cases.
+    """
+    MAX_PENDING = 8
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='OutputWriter')
+        self.pending = deque()
+
+    @staticmethod
+    def write(func, *args):
+        try:
+            func(*args)
+        except Exception:
+            # Never let a failed write stop the next ones, the statistics of the test case are still saved
+            print(f'\nUnable to write the output file of test #{args[0]}.')
+            traceback.print_exc()
+
+    def submit(self, func, *args):
+        """
+            Queue func(*args), args[0] being the test number
+        """
+        self.pending.append(self.executor.submit(self.write, func, *args))
+        while len(self.pending) > self.MAX_PENDING:
+            self.pending.popleft().result()
+
+    def close(self):
+        """
+            Wait for the queued writes to be done
+        """
+        self.executor.shutdown(wait=True)
+        self.pending.clear()
+
+
+def load_dataset(priors, params_list):
+    """
+        Returns the CandleDataSet of the test cases, with the candles of all its intervals loaded.
+        The candles are read by a strategy of the test cases. The errors (invalid test case, no candles, database
+        unavailable) are printed, and the candles missing from the dataset are read again when the test cases run.
+    """
+    dataset = CandleDataSet(params_list[0]['From_Time'], params_list[0]['To_Time'], priors)
+    for params in params_list:
+        try:
+            strategy = globals()[params['Strategy']](params)
+            for interval, include_prior in priors.items():
+                dataset.get_candle_data(interval, include_prior, strategy.fetch_candle_data)
+            break
+        except Exception as e:
+            # Reported again by the test case when it is run, try to read the candles with the next one
+            print(f'\nUnable to load the candles of test #{params["Test_Num"]} ahead: {e!r}')
+            continue
+    return dataset
+
+
+def prefetch_datasets(groups, ready):
+    """
+        Load the datasets one after the other and put them in the ready queue, blocks while the queue is full
+    """
+    try:
+        for priors, params_list in groups:
+            ready.put((priors, params_list, load_dataset(priors, params_list)))
+    finally:
+        ready.put(None)
+
+
+def run_test_cases_pipelined(groups, statistics, prefetch):
+    """
+        Run the test cases with their I/O overlapped with their calculations: a background thread loads the candles
+        of up to prefetch datasets ahead, another one writes the trades files, while the main thread runs the
+        test cases
+    """
+    print(f'Running {sum(len(g[1]) for g in groups)} test cases with {prefetch} datasets loaded ahead.')
+    ready = Queue(maxsize=prefetch)
+    threading.Thread(target=prefetch_datasets, args=(groups, ready), name='Prefetch', daemon=True).start()
+    output_writer = OutputWriter()
+    try:
+        while True:
+            item = ready.get()
+            if item is None:
+                break
+            priors, params_list, dataset = item
+            run_dataset(priors, params_list, statistics, dataset, output_writer)
+    finally:
+        output_writer.close()
+    return statistics
+
+
+def run_test_cases_in_pool(groups, statistics, workers):
+    groups = split_datasets(groups, workers)
+    print(f'Running {sum(len(g[1]) for g in groups)} test cases with {workers} worker processes.')
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as executor:
+        for results in executor.map(run_dataset_in_worker, groups):
+            statistics.extend(results)
+    return statistics
+
+
+def run_queue_coordinator(groups, queue_name):
+    """
+        Queue the test cases in the work queue, wait for the workers (main.py --queue-worker) to run them
+        and return their rows of Statistics
+    """
+    queue = DbWorkQueue.from_config(queue_name)
+    # Test cases sharing the same candles are queued one after the other, a worker claiming several of them
+    # loads their candles once
+    queue.enqueue([params for _, params_list in groups for params in params_list])
+    print(f'Waiting for the workers: python main.py --queue-worker --queue {queue_name} [--workers N]')
+    last_counts = None
+    while True:
+        queue.requeue_stalled()
+        counts = queue.get_counts()
+        if counts != last_counts:
+            print(', '.join(f'{count} {status}' for status, count in counts.items()))
+            last_counts = counts
+        if queue.is_finished(counts):
+            break
+        time.sleep(queue.poll_interval)
+
+    rows, errors = queue.get_results()
+    for test_num, error in errors:
+        print(f'\nTest #{test_num} failed:\n{error}')
+    statistics = ResultsAccumulator()
+    for row in rows:
+        statistics.append(row)
+    return statistics
+
+
+def run_jobs(queue, jobs):
+    """
+        Run the test cases claimed from the work queue and report their row of Statistics
+    """
+    job_ids = {id(params): job_id for job_id, params in jobs}
+    for priors, params_list in plan_datasets([params for _, params in jobs]):
+        dataset = CandleDataSet(params_list[0]['From_Time'], params_list[0]['To_Time'], priors)
+        for params in params_list:
+            job_id = job_ids[id(params)]
+            params['Candle_Data'] = dataset
+            params['Statistics'] = ResultsAccumulator()
+            try:
+                backtest(params)
+            except Exception:
+                # Invalid test cases raise an Exception, the worker goes on with the next test case
+                traceback.print_exc()
+                queue.fail(job_id, traceback.format_exc())
+                continue
+            finally:
+                del params['Candle_Data']
+            if not queue.complete(job_id, params['Statistics'].get_row(-1)):
+                print(f'\nTest #{params["Test_Num"]} was queued again after a stall, its result is ignored.')
+
+
+def run_queue_worker(queue_name):
+    """
+        Claim and run the test cases of the work queue until all of them are done.
+        Waits for the coordinator (main.py --enqueue) if the queue is empty.
+    """
+    queue = DbWorkQueue.from_config(queue_name)
+    print(f'Worker {queue.worker_id} running the test cases of [{queue_name}].')
+    queue.start_heartbeat()
+    try:
+        while True:
+            jobs = queue.claim()
+            if len(jobs) > 0:
+                run_jobs(queue, jobs)
+                continue
+            # The jobs of stalled workers are claimed by the remaining workers
+            if queue.requeue_stalled() > 0:
+                continue
+            counts = queue.get_counts()
+            if sum(counts.values()) > 0 and queue.is_finished(counts):
+                break
+            time.sleep(queue.poll_interval)
+    finally:
+        queue.stop_heartbeat()
+    print(f'Worker {queue.worker_id}: all the test cases of [{queue_name}] are done.')
+
+
+def run_queue_workers(queue_name, workers):
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as executor:
+        for _ in executor.map(run_queue_worker, [queue_name] * workers):
+            pass
+
+
+def run_walk_forward(test_cases_df, config, workers):
+    """
+        Walk-forward optimization of each test case, over the combinations of its swept parameters
+    """
+    now = datetime.now().strftime('[%Y-%m-%d] [%H.%M.%S]')
+    summaries = []
+    for index in test_cases_df.index:
+        candidates = [get_test_case_params(index, candidate, config)
+                      for _, candidate in expand_test_cases(test_cases_df.loc[[index]]).iterrows()]
+        walk_forward = WalkForward.from_config(candidates, workers)
+        summaries.append(walk_forward.run())
+        print('\n' + walk_forward.windows_df.to_markdown() + '\n')
+        walk_forward.save(config['output']['results_path'], config['output']['output_file_format'], now)
+    print(pd.DataFrame(summaries).set_index('Test #').to_markdown())
+
+
+def run_optimization(test_cases_df, config, workers):
+    """
+        Search of the best settings of each test case among the values of its swept parameters
+    """
+    now = datetime.now().strftime('[%Y-%m-%d] [%H.%M.%S]')
+    summaries = []
+    for index, row in test_cases_df.iterrows():
+        optimizer = Optimizer.from_config(get_test_case_params(index, row, config), workers)
+        summaries.append(optimizer.run())
+        optimizer.save(config['output']['results_path'], config['output']['output_file_format'], now)
+    print('\n' + pd.DataFrame(summaries).set_index('Test #').to_markdown())
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Backtest the test cases of the test cases file.')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of processes running test cases in parallel (default: 1, no process pool)')
+    modes = parser.add_mutually_exclusive_group()
+    modes.add_argument('--walk-forward', action='store_true',
+                       help='Walk-forward optimization of each test case over its swept parameters, '
+                            'windows are set in the optimization.walk_forward section of the config file')
+    modes.add_argument('--optimize', action='store_true',
+                       help='Search of the best settings of each test case among its swept parameters, '
+                            'set in the optimization.search section of the config file')
+    modes.add_argument('--enqueue', action='store_true',
+                       help='Queue the test cases in the work queue (database.work_queue section of the config '
+                            'file), wait for the workers to run them and save their statistics')
+    modes.add_argument('--queue-worker', action='store_true',
+                       help='Run the test cases of the work queue, on this machine with --workers processes')
+    parser.add_argument('--prefetch', type=int, default=0,
+                        help='Without --workers, number of datasets (test cases sharing the same candles) whose '
+                             'candles are loaded ahead by a background thread while the test cases run, '
+                             'trades files are then also written by a background thread (default: 0, disabled)')
+    parser.add_argument('--queue', default='default',
+                        help='Name of the work queue used by --enqueue and --queue-worker (default: default)')
+    args = parser.parse_args()
+    if args.workers < 1:
+        parser.error('--workers must be >= 1')
+    if args.prefetch < 0:
+        parser.error('--prefetch must be >= 0')
+    if args.prefetch > 0 and args.workers > 1:
+        parser.error('--prefetch runs the test cases in a single process and cannot be used with --workers')
+    if args.prefetch > 0 and (args.walk_forward or args.optimize or args.enqueue or args.queue_worker):
+        parser.error('--prefetch can only be used to run the test cases of the test cases file')
+    return args
+
+
+def main(test_cases=None):
+    """
+        test_cases: test cases to run instead of the ones of the test cases file of the config file.
+        Iterable of test cases (Ex: a generator) with the columns of TestCases.xlsx as keys, or a DataFrame.
+        Ex: main({'Exchange': 'Binance', 'Pair': 'BTCUSDT', ..., 'TP %': tp, ...} for tp in [1.0, 1.5, 2.0])
+    """
+    args = parse_args()
     config = Configuration.get_config()
-    # Load test cases from Excel file
-    test_cases_df = load_test_cases_from_file(config['output']['test_cases_file_path'])
+    if args.queue_worker:
+        warnings.simplefilter("ignore", ResourceWarning)
+        if args.workers > 1:
+            run_queue_workers(args.queue, args.workers)
+        else:
+            run_queue_worker(args.queue)
+        DbResultsWriter.close_all()
+        return
+
+    # Load test cases from the test cases file (xlsx, csv, jsonl, yaml), all validated before any of them is run
+    test_cases_df = load_test_cases(test_cases if test_cases is not None else config['output']['test_cases_file_path'],
+                                    expand=not (args.walk_forward or args.optimize))
     # print(test_cases_df.to_string())
 
-    # Create an empty DataFrame with only headers to store Statistics
-    statistics_df = stats_utils.get_initial_statistics_df()
+    if args.walk_forward:
+        run_walk_forward(test_cases_df, config, args.workers)
+        return
+    if args.optimize:
+        run_optimization(test_cases_df, config, args.workers)
+        return
+
+    # Statistics of the test cases, one row per test case
+    statistics = ResultsAccumulator()
 
     # Disable ResourceWarning, pybit library seems to not be closing its ssl.SSLSocket properly
     warnings.simplefilter("ignore", ResourceWarning)
 
     # Run back test each test case
-    for index, row in test_cases_df.iterrows():
-        params = {
-            'Test_Num': int(index)
-            , 'Exchange': row.Exchange
-            , 'Pair': row.Pair
-            , 'From_Time': row.From
-            , 'To_Time': row.To
-            , 'Interval': row.Interval
-            , 'Initial_Capital': float(config['trades']['initial_capital'])
-            , 'Take_Profit_PCT': row['TP %']
-            , 'Stop_Loss_PCT': row['SL %']
-            , 'Strategy': row['Strategy']
-            , 'Exit_Strategy': row['Exit_Strategy']
-            , 'StrategySettings': row['Optional Strategy Settings']
-            , 'Statistics': statistics_df
-        }
-
-        backtest(params)
-        statistics_df = params['Statistics']
+    # Test cases sharing the same candles are run together, the candles are loaded once per dataset
+    params_list = [get_test_case_params(index, row, config) for index, row in test_cases_df.iterrows()]
+    groups = plan_datasets(params_list)
+    if args.enqueue:
+        statistics = run_queue_coordinator(groups, args.queue)
+    elif args.workers > 1 and len(params_list) > 1:
+        statistics = run_test_cases_in_pool(groups, statistics, min(args.workers, len(params_list)))
+    elif args.prefetch > 0:
+        statistics = run_test_cases_pipelined(groups, statistics, args.prefetch)
+    else:
+        statistics = run_test_cases(groups, statistics)
 
     warnings.simplefilter("default", ResourceWarning)
 
+    # Wait for the statistics queued for the database to be written
+    DbResultsWriter.close_all()
+
     # Save results to file
     now = datetime.now().strftime('[%Y-%m-%d] [%H.%M.%S]')
-    statistics_df = statistics_df.set_index('Test #')
-    if 'csv' in config['output']['output_file_format']:
-        filename = f"{config['output']['results_path']}\\Statistics - {now}.csv"
-        statistics_df.to_csv(filename, index=True, header=True)
-        print(f'Stats file created => [{filename}]')
-
-    if 'xlsx' in config['output']['output_file_format']:
-        filename = f"{config['output']['results_path']}\\Statistics - {now}.xlsx"
-        statistics_df.to_excel(filename, index=True, header=True)
-        print(f'Stats file created => [{filename}]')
+    statistics.save(config['output']['results_path'], config['output']['output_file_format'], now)
 
     # Display Results DataFrame to Console
-    # print(statistics_df.to_string())
-    print(statistics_df.to_markdown())
+    print(ResultsAccumulator.format_dataframe(statistics.get_sorted_dataframe()).to_markdown())
 
 
 if __name__ == "__main__":
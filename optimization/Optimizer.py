@@ -0,0 +1,234 @@
+"""
+    Search of the best settings of a test case among the values of its swept parameters
+    (see params.get_sweep_values), without running every combination of them.
+    1) Successive halving: random candidates are run on a short date range at the beginning of the test case range,
+       the best 1/reduction_factor of them are run on a range reduction_factor times longer, and so on up to the
+       full range.
+    2) Tree-structured Parzen Estimator (TPE): new candidates are proposed from the scores of the candidates already
+       run on the full range. With pruning, a proposed candidate is first run on the shortest range and stopped
+       there if its score is below the median score of that range.
+    The candidates are run by a pool of worker processes reading the candles of the full range once.
+"""
+import datetime as dt
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from Configuration import Configuration
+from optimization import optimization_utils
+from optimization.TpeSampler import TpeSampler
+from params import get_sweep_values
+
+
+class Optimizer:
+
+    def __init__(self, params, objective='Total P/L', initial_candidates=27, reduction_factor=3, min_days=30,
+                 trials=50, prune=True, seed=None, workers=1):
+        """
+            params: params of the test case, with its swept parameters not expanded
+        """
+        self.params = params
+        self.objective = objective
+        self.initial_candidates = initial_candidates
+        self.reduction_factor = reduction_factor
+        self.min_days = min_days
+        self.trials = trials
+        self.prune = prune
+        self.workers = workers
+
+        # Search space: the values of the swept strategy settings, TP % and SL %
+        settings = params['StrategySettings'] if isinstance(params['StrategySettings'], dict) else {}
+        self.keys = list(settings.keys())
+        self.dimensions = [get_sweep_values(settings[k]) for k in self.keys]
+        self.dimensions += [get_sweep_values(params['Take_Profit_PCT']), get_sweep_values(params['Stop_Loss_PCT'])]
+        self.sampler = TpeSampler(self.dimensions, seed=seed)
+
+        self.executor = None
+        self.rows = []
+        # {candidate: score} of the candidates run on the full range
+        self.scores = {}
+        # Candidates eliminated by the successive halving, pruned, or which could not be run
+        self.rejected = []
+        # Scores on the shortest range, used to prune the TPE candidates
+        self.first_rung_scores = []
+        self.trials_df = None
+        self.summary = None
+
+    @classmethod
+    def from_config(cls, params, workers=1):
+        settings = Configuration.get_config().get('optimization', {}).get('search', {})
+        return cls(params,
+                   objective=settings.get('objective', 'Total P/L'),
+                   initial_candidates=settings.get('initial_candidates', 27),
+                   reduction_factor=settings.get('reduction_factor', 3),
+                   min_days=settings.get('min_days', 30),
+                   trials=settings.get('trials', 50),
+                   prune=settings.get('prune', True),
+                   seed=settings.get('seed'),
+                   workers=workers)
+
+    def get_rung_days(self):
+        """
+            Returns the length in days of the date ranges of the successive halving, the last one is the full range
+        """
+        days = (self.params['To_Time'] - self.params['From_Time']).total_seconds() / 86400
+        rungs = [days]
+        while rungs[0] / self.reduction_factor >= self.min_days and \
+                self.initial_candidates >= self.reduction_factor ** len(rungs):
+            rungs.insert(0, rungs[0] / self.reduction_factor)
+        return rungs
+
+    def get_candidate_params(self, candidate, days=None):
+        """
+            Returns the params of the candidate on the first days of the test case range (the full range by default)
+        """
+        values = [self.dimensions[d][i] for d, i in enumerate(candidate)]
+        settings = dict(zip(self.keys, values[:-2])) if len(self.keys) > 0 else self.params['StrategySettings']
+        to_time = self.params['To_Time']
+        if days is not None:
+            to_time = min(self.params['From_Time'] + dt.timedelta(days=days) - dt.timedelta(seconds=1), to_time)
+        return dict(self.params, To_Time=to_time, Take_Profit_PCT=float(values[-2]),
+                    Stop_Loss_PCT=float(values[-1]), StrategySettings=settings)
+
+    def evaluate(self, candidates, days, stage):
+        """
+            Run the candidates on the first days of the test case range (the full range if None),
+            returns their scores
+        """
+        tasks = [(self.get_candidate_params(candidate, days), self.objective) for candidate in candidates]
+        if self.executor is not None:
+            scores = list(self.executor.map(optimization_utils.evaluate, tasks))
+        else:
+            scores = [optimization_utils.evaluate(task) for task in tasks]
+        for (params, _), score in zip(tasks, scores):
+            self.rows.append({
+                'Trial': len(self.rows) + 1,
+                'Stage': stage,
+                'To': params['To_Time'],
+                'TP %': params['Take_Profit_PCT'],
+                'SL %': params['Stop_Loss_PCT'],
+                'Settings': json.dumps(params['StrategySettings']) if params['StrategySettings'] else None,
+                self.objective: score
+            })
+        return scores
+
+    def successive_halving(self, rungs):
+        candidates = set()
+        while len(candidates) < min(self.initial_candidates, self.sampler.get_size()):
+            candidates.add(self.sampler.sample_random())
+        candidates = sorted(candidates)
+
+        for r, days in enumerate(rungs):
+            last = r == len(rungs) - 1
+            scores = self.evaluate(candidates, None if last else days, f'Halving {r + 1}/{len(rungs)}')
+            if r == 0:
+                self.first_rung_scores = [s for s in scores if s is not None]
+            if last:
+                for candidate, score in zip(candidates, scores):
+                    if score is not None:
+                        self.scores[candidate] = score
+                    else:
+                        self.rejected.append(candidate)
+                break
+            ranked = sorted([(score, c) for c, score in zip(candidates, scores) if score is not None], reverse=True)
+            nb_kept = max(1, len(candidates) // self.reduction_factor)
+            self.rejected += [c for c, score in zip(candidates, scores) if score is None]
+            self.rejected += [c for _, c in ranked[nb_kept:]]
+            candidates = [c for _, c in ranked[:nb_kept]]
+            print(f'\nSuccessive halving: {len(candidates)} candidates kept for the next date range.')
+
+    def tpe_search(self, rungs):
+        excluded = set(self.scores.keys()) | set(self.rejected)
+        nb_trials = 0
+        while nb_trials < self.trials:
+            # One candidate per worker process. The scores of the batch are only known after it has run
+            batch = []
+            for _ in range(min(self.workers, self.trials - nb_trials)):
+                candidate = self.sampler.suggest(self.scores, self.rejected, excluded)
+                if candidate is None:
+                    break
+                batch.append(candidate)
+                excluded.add(candidate)
+            if len(batch) == 0:
+                print('\nAll the candidates of the search space have been evaluated.')
+                break
+            nb_trials += len(batch)
+
+            if self.prune and len(rungs) > 1 and len(self.first_rung_scores) > 0:
+                threshold = float(np.median(self.first_rung_scores))
+                scores = self.evaluate(batch, rungs[0], 'TPE pruning')
+                self.first_rung_scores += [s for s in scores if s is not None]
+                self.rejected += [c for c, s in zip(batch, scores) if s is None or s < threshold]
+                batch = [c for c, s in zip(batch, scores) if s is not None and s >= threshold]
+
+            for candidate, score in zip(batch, self.evaluate(batch, None, 'TPE')):
+                if score is not None:
+                    self.scores[candidate] = score
+                else:
+                    self.rejected.append(candidate)
+
+    def run(self):
+        rungs = self.get_rung_days()
+        print(f"Optimization of test #{self.params['Test_Num']}: {self.sampler.get_size()} candidates, "
+              f"date ranges of {[round(days, 1) for days in rungs]} days, {self.trials} TPE trials "
+              f"with {self.workers} worker processes.")
+        init_args = (self.params['From_Time'], self.params['To_Time'],
+                     optimization_utils.get_priors([self.params]))
+        if self.workers > 1:
+            with ProcessPoolExecutor(max_workers=self.workers, initializer=optimization_utils.init_worker,
+                                     initargs=init_args) as self.executor:
+                self.successive_halving(rungs)
+                self.tpe_search(rungs)
+            self.executor = None
+        else:
+            optimization_utils.init_worker(*init_args)
+            self.successive_halving(rungs)
+            self.tpe_search(rungs)
+
+        self.trials_df = pd.DataFrame(self.rows).set_index('Trial')
+        self.summary = self.get_summary()
+        return self.summary
+
+    def get_summary(self):
+        summary = {
+            'Test #': self.params['Test_Num'],
+            'Exchange': self.params['Exchange'],
+            'Pair': self.params['Pair'],
+            'Interval': self.params['Interval'],
+            'Strategy': self.params['Strategy'],
+            'Candidates': self.sampler.get_size(),
+            'Runs': len(self.rows),
+            'Full Range Runs': len([row for row in self.rows if row['To'] == self.params['To_Time']]),
+            'Objective': self.objective,
+            'Best Score': None,
+            'TP %': None,
+            'SL %': None,
+            'Settings': None
+        }
+        if len(self.scores) > 0:
+            best = max(self.scores.keys(), key=lambda c: self.scores[c])
+            params = self.get_candidate_params(best)
+            summary.update({'Best Score': float(self.scores[best]), 'TP %': params['Take_Profit_PCT'],
+                            'SL %': params['Stop_Loss_PCT'],
+                            'Settings': json.dumps(params['StrategySettings']) if params['StrategySettings'] else None})
+        return summary
+
+    def save(self, results_path, file_formats, now):
+        filename = os.path.join(results_path, f"Optimization {self.params['Test_Num']} - {now}")
+        summary_df = pd.DataFrame([self.summary]).set_index('Test #')
+        if 'csv' in file_formats:
+            self.trials_df.to_csv(filename + ' Trials.csv', index=True, header=True)
+            summary_df.to_csv(filename + ' Summary.csv', index=True, header=True)
+            print(f'Optimization files created => [{filename} Trials/Summary.csv]')
+        if 'xlsx' in file_formats:
+            with pd.ExcelWriter(filename + '.xlsx') as writer:
+                summary_df.to_excel(writer, sheet_name='Summary', index=True, header=True)
+                self.trials_df.to_excel(writer, sheet_name='Trials', index=True, header=True)
+            print(f'Optimization file created => [{filename}.xlsx]')
+        if 'parquet' in file_formats:
+            self.trials_df.to_parquet(filename + ' Trials.parquet', index=True)
+            summary_df.to_parquet(filename + ' Summary.parquet', index=True)
+            print(f'Optimization files created => [{filename} Trials/Summary.parquet]')
@@ -0,0 +1,94 @@
+"""
+    Tree-structured Parzen Estimator (TPE) over a discrete search space.
+    The evaluated candidates are split into the good ones (best scores) and the bad ones (the others, and the
+    candidates that were stopped or could not be run). The density of each value of each dimension is estimated for
+    both groups, and the next candidate is the one maximizing good density / bad density among candidates drawn from
+    the good density.
+    A candidate is a tuple with the index of its value in each dimension.
+"""
+import math
+
+import numpy as np
+
+
+class TpeSampler:
+
+    def __init__(self, dimensions, gamma=0.25, nb_draws=24, seed=None):
+        """
+            dimensions: list of the values of each dimension
+            gamma: fraction of the scored candidates counted as good
+            nb_draws: number of candidates drawn from the good density to choose the next candidate
+        """
+        self.dimensions = dimensions
+        self.gamma = gamma
+        self.nb_draws = nb_draws
+        self.rng = np.random.default_rng(seed)
+        # Numeric values are ordered, the density of a value is spread to its neighbours
+        self.ranks = [self.get_ranks(values) for values in dimensions]
+
+    @staticmethod
+    def get_ranks(values):
+        """
+            Returns the rank of each value if all values are numbers, otherwise None (categorical dimension)
+        """
+        if not all(isinstance(x, (int, float)) and not isinstance(x, bool) for x in values):
+            return None
+        return np.argsort(np.argsort(values, kind='stable'), kind='stable').astype(float)
+
+    def get_size(self):
+        return math.prod(len(values) for values in self.dimensions)
+
+    def sample_random(self):
+        return tuple(int(self.rng.integers(len(values))) for values in self.dimensions)
+
+    def get_density(self, d, indexes):
+        """
+            Returns the probability of each value of dimension d, estimated from the values of the candidates
+            (indexes) and a uniform prior
+        """
+        size = len(self.dimensions[d])
+        density = np.full(size, 1.0 / size)
+        ranks = self.ranks[d]
+        if ranks is None:
+            for i in indexes:
+                density[i] += 1.0
+        elif len(indexes) > 0:
+            # Bandwidth shrinks as the number of candidates grows
+            sigma = max(1.0, (size - 1) / math.sqrt(len(indexes)) / 2)
+            for i in indexes:
+                kernel = np.exp(-0.5 * ((ranks - ranks[i]) / sigma) ** 2)
+                density += kernel / kernel.sum()
+        return density / density.sum()
+
+    def split(self, scores, rejected):
+        """
+            scores: {candidate: score} of the scored candidates
+            rejected: candidates stopped or not run, counted as bad
+            Returns the good and the bad candidates
+        """
+        ranked = sorted(scores.keys(), key=lambda c: scores[c], reverse=True)
+        nb_good = math.ceil(self.gamma * len(ranked))
+        return ranked[:nb_good], ranked[nb_good:] + list(rejected)
+
+    def suggest(self, scores, rejected, excluded):
+        """
+            Returns the next candidate to evaluate, not in excluded, or None if all candidates are excluded
+        """
+        if len(excluded) >= self.get_size():
+            return None
+        good, bad = self.split(scores, rejected)
+        if len(good) > 0:
+            good_densities = [self.get_density(d, [c[d] for c in good]) for d in range(len(self.dimensions))]
+            bad_densities = [self.get_density(d, [c[d] for c in bad]) for d in range(len(self.dimensions))]
+            draws = np.column_stack([self.rng.choice(len(p), size=self.nb_draws, p=p) for p in good_densities])
+            ratios = sum(np.log(good_densities[d][draws[:, d]]) - np.log(bad_densities[d][draws[:, d]])
+                         for d in range(len(self.dimensions)))
+            for i in np.argsort(-ratios, kind='stable'):
+                candidate = tuple(int(x) for x in draws[i])
+                if candidate not in excluded:
+                    return candidate
+        # No good candidate yet, or all the draws were already evaluated
+        while True:
+            candidate = self.sample_random()
+            if candidate not in excluded:
+                return candidate
@@ -0,0 +1,200 @@
+"""
+    Walk-forward optimization of the settings of a strategy.
+    The test case range is split into rolling windows: the settings are optimized on an in-sample window,
+    then the best settings are evaluated on the out-of-sample window that follows it, and both windows are moved
+    forward by the out-of-sample length. With anchored windows, all in-sample windows start at the beginning
+    of the range.
+    The candidate settings are the expansion of the swept parameters of the test case (see params.expand_test_cases).
+    The candles of the whole range are read once per process and the windows are slices of them, the in-sample
+    searches of all the windows are run in parallel by a pool of worker processes.
+    The out-of-sample windows are chained, each one starting with the capital at the end of the previous one,
+    into a single out-of-sample equity curve.
+"""
+import datetime as dt
+import json
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from Configuration import Configuration
+from optimization import optimization_utils
+from stats import stats_utils
+
+
+class WalkForward:
+
+    def __init__(self, candidates, in_sample_days=90, out_of_sample_days=30, anchored=False,
+                 objective='Total P/L', workers=1):
+        """
+            candidates: params of the test case for each candidate settings, all over the same range
+        """
+        self.candidates = candidates
+        self.params = candidates[0]
+        self.in_sample = dt.timedelta(days=in_sample_days)
+        self.out_of_sample = dt.timedelta(days=out_of_sample_days)
+        self.anchored = anchored
+        self.objective = objective
+        self.workers = workers
+        self.windows_df = None
+        self.equity = None
+        self.summary = None
+
+    @classmethod
+    def from_config(cls, candidates, workers=1):
+        settings = Configuration.get_config().get('optimization', {}).get('walk_forward', {})
+        return cls(candidates,
+                   in_sample_days=settings.get('in_sample_days', 90),
+                   out_of_sample_days=settings.get('out_of_sample_days', 30),
+                   anchored=settings.get('anchored', False),
+                   objective=settings.get('objective', 'Total P/L'),
+                   workers=workers)
+
+    def get_windows(self):
+        """
+            Returns the list of (in-sample from, in-sample to, out-of-sample from, out-of-sample to), bounds included
+        """
+        from_time, to_time = self.params['From_Time'], self.params['To_Time']
+        one_second = dt.timedelta(seconds=1)
+        windows = []
+        oos_from = from_time + self.in_sample
+        while oos_from <= to_time:
+            is_from = from_time if self.anchored else oos_from - self.in_sample
+            oos_to = min(oos_from + self.out_of_sample - one_second, to_time)
+            windows.append((is_from, oos_from - one_second, oos_from, oos_to))
+            oos_from += self.out_of_sample
+        if len(windows) == 0:
+            raise Exception(f'The range [{from_time}, {to_time}] is shorter than the in-sample window '
+                            f'({self.in_sample.days} days). Unable to run the walk-forward optimization.')
+        return windows
+
+    @staticmethod
+    def get_window_params(params, from_time, to_time):
+        return dict(params, From_Time=from_time, To_Time=to_time)
+
+    def search_in_sample(self, windows):
+        """
+            Returns the scores of all candidates on all in-sample windows, scores[window][candidate]
+        """
+        tasks = [(self.get_window_params(params, is_from, is_to), self.objective)
+                 for is_from, is_to, _, _ in windows for params in self.candidates]
+        init_args = (self.params['From_Time'], self.params['To_Time'], optimization_utils.get_priors(self.candidates))
+        print(f'Walk-forward: {len(windows)} windows x {len(self.candidates)} candidates, '
+              f'{len(tasks)} in-sample runs with {self.workers} worker processes.')
+        if self.workers > 1:
+            # Consecutive tasks run on the same window, sending them in chunks lets a worker reuse their indicators
+            chunk_size = max(1, math.ceil(len(self.candidates) / self.workers))
+            with ProcessPoolExecutor(max_workers=self.workers, initializer=optimization_utils.init_worker,
+                                     initargs=init_args) as executor:
+                scores = list(executor.map(optimization_utils.evaluate, tasks, chunksize=chunk_size))
+        else:
+            optimization_utils.init_worker(*init_args)
+            scores = [optimization_utils.evaluate(task) for task in tasks]
+        n = len(self.candidates)
+        return [scores[i * n:(i + 1) * n] for i in range(len(windows))]
+
+    @staticmethod
+    def get_best_candidate(scores):
+        best = None
+        for i, score in enumerate(scores):
+            if score is not None and (best is None or score > scores[best]):
+                best = i
+        return best
+
+    def run(self):
+        windows = self.get_windows()
+        scores = self.search_in_sample(windows)
+
+        # The out-of-sample windows are run one after the other, each one starts with the capital left by the previous
+        optimization_utils.init_worker(self.params['From_Time'], self.params['To_Time'],
+                                       optimization_utils.get_priors(self.candidates))
+        capital = float(self.params['Initial_Capital'])
+        rows, curves = [], []
+        for k, (is_from, is_to, oos_from, oos_to) in enumerate(windows):
+            best = self.get_best_candidate(scores[k])
+            row = {'Window': k + 1, 'IS From': is_from, 'IS To': is_to, 'OOS From': oos_from, 'OOS To': oos_to}
+            if best is None:
+                print(f'\nWalk-forward window #{k + 1}: no candidate could be run on the in-sample window.')
+                rows.append(row)
+                continue
+            params = self.candidates[best]
+            row.update({'TP %': params['Take_Profit_PCT'], 'SL %': params['Stop_Loss_PCT'],
+                        'Settings': json.dumps(params['StrategySettings']) if params['StrategySettings'] else None,
+                        f'IS {self.objective}': scores[k][best], 'OOS Capital': round(capital, 2)})
+
+            oos_params = self.get_window_params(params, oos_from, oos_to)
+            oos_params['Initial_Capital'] = capital
+            try:
+                strategy = optimization_utils.run_strategy(oos_params)
+            except Exception as e:
+                # Ex: the last out-of-sample window is too short to run the strategy
+                print(f'\nWalk-forward window #{k + 1}: unable to run the out-of-sample window. {e}')
+                rows.append(row)
+                continue
+
+            # Only the candles of the window are counted, the prior candles belong to the previous window
+            equity = optimization_utils.get_equity(strategy)
+            before = equity[equity.index < oos_from]
+            start_equity = float(before.iloc[-1]) if len(before.index) > 0 else capital
+            window_df = strategy.df[(strategy.df.index >= oos_from) & (strategy.df.index <= oos_to)]
+            curve = equity.loc[window_df.index] - start_equity + capital
+            pl = float(curve.iloc[-1]) - capital if len(curve.index) > 0 else 0.0
+            row.update({'OOS Trades': int((window_df['win'] != 0).sum() + (window_df['loss'] != 0).sum()),
+                        'OOS Wins': int((window_df['win'] != 0).sum()),
+                        'OOS Losses': int((window_df['loss'] != 0).sum()),
+                        'OOS P/L': round(pl, 2),
+                        'OOS Return %': round(pl / capital * 100, 2)})
+            rows.append(row)
+            curves.append(curve)
+            capital += pl
+
+        self.windows_df = pd.DataFrame(rows).set_index('Window')
+        self.equity = pd.concat(curves).rename('Equity') if len(curves) > 0 else pd.Series(name='Equity', dtype=float)
+        self.summary = self.get_summary()
+        return self.summary
+
+    def get_summary(self):
+        initial_capital = float(self.params['Initial_Capital'])
+        final_capital = float(self.equity.iloc[-1]) if len(self.equity.index) > 0 else initial_capital
+        wins = int(self.windows_df.get('OOS Wins', pd.Series(dtype=float)).sum())
+        losses = int(self.windows_df.get('OOS Losses', pd.Series(dtype=float)).sum())
+        return {
+            'Test #': self.params['Test_Num'],
+            'Exchange': self.params['Exchange'],
+            'Pair': self.params['Pair'],
+            'Interval': self.params['Interval'],
+            'Strategy': self.params['Strategy'],
+            'Windows': len(self.windows_df.index),
+            'Candidates': len(self.candidates),
+            'Objective': self.objective,
+            'Init Capital': round(initial_capital, 2),
+            'Final Capital': round(final_capital, 2),
+            'Total P/L': round(final_capital - initial_capital, 2),
+            'Return %': round((final_capital / initial_capital - 1) * 100, 2),
+            'Max Drawdown %': round(stats_utils.get_max_drawdown_pct(self.equity), 2),
+            'Trades': wins + losses,
+            'Wins': wins,
+            'Losses': losses,
+            'Win Rate': round(wins / (wins + losses) * 100, 1) if wins + losses > 0 else 0
+        }
+
+    def save(self, results_path, file_formats, now):
+        filename = os.path.join(results_path, f"Walk Forward {self.params['Test_Num']} - {now}")
+        summary_df = pd.DataFrame([self.summary]).set_index('Test #')
+        if 'csv' in file_formats:
+            self.windows_df.to_csv(filename + ' Windows.csv', index=True, header=True)
+            self.equity.to_csv(filename + ' Equity.csv', index=True, header=True)
+            summary_df.to_csv(filename + ' Summary.csv', index=True, header=True)
+            print(f'Walk-forward files created => [{filename} Windows/Equity/Summary.csv]')
+        if 'xlsx' in file_formats:
+            with pd.ExcelWriter(filename + '.xlsx') as writer:
+                summary_df.to_excel(writer, sheet_name='Summary', index=True, header=True)
+                self.windows_df.to_excel(writer, sheet_name='Windows', index=True, header=True)
+                self.equity.to_excel(writer, sheet_name='Equity', index=True, header=True)
+            print(f'Walk-forward file created => [{filename}.xlsx]')
+        if 'parquet' in file_formats:
+            self.windows_df.to_parquet(filename + ' Windows.parquet', index=True)
+            self.equity.to_frame().to_parquet(filename + ' Equity.parquet', index=True)
+            summary_df.to_parquet(filename + ' Summary.parquet', index=True)
+            print(f'Walk-forward files created => [{filename} Windows/Equity/Summary.parquet]')
@@ -0,0 +1,39 @@
+"""
+    Objectives maximized by the optimizations.
+    An objective takes a strategy whose trades have been simulated (BaseStrategy.simulate()) and returns its score,
+    the higher the better.
+"""
+from stats import stats_utils
+
+# Drawdowns smaller than this are counted as this value, a run with almost no drawdown does not get an infinite score
+MIN_DRAWDOWN_PCT = 1.0
+
+
+def total_pl(strategy):
+    return strategy.stats.total_pl
+
+
+def win_rate(strategy):
+    return strategy.stats.win_rate
+
+
+def return_over_drawdown(strategy):
+    """
+        Return % of the initial capital divided by the maximum drawdown % of the equity
+    """
+    return_pct = strategy.stats.total_pl / strategy.params['Initial_Capital'] * 100
+    drawdown_pct = -stats_utils.get_max_drawdown_pct(stats_utils.get_equity(strategy.df))
+    return return_pct / max(drawdown_pct, MIN_DRAWDOWN_PCT)
+
+
+OBJECTIVES = {
+    'Total P/L': total_pl,
+    'Win Rate': win_rate,
+    'Return / Drawdown': return_over_drawdown
+}
+
+
+def get_objective(name):
+    if name not in OBJECTIVES:
+        raise Exception(f'Unsupported objective: [{name}]. Supported objectives: {list(OBJECTIVES.keys())}.')
+    return OBJECTIVES[name]
@@ -0,0 +1,81 @@
+"""
+    Helper functions shared by the optimizations.
+    Candidate settings are evaluated by worker processes: each worker reads the candles of the optimized range once
+    (CandleDataSet) and runs all the candidates it receives on slices of these candles.
+"""
+import importlib
+import traceback
+import warnings
+
+import constants
+from Configuration import Configuration
+from database.CandleDataSet import CandleDataSet
+from optimization import objectives
+from params import validate_params
+from stats import stats_utils
+
+# Candles of the optimized range, shared by the candidates evaluated by this process
+_dataset = None
+
+
+def get_strategy_class(name):
+    if name not in constants.VALID_STRATEGIES:
+        raise Exception(f'Invalid Parameter: Unsupported Strategy = [{name}]')
+    # Each strategy class is defined in the module of the same name
+    return getattr(importlib.import_module(f'strategies.{name}'), name)
+
+
+def get_priors(params_list):
+    """
+        Returns the largest include_prior of each interval read by these test cases
+    """
+    priors = {}
+    for params in params_list:
+        for interval, include_prior in get_strategy_class(params['Strategy']).get_candle_data_intervals(params):
+            priors[interval] = max(priors.get(interval, 0), include_prior)
+    return priors
+
+
+def init_worker(from_time, to_time, priors):
+    """
+        Run once by each process evaluating candidates, before its first candidate
+    """
+    global _dataset
+    Configuration.get_config()
+    # Disable ResourceWarning, pybit library seems to not be closing its ssl.SSLSocket properly
+    warnings.simplefilter("ignore", ResourceWarning)
+    _dataset = CandleDataSet(from_time, to_time, priors)
+
+
+def run_strategy(params):
+    """
+        Simulate the trades of a test case on the candles of the optimized range and return the strategy
+    """
+    validate_params(params)
+    params = dict(params, Candle_Data=_dataset)
+    strategy = get_strategy_class(params['Strategy'])(params)
+    strategy.simulate()
+    return strategy
+
+
+def evaluate(task):
+    """
+        Returns the score of a candidate, or None if the strategy could not be run (Ex: not enough candles, or a
+        value rejected by the decode_param_settings() of the strategy).
+        Invalid settings keys are reported when the test cases are loaded (see params.prepare_test_cases()).
+    """
+    params, objective = task
+    try:
+        return objectives.get_objective(objective)(run_strategy(params))
+    except Exception:
+        print(f"\nUnable to evaluate {params['Strategy']} {params['StrategySettings']} "
+              f"from {params['From_Time']} to {params['To_Time']}.")
+        traceback.print_exc()
+        return None
+
+
+def get_equity(strategy):
+    """
+        Returns the equity of the strategy after each candle: wallet + amount staked in the current trade
+    """
+    return stats_utils.get_equity(strategy.df)
@@ -1,3 +1,6 @@
+import itertools
+import math
+import os
 import warnings
 import json
 import numpy as np
@@ -8,10 +11,22 @@ import rapidjson
 
 import constants
 from Configuration import Configuration
+import utils
 from utils import read_excel_to_dataframe
 
 config = Configuration.get_config()
 
+# Columns of the test cases, Optional Strategy Settings can be omitted
+TEST_CASE_COLUMNS = ['Exchange', 'Pair', 'From', 'To', 'Interval', 'TP %', 'SL %', 'Strategy', 'Exit_Strategy']
+TEST_CASES_FILE_FORMATS = ['xlsx', 'csv', 'jsonl', 'yaml']
+# Only the first test cases are printed when loading a long list of test cases
+MAX_TEST_CASES_PRINTED = 50
+MAX_ERRORS_PRINTED = 50
+# Value of the invalid Optional Strategy Settings
+INVALID = object()
+# Keys of a range of values of a swept parameter
+RANGE_KEYS = {'start', 'stop', 'step'}
+
 
 def print_parameters(params, all=False):
     """
@@ -49,7 +64,8 @@ def validate_params(params):
     if params['From_Time'] > params['To_Time']:
         raise Exception(f'Invalid date range. {params["From_Time"]} must be <= {params["To_Time"]}.')
 
-    if params["Interval"] not in constants.VALID_INTERVALS:
+    # Intervals outside of VALID_INTERVALS can be used, they are derived from the 1m candles
+    if not utils.is_valid_interval(params["Interval"]):
         raise Exception(f'Invalid Parameter: Interval = [{params["Interval"]}].')
 
     initial_capital = params["Initial_Capital"]
@@ -86,43 +102,284 @@ def validate_params(params):
     config['output']['output_file_format'] = [x.lower() for x in config['output']['output_file_format']]
 
 
-def load_test_cases_from_file(filename):
-    print(f'\nLoading test cases from file => [{filename}]')
+def read_test_cases_file(filename):
+    """
+        Returns the test cases of a TestCases file: xlsx, csv, jsonl (one test case per line) or yaml (list of test
+        cases). The columns (keys) are the ones of TestCases.xlsx, 'Test #' being optional.
+    """
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == '.xlsx':
+        # Disable warning because openpyxl issues warnings because the TestCases.xlsx
+        # file uses dropdown to enforce integrity of values passed
+        warnings.simplefilter("ignore", UserWarning)
+        df = read_excel_to_dataframe(filename)
+        warnings.simplefilter("default", UserWarning)
+        return df
+    elif extension == '.csv':
+        df = pd.read_csv(filename)
+        return records_to_dataframe(df.to_dict('records'))
+    elif extension == '.jsonl':
+        # Settings and swept parameters are JSON values, not strings to parse
+        with open(filename, 'r') as file:
+            return records_to_dataframe(json.loads(line) for line in file if line.strip())
+    elif extension in ['.yaml', '.yml']:
+        import yaml
+        with open(filename, 'r') as file:
+            return records_to_dataframe(yaml.safe_load(file) or [])
+    else:
+        raise Exception(f'Unsupported test cases file: [{filename}]. '
+                        f'Supported formats: {", ".join(TEST_CASES_FILE_FORMATS)}.')
 
-    # Disable warning because openpyxl issues warnings because the TestCases.xlsx
-    # file uses dropdown to enforce integrity of values passed
-    warnings.simplefilter("ignore", UserWarning)
-    df = read_excel_to_dataframe(filename)
-    warnings.simplefilter("default", UserWarning)
 
-    df.dropna(subset=['Exchange'], inplace=True)
+def records_to_dataframe(records):
+    """
+        Returns the DataFrame of an iterable of test cases, each test case being a dictionary with the columns
+        of TestCases.xlsx. Test cases without 'Test #' are numbered from 1.
+    """
+    df = pd.DataFrame.from_records(list(records))
+    if 'Test #' in df.columns:
+        return df.set_index('Test #')
+    df.index = pd.RangeIndex(1, len(df.index) + 1, name='Test #')
+    return df
 
-    # Adjust column types
-    df.index = df.index.astype(int)
-    df['From'] = df['From'].astype('datetime64[ns]')
-    df['To'] = df['To'].astype('datetime64[ns]')
-    df['Interval'] = df['Interval'].astype(str)
-    df['TP %'] = df['TP %'].astype(float)
-    df['SL %'] = df['SL %'].astype(float)
 
-    # Convert Optional Strategy Settings column to dictionary
+def load_test_cases(source, expand=True):
+    """
+        source: name of a TestCases file (see read_test_cases_file), DataFrame or iterable of test cases
+        (see records_to_dataframe), Ex: a generator of test cases.
+        expand: expand the test cases with swept parameters into one test case per combination of values,
+        otherwise the swept parameters are left as is (Ex: expanded for each test case by the optimizations)
+    """
+    if isinstance(source, str):
+        print(f'\nLoading test cases from file => [{source}]')
+        df = read_test_cases_file(source)
+    elif isinstance(source, pd.DataFrame):
+        df = source.copy()
+    else:
+        df = records_to_dataframe(source)
+
+    df = prepare_test_cases(df)
+    print_test_cases(df)
+
+    if expand:
+        nb_test_cases = len(df.index)
+        df = expand_test_cases(df)
+        if len(df.index) != nb_test_cases:
+            print(f'{nb_test_cases} test cases expanded into {len(df.index)} test cases.\n')
+
+    return df
+
+
+def load_test_cases_from_file(filename, expand=True):
+    return load_test_cases(filename, expand)
+
+
+def parse_settings(values):
+    """
+        Returns the Optional Strategy Settings as dictionaries (None if empty), and the mask of the invalid ones.
+        Settings given as JSON text (xlsx, csv) are parsed once per distinct text.
+    """
+    parsed = {}
+    for text in pd.unique(values[values.map(lambda x: isinstance(x, str))]):
+        try:
+            parsed[text] = json.loads(text) if text.strip() else None
+        except json.decoder.JSONDecodeError:
+            parsed[text] = INVALID
+        if parsed[text] is not None and not isinstance(parsed[text], dict):
+            parsed[text] = INVALID
+
+    def convert(x):
+        if isinstance(x, str):
+            return parsed[x]
+        if x is None or isinstance(x, dict):
+            return x
+        return None if isinstance(x, float) and math.isnan(x) else INVALID
+
+    settings = values.map(convert)
+    invalid = settings.map(lambda x: x is INVALID).to_numpy(dtype=bool)
+    return settings.where(~invalid, None), invalid
+
+
+def parse_number(value):
+    """
+        Numbers read as text (Ex: csv column mixing numbers and lists of values) are converted to float
+    """
+    if isinstance(value, str) and value.strip()[:1] not in ['[', '{']:
+        try:
+            return float(value)
+        except ValueError:
+            return value
+    return value
+
+
+def prepare_test_cases(df):
+    """
+        Convert the columns of the test cases to their types and validate all the test cases at once, before any of
+        them is run. Raises an Exception listing the invalid test cases.
+        The params of each test case are validated again by validate_params() when it is run.
+    """
+    missing = [c for c in TEST_CASE_COLUMNS if c not in df.columns]
+    if len(missing) > 0:
+        raise Exception(f'Missing test cases column(s): {missing}.')
+    if 'Optional Strategy Settings' not in df.columns:
+        df['Optional Strategy Settings'] = None
+
+    df = df.dropna(subset=['Exchange'])
+    errors = []
+
+    def add_errors(mask, message):
+        for test_num in df.index[mask]:
+            errors.append((test_num, message(test_num)))
+
     try:
-        if df['Optional Strategy Settings'].notnull().sum() != 0:
-            df['Optional Strategy Settings'] = df['Optional Strategy Settings'].apply(lambda x: json.loads(x))
-    except json.decoder.JSONDecodeError:
-        raise Exception(f'Invalid Optional Strategy Settings.\n '
-                        f"Incorrect dictionary format: {df['Optional Strategy Settings']}")
+        df.index = df.index.astype(int)
+    except (TypeError, ValueError):
+        raise Exception(f'Invalid Test # values: {list(df.index)}')
+    add_errors(df.index.duplicated(), lambda i: f'Duplicate Test #{i}')
+
+    exchanges = [x.lower() for x in constants.SUPPORTED_EXCHANGES]
+    add_errors(~df['Exchange'].astype(str).str.lower().isin(exchanges),
+               lambda i: f'Unsupported Exchange = [{df.loc[i, "Exchange"]}]')
+
+    for column in ['From', 'To']:
+        dates = pd.to_datetime(df[column], errors='coerce')
+        add_errors(dates.isnull().to_numpy(), lambda i: f'Invalid {column} = [{df.loc[i, column]}]')
+        df[column] = dates.astype('datetime64[ns]')
+    add_errors((df['From'] > df['To']).to_numpy(), lambda i: f'Invalid date range. From must be <= To')
+
+    df['Interval'] = df['Interval'].astype(str)
+    valid_intervals = {x: utils.is_valid_interval(x) for x in df['Interval'].unique()}
+    add_errors(~df['Interval'].map(valid_intervals).to_numpy(dtype=bool),
+               lambda i: f'Invalid Interval = [{df.loc[i, "Interval"]}]')
+
+    add_errors(~df['Strategy'].isin(constants.VALID_STRATEGIES).to_numpy(),
+               lambda i: f'Unsupported Strategy = [{df.loc[i, "Strategy"]}]')
+    add_errors(~df['Exit_Strategy'].isin(constants.VALID_EXIT_STRATEGIES).to_numpy(),
+               lambda i: f'Unsupported Exit Strategy = [{df.loc[i, "Exit_Strategy"]}]')
 
-    print_df = df.copy()
-    print_df['From'] = print_df['From'].apply(lambda x: dt.datetime.strftime(x, constants.DATE_FMT))
-    print_df['To'] = print_df['To'].apply(lambda x: dt.datetime.strftime(x, constants.DATE_FMT))
+    df['Optional Strategy Settings'], invalid = parse_settings(df['Optional Strategy Settings'])
+    add_errors(invalid, lambda i: 'Invalid Optional Strategy Settings, incorrect dictionary format')
+
+    df['TP %'] = df['TP %'].map(parse_number)
+    df['SL %'] = df['SL %'].map(parse_number)
+
+    # Imported here, optimization_utils imports this module
+    from optimization.optimization_utils import get_strategy_class
+    valid_settings_keys = {x: get_strategy_class(x).VALID_SETTINGS_KEYS
+                           for x in df['Strategy'].unique() if x in constants.VALID_STRATEGIES}
+
+    # Swept parameters: each of their values is checked
+    columns = ['TP %', 'SL %', 'Strategy', 'Optional Strategy Settings']
+    for test_num, (tp, sl, strategy, settings) in zip(df.index, df[columns].itertuples(index=False)):
+        try:
+            for name, value in [('TP %', tp), ('SL %', sl)]:
+                for x in get_sweep_values(value):
+                    if isinstance(x, bool) or not isinstance(x, (int, float)) or not x > 0:
+                        raise Exception(f'Invalid {name} = [{value}], must be positive numbers')
+            if settings:
+                invalid_keys = [k for k in settings.keys() if k not in valid_settings_keys.get(strategy, settings)]
+                if len(invalid_keys) > 0:
+                    raise Exception(f'Invalid key(s) {invalid_keys} in Optional Strategy Settings of {strategy}. '
+                                    f'Valid keys: {valid_settings_keys[strategy]}')
+                for value in settings.values():
+                    get_sweep_values(value)
+        except Exception as e:
+            errors.append((test_num, str(e)))
+
+    if len(errors) > 0:
+        errors.sort(key=lambda x: x[0])
+        lines = [f'Test #{test_num}: {message}' for test_num, message in errors[:MAX_ERRORS_PRINTED]]
+        if len(errors) > MAX_ERRORS_PRINTED:
+            lines.append(f'... and {len(errors) - MAX_ERRORS_PRINTED} more errors.')
+        raise Exception(f'{len(set(x[0] for x in errors))} invalid test cases:\n' + '\n'.join(lines))
+    return df
+
+
+def print_test_cases(df):
+    """
+        Print the test cases, only the first ones of a long list
+    """
+    print_df = df.head(MAX_TEST_CASES_PRINTED).copy()
+    print_df['From'] = print_df['From'].dt.strftime(constants.DATE_FMT)
+    print_df['To'] = print_df['To'].dt.strftime(constants.DATE_FMT)
 
     # Do not print options columns if they are empty
     if print_df['Optional Strategy Settings'].notnull().sum() == 0:
         del print_df["Optional Strategy Settings"]
     print('\n'+print_df.to_string(col_space={'Interval': 9, 'Exit_Strategy': 15})+'\n')
-    # print('\n'+df.to_markdown()+'\n')
+    if len(df.index) > MAX_TEST_CASES_PRINTED:
+        print(f'... {len(df.index)} test cases in total.\n')
+
+
+def get_range_values(start, stop, step):
+    """
+        Values of a {"start", "stop", "step"} range, stop included
+    """
+    if not step or step <= 0 or stop < start:
+        raise Exception(f'Invalid range: start={start}, stop={stop}, step={step}. '
+                        f'step must be > 0 and start <= stop.')
+    count = int(math.floor((stop - start) / step + 1e-9)) + 1
+    if all(isinstance(x, int) for x in [start, stop, step]):
+        return [start + i * step for i in range(count)]
+    # Rounding removes the floating point errors of the additions (Ex: 0.1 + 0.2)
+    return [round(start + i * step, 10) for i in range(count)]
+
+
+def get_sweep_values(value):
+    """
+        Returns the list of values of a test case parameter.
+        A parameter is swept when its value is a list of values, Ex: [50, 100, 200],
+        or a range {"start": 20, "stop": 40, "step": 5}. Other values are returned as a single value list.
+    """
+    # TP %/SL % cells contain the JSON text of the list or range
+    if isinstance(value, str) and value.strip()[:1] in ['[', '{']:
+        try:
+            value = json.loads(value)
+        except json.decoder.JSONDecodeError:
+            raise Exception(f'Invalid list or range of values: {value}')
+    if isinstance(value, list):
+        if len(value) == 0:
+            raise Exception('Invalid empty list of values.')
+        return value
+    if isinstance(value, dict) and set(value.keys()) & RANGE_KEYS:
+        if set(value.keys()) != RANGE_KEYS:
+            raise Exception(f'Invalid range: {json.dumps(value)}. A range has the keys start, stop and step.')
+        return get_range_values(value['start'], value['stop'], value['step'])
+    return [value]
+
+
+def expand_test_cases(df):
+    """
+        Expand the test cases with swept parameters (TP %, SL % and the values of Optional Strategy Settings)
+        into the cartesian product of their values. The expanded test cases are numbered from 1 in the order
+        of the original test cases, test cases without swept parameters are left unchanged.
+        The Original Test # column holds the number of the test case each test case was expanded from.
+    """
+    rows = []
+    expanded = False
+    for test_num, record in zip(df.index, df.to_dict('records')):
+        record['Original Test #'] = test_num
+        settings = record['Optional Strategy Settings']
+        settings = settings if isinstance(settings, dict) else {}
+        keys = list(settings.keys())
+        values = [get_sweep_values(settings[k]) for k in keys]
+        values += [get_sweep_values(record['TP %']), get_sweep_values(record['SL %'])]
+        for combination in itertools.product(*values):
+            new_record = dict(record)
+            if len(keys) > 0:
+                new_record['Optional Strategy Settings'] = dict(zip(keys, combination[:len(keys)]))
+            new_record['TP %'], new_record['SL %'] = combination[-2], combination[-1]
+            rows.append(new_record)
+        expanded = expanded or math.prod(len(x) for x in values) > 1
 
+    if expanded:
+        index_name = df.index.name
+        df = pd.DataFrame.from_records(rows, columns=list(df.columns) + ['Original Test #'])
+        df.index = pd.RangeIndex(1, len(rows) + 1, name=index_name)
+    else:
+        df = df.assign(**{'Original Test #': df.index})
+    df['TP %'] = df['TP %'].astype(float)
+    df['SL %'] = df['SL %'].astype(float)
     return df
 
 
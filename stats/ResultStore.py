@@ -0,0 +1,166 @@
+"""
+    Class that stores the Statistics row of each test case run, under a key hashing everything the result depends on:
+    the params of the test case, its strategy settings, the trades settings of the config, the exchange fees,
+    a fingerprint of the candles read and the version of the code of the strategy.
+    A test case whose key is already in the store is not run again, its stored row is reused. Rows are stored as
+    soon as a test case is finished, so a run that stopped (crash, Ctrl-C) resumes where it left off.
+    Rows are stored in the Test_Results_Statistics table (column 'Result Key') when the statistics are saved to
+    the database, otherwise in a Result_Store.jsonl file in the results folder. Tables created before the result
+    store need the 'Result Key' column added by database/migrate_db_tables.py, the result store is disabled until then.
+"""
+import hashlib
+import inspect
+import json
+import os
+import sys
+import threading
+
+import pandas as pd
+import sqlalchemy
+
+from Configuration import Configuration
+
+
+class ResultStore:
+    FILE_NAME = 'Result_Store.jsonl'
+    TABLE_NAME = 'Test_Results_Statistics'
+    KEY_COLUMN = 'Result Key'
+    CANDLE_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+    # Modules used by all the strategies to calculate the statistics, part of the code version
+    ENGINE_MODULES = ['stats.Statistics', 'stats.stats_utils']
+
+    # One store per database or results folder
+    _stores = {}
+    _lock = threading.Lock()
+    # Version of the code of each strategy class
+    _code_versions = {}
+
+    def __init__(self, db_engine=None, results_path=None):
+        self.db_engine = db_engine
+        self.path = None
+        if db_engine is None:
+            os.makedirs(results_path, exist_ok=True)
+            self.path = os.path.join(results_path, self.FILE_NAME)
+        self.lock = threading.Lock()
+        self.rows = self.load_from_db() if db_engine is not None else self.load_from_file()
+        print(f'Result store: {len(self.rows)} test results found.')
+
+    @classmethod
+    def get_store(cls, db_engine=None):
+        """
+            Returns the result store of the database (or of the results folder if db_engine is None),
+            or None if the result store is disabled
+        """
+        config = Configuration.get_config()
+        if not config['output'].get('result_store', False):
+            return None
+        key = str(db_engine.url) if db_engine is not None else config['output']['results_path']
+        with cls._lock:
+            if key not in cls._stores:
+                if db_engine is not None and not cls.has_key_column(db_engine):
+                    print(f'Result store disabled: the [{cls.TABLE_NAME}] table of [{db_engine.url.database}] has no '
+                          f'[{cls.KEY_COLUMN}] column. Run database/migrate_db_tables.py to add it.')
+                    cls._stores[key] = None
+                else:
+                    cls._stores[key] = ResultStore(db_engine, config['output']['results_path'])
+            return cls._stores[key]
+
+    @classmethod
+    def has_key_column(cls, db_engine):
+        """
+            Returns False if the results table exists without the key column. The table is created with it otherwise.
+        """
+        inspector = sqlalchemy.inspect(db_engine)
+        if not inspector.has_table(cls.TABLE_NAME):
+            return True
+        return cls.KEY_COLUMN in [c['name'] for c in inspector.get_columns(cls.TABLE_NAME)]
+
+    def load_from_file(self):
+        rows = {}
+        if not os.path.exists(self.path):
+            return rows
+        with open(self.path, 'r') as file:
+            for line in file:
+                try:
+                    item = json.loads(line)
+                except json.decoder.JSONDecodeError:
+                    # Last line of a run that stopped while writing it
+                    continue
+                rows[item['key']] = item['row']
+        return rows
+
+    def load_from_db(self):
+        with self.db_engine.connect() as connection:
+            if not sqlalchemy.inspect(connection).has_table(self.TABLE_NAME):
+                return {}
+            df = pd.read_sql(sqlalchemy.text(
+                f'SELECT * FROM "{self.TABLE_NAME}" WHERE "{self.KEY_COLUMN}" IS NOT NULL ORDER BY "Timestamp"'),
+                connection)
+        df = df.drop(columns=['Timestamp'])
+        # The latest row of a key is kept
+        return {row.pop(self.KEY_COLUMN): row for row in df.to_dict('records')}
+
+    @staticmethod
+    def get_candles_fingerprint(df):
+        if df is None:
+            return None
+        # Only the candle values, whatever the columns added by the strategy or their types
+        df = df[ResultStore.CANDLE_COLUMNS].astype(float)
+        return hashlib.sha256(pd.util.hash_pandas_object(df, index=True).values.tobytes()).hexdigest()
+
+    @classmethod
+    def get_code_version(cls, strategy_class):
+        """
+            Hash of the source code of the modules of the strategy class, of its base classes and of ENGINE_MODULES
+        """
+        if strategy_class not in cls._code_versions:
+            sha = hashlib.sha256()
+            names = [c.__module__ for c in strategy_class.__mro__ if c.__module__.startswith('strategies.')]
+            for name in names + cls.ENGINE_MODULES:
+                sha.update(inspect.getsource(sys.modules[name]).encode())
+            cls._code_versions[strategy_class] = sha.hexdigest()
+        return cls._code_versions[strategy_class]
+
+    def get_key(self, strategy, fingerprints):
+        """
+            fingerprints: {interval: fingerprint} of the candles read by the strategy
+        """
+        params = strategy.params
+        content = {
+            'params': {
+                'Exchange': params['Exchange'].lower(),
+                'Pair': params['Pair'],
+                'From_Time': params['From_Time'],
+                'To_Time': params['To_Time'],
+                'Interval': params['Interval'],
+                'Initial_Capital': params['Initial_Capital'],
+                'Take_Profit_PCT': params['Take_Profit_PCT'],
+                'Stop_Loss_PCT': params['Stop_Loss_PCT'],
+                'Strategy': params['Strategy'],
+                'Exit_Strategy': params['Exit_Strategy'],
+                'StrategySettings': params['StrategySettings'] if params['StrategySettings'] else None
+            },
+            'trades': strategy.config['trades'],
+            'fees': [strategy.MAKER_FEE_PCT, strategy.TAKER_FEE_PCT],
+            'candles': fingerprints,
+            'code': self.get_code_version(type(strategy))
+        }
+        return hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()
+
+    def get(self, key):
+        """
+            Returns the stored Statistics row of key, or None
+        """
+        row = self.rows.get(key)
+        return dict(row) if row is not None else None
+
+    def put(self, key, row):
+        """
+            Store the Statistics row of key. Rows saved to the database are stored by the database writer.
+        """
+        with self.lock:
+            self.rows[key] = dict(row)
+            if self.db_engine is None:
+                # One line per write, the rows of the processes of a pool are appended to the same file
+                with open(self.path, 'a') as file:
+                    file.write(json.dumps({'key': key, 'row': row}, default=str) + '\n')
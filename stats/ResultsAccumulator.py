@@ -0,0 +1,162 @@
+"""
+    Class that accumulates the Statistics rows of the test cases of a run.
+    Rows are appended to one list per column, and turned into a DataFrame with typed columns (numbers, dates)
+    only when the results are output. Values are formatted (Ex: 1,234.50, 45.0%) only for display:
+    the CSV, Parquet and database outputs keep the numbers, the XLSX output uses Excel number formats.
+"""
+import os
+
+import pandas as pd
+
+import constants
+
+
+class ResultsAccumulator:
+    # Columns of the Statistics and their types
+    COLUMNS = {
+        'Test #': 'Int64',
+        'Original Test #': 'Int64',
+        'Exchange': 'object',
+        'Pair': 'object',
+        'From': 'datetime64[ns]',
+        'To': 'datetime64[ns]',
+        'Interval': 'object',
+        'Init Capital': 'float64',
+        'TP %': 'float64',
+        'SL %': 'float64',
+        'Maker Fee %': 'float64',
+        'Taker Fee %': 'float64',
+        'Strategy': 'object',
+        'Wins': 'Int64',
+        'Losses': 'Int64',
+        'Trades': 'Int64',
+        'Win Rate': 'float64',
+        'Loss Idx': 'Int64',
+        'Win Idx': 'Int64',
+        'Wins $': 'float64',
+        'Losses $': 'float64',
+        'Fees $': 'float64',
+        'Total P/L': 'float64',
+        'Details': 'object',
+        'Stop Reason': 'object'
+    }
+
+    # Display formats of the columns
+    FORMATS = {
+        'Init Capital': '{:,.2f}',
+        'Win Rate': '{:.1f}%',
+        'Wins $': '{:,.2f}',
+        'Losses $': '{:,.2f}',
+        'Fees $': '{:,.2f}',
+        'Total P/L': '{:,.2f}'
+    }
+
+    # Excel number formats of the columns
+    EXCEL_FORMATS = {
+        'From': 'yyyy-mm-dd',
+        'To': 'yyyy-mm-dd',
+        'Init Capital': '#,##0.00',
+        'Win Rate': '0.0"%"',
+        'Wins $': '#,##0.00',
+        'Losses $': '#,##0.00',
+        'Fees $': '#,##0.00',
+        'Total P/L': '#,##0.00'
+    }
+
+    def __init__(self):
+        self.columns = {name: [] for name in self.COLUMNS.keys()}
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, row):
+        """
+            Append a row of Statistics (dictionary {column: value}). Columns missing from the row are left empty.
+        """
+        for name in row.keys():
+            if name not in self.columns:
+                # Column not in COLUMNS, empty for the rows already appended
+                self.columns[name] = [None] * self.size
+        for name, values in self.columns.items():
+            values.append(row.get(name))
+        self.size += 1
+
+    def extend(self, other):
+        """
+            Append the rows of another accumulator (Ex: the rows returned by a worker process)
+        """
+        for name in other.columns.keys():
+            if name not in self.columns:
+                self.columns[name] = [None] * self.size
+        for name, values in self.columns.items():
+            values.extend(other.columns.get(name, [None] * other.size))
+        self.size += other.size
+
+    def get_row(self, i):
+        """
+            Returns row i (Ex: -1 for the last row) as a dictionary {column: value}
+        """
+        return {name: values[i] for name, values in self.columns.items()}
+
+    def to_dataframe(self, last=None):
+        """
+            Returns the rows (the last ones only if last is set) as a DataFrame with typed columns
+        """
+        start = max(0, self.size - last) if last is not None else 0
+        index = pd.RangeIndex(start, self.size)
+        data = {}
+        for name, values in self.columns.items():
+            values = pd.Series(values[start:], index=index, dtype='object')
+            dtype = self.COLUMNS.get(name, 'object')
+            data[name] = pd.to_datetime(values) if dtype.startswith('datetime') else values.astype(dtype)
+        return pd.DataFrame(data, index=index)
+
+    def get_sorted_dataframe(self):
+        """
+            Returns the rows ordered by test number, indexed by test number
+        """
+        return self.to_dataframe().sort_values('Test #', kind='stable').set_index('Test #')
+
+    @classmethod
+    def format_dataframe(cls, df):
+        """
+            Returns a copy of df with the values formatted for display
+        """
+        df = df.copy()
+        for name in df.columns:
+            if name in cls.FORMATS:
+                df[name] = df[name].map(lambda x: cls.FORMATS[name].format(x) if pd.notnull(x) else '')
+            elif cls.COLUMNS.get(name, '').startswith('datetime'):
+                df[name] = df[name].dt.strftime(constants.DATE_FMT)
+        return df
+
+    @classmethod
+    def save_dataframe(cls, df, filename, file_formats):
+        """
+            Save df to filename + the extension of each file format (csv, xlsx, parquet)
+        """
+        if 'csv' in file_formats:
+            df.to_csv(filename + '.csv', index=True, header=True, date_format=constants.DATE_FMT)
+            print(f'Stats file created => [{filename}.csv]')
+
+        if 'xlsx' in file_formats:
+            with pd.ExcelWriter(filename + '.xlsx') as writer:
+                df.to_excel(writer, sheet_name='Statistics', index=True, header=True)
+                sheet = writer.sheets['Statistics']
+                nb_index_columns = df.index.nlevels
+                for i, name in enumerate(df.columns):
+                    if name in cls.EXCEL_FORMATS:
+                        column = nb_index_columns + i + 1
+                        for cells in sheet.iter_cols(min_col=column, max_col=column, min_row=2):
+                            for cell in cells:
+                                cell.number_format = cls.EXCEL_FORMATS[name]
+            print(f'Stats file created => [{filename}.xlsx]')
+
+        if 'parquet' in file_formats:
+            df.to_parquet(filename + '.parquet', index=True)
+            print(f'Stats file created => [{filename}.parquet]')
+
+    def save(self, results_path, file_formats, now):
+        self.save_dataframe(self.get_sorted_dataframe(), os.path.join(results_path, f'Statistics - {now}'),
+                            file_formats)
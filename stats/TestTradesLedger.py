@@ -0,0 +1,39 @@
+"""
+    Check the trades ledger (stats_utils.get_trades_ledger) on trade details with an ExitOnNextEntry reversal:
+    a long trade closed with a win of +10 on the entry row of a short trade, then closed by a stop loss of -5.
+    The ledger must have 2 trades with their own exit row, P/L and fees.
+"""
+import pandas as pd
+
+from stats import stats_utils
+
+
+def test_trades_ledger():
+    index = pd.date_range('2022-01-01', periods=6, freq='h')
+    df = pd.DataFrame({
+        'trade_status': [None, 'Enter Long', 'Long', 'Enter Short', 'Short', 'Exit Short'],
+        'entry_price': [0, 100, 100, 110, 110, 110.0],
+        'take_profit': [0, 101, 101, 108.9, 108.9, 108.9],
+        'stop_loss': [0, 99, 99, 111.1, 111.1, 111.1],
+        'staked_amount': [0, 100, 100, 110, 110, 0.0],
+        'win': [0, 0, 0, 10, 0, 0.0],
+        'loss': [0, 0, 0, 0, 0, -5.0],
+        'entry_fee': [0, 0.1, 0, 0.11, 0, 0],
+        'exit_fee': [0, 0, 0, 0.2, 0, 0.3],
+        'wallet': [1000, 899.9, 899.9, 899.69, 899.69, 1004.69]
+    }, index=index)
+
+    ledger = stats_utils.get_trades_ledger(df)
+    print(ledger.to_string())
+
+    assert list(ledger['Side']) == ['Long', 'Short']
+    assert list(ledger['Exit Time']) == [index[3], index[5]]
+    assert list(ledger['P/L']) == [10.0, -5.0]
+    assert round(ledger['P/L'].sum(), 2) == 5.0
+    assert list(ledger['Fees']) == [0.3, 0.41]
+    assert list(ledger['Wallet']) == [1009.8, 1004.69]
+
+
+if __name__ == '__main__':
+    test_trades_ledger()
+    print('\nTrades ledger OK.')
@@ -1,5 +1,8 @@
+import numpy as np
 import pandas as pd
 
+from enums.TradeStatus import TradeStatuses
+
 
 def determine_win_or_loose(row):
     if row['win'] != 0:
@@ -76,52 +79,71 @@ def get_win_loss_indexes(df):
     return min_win_loose_index, max_win_loose_index
 
 
-def get_initial_statistics_df():
-    statistics_df = pd.DataFrame(columns=[
-        'Test #',
-        'Exchange',
-        'Pair',
-        'From',
-        'To',
-        'Interval',
-        'Init Capital',
-        'TP %',
-        'SL %',
-        'Maker Fee %',
-        'Taker Fee %',
-        'Strategy',
-        'Wins',
-        'Losses',
-        'Trades',
-        'Win Rate',
-        'Loss Idx',
-        'Win Idx',
-        'Wins $',
-        'Losses $',
-        'Fees $',
-        'Total P/L',
-        'Details'
-    ])
-
-    # # Set the column types
-    # statistics_df.index = statistics_df.index.astype(int)
-    # # statistics_df['Interval'] = statistics_df['Interval'].astype(str)
-    # statistics_df['Init Capital'] = statistics_df['Init Capital'].astype(float)
-    # statistics_df['TP %'] = statistics_df['TP %'].astype(float)
-    # statistics_df['SL %'] = statistics_df['SL %'].astype(float)
-    # statistics_df['Maker Fee %'] = statistics_df['Maker Fee %'].astype(float)
-    # statistics_df['Taker Fee %'] = statistics_df['Taker Fee %'].astype(float)
-    #
-    # statistics_df['Wins'] = statistics_df['Wins'].astype(int)
-    # statistics_df['Losses'] = statistics_df['Losses'].astype(int)
-    # statistics_df['Trades'] = statistics_df['Trades'].astype(int)
-    # statistics_df['Win Rate'] = statistics_df['Win Rate'].astype(float)
-    # statistics_df['Loss Idx'] = statistics_df['Loss Idx'].astype(int)
-    # statistics_df['Win Idx'] = statistics_df['Win Idx'].astype(int)
-    #
-    # statistics_df['Wins $'] = statistics_df['Wins $'].astype(float)
-    # statistics_df['Losses $'] = statistics_df['Losses $'].astype(float)
-    # statistics_df['Fees $'] = statistics_df['Fees $'].astype(float)
-    # statistics_df['Total P/L'] = statistics_df['Total P/L'].astype(float)
-    # print(results_df.to_string())
-    return statistics_df
+# Returns the equity after each candle: wallet + amount staked in the current trade
+def get_equity(df):
+    equity = df['wallet'].astype(float)
+    if 'staked_amount' in df.columns:
+        equity = equity + df['staked_amount'].astype(float)
+    return equity
+
+
+# Returns the maximum drawdown of the equity in % (<= 0)
+def get_max_drawdown_pct(equity):
+    if len(equity.index) == 0:
+        return 0.0
+    return float((equity / equity.cummax() - 1).min() * 100)
+
+
+# Returns one row per trade, from its entry row and its exit row in df. The last trade has no exit if it is still open
+# at the end of the test range.
+# A trade exits on an Exit row, or on the entry row of the next trade when it is reversed (ExitOnNextEntry):
+# the win/loss and exit fee of that row belong to the trade it closes.
+def get_trades_ledger(df):
+    status = df['trade_status']
+    is_entry = status.isin([TradeStatuses.EnterLong, TradeStatuses.EnterShort]).to_numpy()
+    in_trade = status.isin([TradeStatuses.EnterLong, TradeStatuses.Long,
+                            TradeStatuses.EnterShort, TradeStatuses.Short]).to_numpy()
+    is_reversal = is_entry & np.concatenate([[False], in_trade[:-1]])
+    is_exit = status.isin([TradeStatuses.ExitLong, TradeStatuses.ExitShort]).to_numpy() | is_reversal | \
+        ((df['win'] != 0) | (df['loss'] != 0)).to_numpy()
+    entries = np.flatnonzero(is_entry)
+    exits = np.flatnonzero(is_exit)
+    # First exit after each entry, the entry row of a reversed trade is also the exit of the previous one
+    first_exits = np.searchsorted(exits, entries, side='right')
+    closed = first_exits < len(exits)
+    exits = exits[first_exits[closed]]
+
+    def values(column, positions):
+        return df[column].to_numpy()[positions]
+
+    def exit_values(column):
+        result = np.full(len(entries), np.nan)
+        result[closed] = values(column, exits).astype(float)
+        return result
+
+    bars = pd.array(np.full(len(entries), pd.NA), dtype='Int64')
+    bars[closed] = exits - entries[closed]
+    exit_times = pd.Series(pd.NaT, index=range(len(entries)), dtype=df.index.dtype)
+    exit_times[closed] = df.index[exits]
+
+    # The wallet of a reversal row is after the stake and entry fee of the next trade
+    wallet = exit_values('wallet')
+    reversed_trades = np.flatnonzero(closed)[is_reversal[exits]]
+    wallet[reversed_trades] += values('staked_amount', exits[is_reversal[exits]]).astype(float) + \
+        values('entry_fee', exits[is_reversal[exits]]).astype(float)
+
+    ledger = pd.DataFrame({
+        'Trade #': np.arange(1, len(entries) + 1),
+        'Side': np.where(values('trade_status', entries) == TradeStatuses.EnterLong, 'Long', 'Short'),
+        'Entry Time': df.index[entries],
+        'Entry Price': values('entry_price', entries).astype(float),
+        'Take Profit': values('take_profit', entries).astype(float),
+        'Stop Loss': values('stop_loss', entries).astype(float),
+        'Staked Amount': values('staked_amount', entries).astype(float),
+        'Exit Time': exit_times.to_numpy(),
+        'Bars': bars,
+        'P/L': exit_values('win') + exit_values('loss'),
+        'Fees': values('entry_fee', entries).astype(float) + np.nan_to_num(exit_values('exit_fee')),
+        'Wallet': wallet
+    }).set_index('Trade #')
+    return ledger.round(dict.fromkeys(ledger.select_dtypes('float').columns, 2))
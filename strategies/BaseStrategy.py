@@ -1,6 +1,5 @@
 
 import math
-import sys
 from abc import ABC, abstractmethod
 import datetime as dt
 from datetime import datetime
@@ -11,13 +10,16 @@ import rapidjson
 
 import constants
 from Configuration import Configuration
-from database.DbDataReader import DbDataReader
+from database import db_utils
+from database.DbResultsWriter import DbResultsWriter
 from enums.ExitType import ExitType
 from enums.TradeType import TradeType
 from exchanges.ExchangeCCXT import ExchangeCCXT
 from stats import stats_utils
 import utils
 from enums.TradeStatus import TradeStatuses
+from stats.ResultStore import ResultStore
+from stats.ResultsAccumulator import ResultsAccumulator
 from stats.Statistics import Statistics
 
 # Do not remove these imports even if PyCharm says they're unused
@@ -44,6 +46,20 @@ class BaseStrategy(ABC):
     # Cannot run Strategy on data set less than this value
     MIN_DATA_SIZE = 0
 
+    # Strategy settings used to calculate the indicators (the other ones are thresholds applied to them).
+    # Test cases with the same values for these settings are run one after the other to reuse their indicators.
+    INDICATOR_SETTINGS = []
+
+    # Keys accepted in the Optional Strategy Settings of the test cases
+    VALID_SETTINGS_KEYS = []
+
+    # Columns calculated for each row by the get_all_trade_details_*() methods
+    TRADE_DETAILS_COLUMNS = ['trade_status', 'entry_price', 'take_profit', 'stop_loss', 'wallet',
+                             'staked_amount', 'win', 'loss', 'entry_fee', 'exit_fee']
+
+    # With early stop rules, trades are processed by chunks of rows and the rules are checked after each chunk
+    EARLY_STOP_CHUNK_SIZE = 1000
+
     def __init__(self, params):
         self.config = Configuration.get_config()
         self.df = None
@@ -54,31 +70,93 @@ class BaseStrategy(ABC):
         self.TP_PCT = self.params['Take_Profit_PCT'] / 100
         self.SL_PCT = self.params['Stop_Loss_PCT'] / 100
         # self.exchange = globals()[params['Exchange']]()
-        self.exchange = ExchangeCCXT(params['Exchange'].lower(), params['Pair'])
+        self.exchange = ExchangeCCXT.get_instance(params['Exchange'].lower(), params['Pair'])
         self.MAKER_FEE_PCT = self.exchange.get_maker_fee(params['Pair'])
         self.TAKER_FEE_PCT = self.exchange.get_taker_fee(params['Pair'])
         self.stats = Statistics()
+        self.db_engine = None
+        # {interval: (include_prior, candles)} of the candles read for this test case
+        self.candles = {}
         if self.config['database']['historical_data_stored_in_db']:
-            self.db_reader = DbDataReader(self.exchange.NAME)
-            self.db_engine = self.db_reader.engine
+            self.db_reader = db_utils.get_candle_data_reader(self.exchange.NAME)
+            # The parquet backend has no database engine to save statistics to
+            self.db_engine = getattr(self.db_reader, 'engine', None)
         self.validate_exit_strategy()
         # Used within decorators to access previous row when processing trades
         self.prev_row = {}
+        # Key of the results of this test case in the result store, None if the result store is disabled
+        self.result_key = None
+        # Early stop rules (see apply_trade_details()), and why the test case was stopped before the end of its range
+        self.early_stop = {k: v for k, v in self.config['trades'].get('early_stop', {}).items() if v is not None}
+        self.stop_reason = None
+        # One row per trade (see get_trades_ledger()), only built when it is saved to a file or to the database
+        self.trades_ledger = None
 
     def run(self):
         self.get_candle_data()  # Step 0
+        if self.reuse_stored_result():
+            return
+        self.simulate_trades()  # Steps 1 to 3
+        # A test case stopped by an early stop rule only records its statistics
+        if self.stop_reason is None:
+            self.validate_trades()  # Step 4
+            if self.db_engine is not None and self.config['database'].get('save_trades', True):
+                # Before save_trades_to_file(), which may only keep the event rows of self.df
+                self.trades_ledger = self.get_trades_ledger()
+            self.save_trades_to_file()  # Step 5
+        self.finalize_stats()  # Step 6
+
+    def simulate(self):
+        """
+            Run the trades of the strategy without writing any output.
+            Used by the optimizations, which only need the statistics of the strategy (self.stats).
+        """
+        self.get_candle_data()  # Step 0
+        self.simulate_trades()  # Steps 1 to 3
+
+    def simulate_trades(self):
         self.add_indicators_and_signals()  # Step1
         self.add_trade_entry_points()  # Step2
         self.process_trades()  # Step3
-        self.validate_trades()  # Step 4
-        self.save_trades_to_file()  # Step 5
-        self.finalize_stats()  # Step 6
+
+    def get_candles_fingerprints(self):
+        """
+            Returns the {interval: fingerprint} of the candles read by this test case
+        """
+        dataset = self.params.get('Candle_Data')
+        fingerprints = {}
+        for interval, (include_prior, df) in self.candles.items():
+            if dataset is None or df is None:
+                fingerprints[interval] = ResultStore.get_candles_fingerprint(df)
+            else:
+                key = (interval, include_prior, df.index[0] if len(df.index) > 0 else None,
+                       df.index[-1] if len(df.index) > 0 else None)
+                fingerprints[interval] = dataset.get_fingerprint(key, lambda: ResultStore.get_candles_fingerprint(df))
+        return fingerprints
+
+    def reuse_stored_result(self):
+        """
+            Returns True if this test case has already been run with the same params, settings, candles and code.
+            Its Statistics row is then taken from the result store instead of running it again.
+        """
+        store = ResultStore.get_store(self.db_engine)
+        if store is None:
+            return False
+        self.result_key = store.get_key(self, self.get_candles_fingerprints())
+        results = store.get(self.result_key)
+        if results is None:
+            return False
+        results['Test #'] = self.params['Test_Num']
+        results['Original Test #'] = self.params.get('Original_Test_Num', self.params['Test_Num'])
+        print(f"\nTest #{self.params['Test_Num']} already run, its statistics are taken from the result store.")
+        self.params['Statistics'].append(results)
+        return True
 
     # To be redefined on subclasses
     def validate_exit_strategy(self):
         if self.params["Exit_Strategy"] not in ['FixedPCT', 'ExitOnNextEntry']:
-            print(f'Exit strategy ({self.params["Exit_Strategy"]}) not supported by {self.params["Strategy"]}.')
-            sys.exit(1)
+            raise Exception(f'Exit strategy ({self.params["Exit_Strategy"]}) '
+                            f'not supported by {self.params["Strategy"]}.')
 
     # Calculate indicator values required to determine long/short signals
     @abstractmethod
@@ -158,37 +236,90 @@ class BaseStrategy(ABC):
                 return ExitType.TakeProfit
         return None
 
-    # Step 0: Get candle data used to backtest the strategy
-    def get_candle_data(self):
+    @classmethod
+    def get_candle_data_intervals(cls, params):
+        """
+            Returns the list of (interval, include_prior) of the candles read over the whole test range.
+            Used to load the candles shared by the test cases run on the same range only once.
+        """
+        return [(params['Interval'], cls.MIN_DATA_SIZE)]
+
+    def fetch_candle_data(self, interval, include_prior, from_time=None, to_time=None):
+        """
+            Read the candles of interval from the database or the exchange, over the test range by default
+        """
+        from_time = from_time if from_time is not None else self.params['From_Time']
+        to_time = to_time if to_time is not None else self.params['To_Time']
         if self.config['database']['historical_data_stored_in_db']:
-            self.df = self.db_reader.get_candle_data(
+            return self.db_reader.get_candle_data(
                 self.params['Pair'],
-                self.params['From_Time'],
-                self.params['To_Time'],
-                self.params['Interval'],
-                include_prior=self.MIN_DATA_SIZE,
+                from_time,
+                to_time,
+                interval,
+                include_prior=include_prior,
                 verbose=True)
-            if self.df is None:
-                raise Exception(f"No data returned by the database. Unable to backtest strategy.")
-            elif len(self.df) <= self.MIN_DATA_SIZE:
-                print(
-                    f'\nData rows = {len(self.df)}, less than MIN_DATA_SIZE={self.MIN_DATA_SIZE}. Unable to backtest strategy.')
-                raise Exception("Unable to Run Strategy on Data Set")
         else:
-            self.df = self.exchange.get_candle_data(
+            return self.exchange.get_candle_data(
                 self.params['Pair'],
-                self.params['From_Time'],
-                self.params['To_Time'],
-                self.params['Interval'],
-                include_prior=self.MIN_DATA_SIZE,
+                from_time,
+                to_time,
+                interval,
+                include_prior=include_prior,
                 write_to_file=True,
                 verbose=True)
-            if self.df is None:
-                raise Exception(f"No data returned by {self.exchange.NAME}. Unable to backtest strategy.")
-            elif len(self.df) <= self.MIN_DATA_SIZE:
-                print(
-                    f'\nData rows = {len(self.df)}, less than MIN_DATA_SIZE={self.MIN_DATA_SIZE}. Unable to backtest strategy.')
-                raise Exception("Unable to Run Strategy on Data Set")
+
+    def read_candle_data(self, interval, include_prior):
+        """
+            Returns the candles of the test range, from the CandleDataSet shared with the other test cases
+            of this range when there is one (params 'Candle_Data')
+        """
+        dataset = self.params.get('Candle_Data')
+        if dataset is not None:
+            df = dataset.get_candle_data(interval, include_prior, self.fetch_candle_data,
+                                         self.params['From_Time'], self.params['To_Time'])
+        else:
+            df = self.fetch_candle_data(interval, include_prior)
+        self.candles[interval] = (include_prior, df)
+        return df
+
+    @classmethod
+    def get_indicator_settings_key(cls, params):
+        """
+            Test cases with the same key calculate the same indicators
+        """
+        settings = params['StrategySettings'] if isinstance(params['StrategySettings'], dict) else {}
+        return params['Interval'], tuple(repr(settings.get(k)) for k in cls.INDICATOR_SETTINGS)
+
+    def get_indicator(self, func, *columns, interval=None, **kwargs):
+        """
+            Returns func(*candles[columns], **kwargs) calculated on the candles read by read_candle_data() for interval
+            (the test case interval by default). Ex: self.get_indicator(talib.EMA, 'close', timeperiod=50)
+            The result is cached in the CandleDataSet shared with the other test cases of the same dataset.
+        """
+        interval = interval if interval is not None else self.params['Interval']
+        include_prior, candles = self.candles[interval]
+
+        def compute():
+            return func(*[candles[column].astype(float) for column in columns], **kwargs)
+
+        dataset = self.params.get('Candle_Data')
+        if dataset is None:
+            return compute()
+        bounds = (candles.index[0], candles.index[-1]) if len(candles.index) > 0 else None
+        key = (interval, include_prior, bounds, func.__name__, columns, tuple(sorted(kwargs.items())))
+        return dataset.get_indicator(key, compute)
+
+    # Step 0: Get candle data used to backtest the strategy
+    def get_candle_data(self):
+        self.df = self.read_candle_data(self.params['Interval'], self.MIN_DATA_SIZE)
+        if self.df is None:
+            if self.config['database']['historical_data_stored_in_db']:
+                raise Exception(f"No data returned by the database. Unable to backtest strategy.")
+            raise Exception(f"No data returned by {self.exchange.NAME}. Unable to backtest strategy.")
+        elif len(self.df) <= self.MIN_DATA_SIZE:
+            print(
+                f'\nData rows = {len(self.df)}, less than MIN_DATA_SIZE={self.MIN_DATA_SIZE}. Unable to backtest strategy.')
+            raise Exception("Unable to Run Strategy on Data Set")
 
         # Set proper data types
         self.df['open'] = self.df['open'].astype(float)
@@ -465,18 +596,11 @@ class BaseStrategy(ABC):
         self.df.loc[:, 'exit_fee'] = 0.0
 
         if self.params['Exit_Strategy'] == 'FixedPCT':
-            self.prev_row = {}
-            self.df[['trade_status', 'entry_price', 'take_profit', 'stop_loss', 'wallet',
-                     'staked_amount', 'win', 'loss', 'entry_fee', 'exit_fee']] = \
-                self.df.apply(self.get_all_trade_details_fixed_pct, axis=1).apply(pd.Series)
+            self.apply_trade_details(self.get_all_trade_details_fixed_pct)
         elif self.params['Exit_Strategy'] == 'ExitOnNextEntry':
-            self.prev_row = {}
-            self.df[['trade_status', 'entry_price', 'take_profit', 'stop_loss', 'wallet',
-                     'staked_amount', 'win', 'loss', 'entry_fee', 'exit_fee']] = \
-                self.df.apply(self.get_all_trade_details_exit_on_next_entry, axis=1).apply(pd.Series)
+            self.apply_trade_details(self.get_all_trade_details_exit_on_next_entry)
         else:
-            print(f'Unimplemented exit strategy.')
-            sys.exit(1)
+            raise Exception(f'Unimplemented exit strategy [{self.params["Exit_Strategy"]}].')
 
         # Statistics
         self.stats.nb_wins = self.df['win'].astype(bool).sum(axis=0)
@@ -488,6 +612,71 @@ class BaseStrategy(ABC):
         #print()  # Jump to next line
         return self.df
 
+    def apply_trade_details(self, get_trade_details):
+        """
+            Set the TRADE_DETAILS_COLUMNS of each row with get_trade_details(row).
+            With early stop rules (config trades.early_stop), the rows are processed by chunks and processing stops
+            at the first row meeting a rule: the rows after it are dropped and the statistics are the ones at that row.
+        """
+        self.prev_row = {}
+        if len(self.early_stop) == 0 or len(self.df.index) == 0:
+            self.df[self.TRADE_DETAILS_COLUMNS] = self.df.apply(get_trade_details, axis=1).apply(pd.Series)
+            return
+
+        chunks = []
+        stop_row = None
+        state = {'peak_equity': float(self.params['Initial_Capital']), 'nb_trades': 0}
+        for start in range(0, len(self.df.index), self.EARLY_STOP_CHUNK_SIZE):
+            chunk = self.df.iloc[start:start + self.EARLY_STOP_CHUNK_SIZE].apply(get_trade_details, axis=1)
+            chunk = chunk.apply(pd.Series)
+            chunk.columns = self.TRADE_DETAILS_COLUMNS
+            chunks.append(chunk)
+            stop_row = self.get_early_stop_row(chunk, start, state)
+            if stop_row is not None:
+                break
+
+        details = pd.concat(chunks)
+        if stop_row is not None:
+            details = details.iloc[:stop_row + 1]
+            self.df = self.df.iloc[:stop_row + 1].copy()
+            print(f'\nTest #{self.params["Test_Num"]} stopped early: {self.stop_reason}.')
+        self.df[self.TRADE_DETAILS_COLUMNS] = details
+
+    def get_early_stop_row(self, chunk, start, state):
+        """
+            Returns the position in self.df of the first row of chunk (starting at position start) meeting an early
+            stop rule and sets self.stop_reason, or None if no row meets a rule.
+            state: peak equity and number of trades closed before the chunk, updated with the rows of the chunk
+        """
+        equity = (chunk['wallet'].astype(float) + chunk['staked_amount'].astype(float)).to_numpy()
+        peak_equity = np.maximum.accumulate(np.maximum(equity, state['peak_equity']))
+        nb_trades = state['nb_trades'] + np.cumsum((chunk['win'] != 0).to_numpy() | (chunk['loss'] != 0).to_numpy())
+        initial_capital = float(self.params['Initial_Capital'])
+
+        stops = []  # (position in chunk, reason)
+        if 'max_drawdown_pct' in self.early_stop:
+            rows = np.flatnonzero(equity < peak_equity * (1 - self.early_stop['max_drawdown_pct'] / 100))
+            if len(rows) > 0:
+                stops.append((rows[0], f"drawdown over {self.early_stop['max_drawdown_pct']}%"))
+        if 'wallet_floor_pct' in self.early_stop:
+            rows = np.flatnonzero(equity < initial_capital * self.early_stop['wallet_floor_pct'] / 100)
+            if len(rows) > 0:
+                stops.append((rows[0], f"equity under {self.early_stop['wallet_floor_pct']}% of the initial capital"))
+        if 'min_trades' in self.early_stop:
+            range_pct = self.early_stop.get('min_trades_range_pct', 50)
+            checkpoint = int(len(self.df.index) * range_pct / 100) - start
+            if 0 <= checkpoint < len(chunk.index) and nb_trades[checkpoint] < self.early_stop['min_trades']:
+                stops.append((checkpoint, f"less than {self.early_stop['min_trades']} trades after {range_pct}% "
+                                          f"of the range"))
+
+        state['peak_equity'] = float(peak_equity[-1])
+        state['nb_trades'] = int(nb_trades[-1])
+        if len(stops) == 0:
+            return None
+        row, reason = min(stops, key=lambda x: x[0])
+        self.stop_reason = f'{reason} on {chunk.index[row]}'
+        return start + int(row)
+
     # old implementation or process_trades() using a loop (slower)
     def process_trades_old(self):
         exit_fixed_pct = self.params['Exit_Strategy'] == 'FixedPCT'
@@ -789,69 +978,141 @@ class BaseStrategy(ABC):
 
     # Step 5: Save trade data to file
     def save_trades_to_file(self):
-        # Save trade details to file
-        self.clean_df_prior_to_saving()
-        utils.save_trades_to_file(self.params['Test_Num'],
-                                  self.exchange.NAME,
-                                  self.params['Pair'],
-                                  self.params['From_Time'],
-                                  self.params['To_Time'],
-                                  self.params['Interval'],
-                                  self.df, False, True)
-
-    # Step 6: Write Statistics to Statistics Result DataFrame
-    def finalize_stats(self):
+        """
+            Save trade details to file, depending on config output.trades_output:
+            events: the entry and exit rows only, with the trades_context_bars rows around them
+            ledger: one row per trade
+            bars: all the rows, with all the candles and indicators
+        """
+        trades_output = self.config['output'].get('trades_output', 'events')
+        if trades_output == 'ledger':
+            if self.trades_ledger is None:
+                self.trades_ledger = self.get_trades_ledger()
+            df, suffix = self.trades_ledger, 'Ledger'
+        else:
+            if trades_output == 'events':
+                # Only the saved rows are cleaned
+                self.df = self.get_event_rows(self.config['output'].get('trades_context_bars', 0))
+            self.clean_df_prior_to_saving()
+            df, suffix = self.df, 'Trades'
+        args = (self.params['Test_Num'], self.exchange.NAME, self.params['Pair'], self.params['From_Time'],
+                self.params['To_Time'], self.params['Interval'], df, False, True, suffix)
+        # With the pipelined runner (params 'Output_Writer'), the file is written by a background thread
+        writer = self.params.get('Output_Writer')
+        if writer is not None:
+            writer.submit(utils.save_trades_to_file, *args)
+        else:
+            utils.save_trades_to_file(*args)
+
+    def get_event_mask(self):
+        """
+            Returns the mask of the rows of self.df where a trade is entered or exited
+        """
+        events = [TradeStatuses.EnterLong, TradeStatuses.EnterShort, TradeStatuses.ExitLong, TradeStatuses.ExitShort]
+        return (self.df['trade_status'].isin(events) | (self.df['win'] != 0) | (self.df['loss'] != 0)).to_numpy()
+
+    def get_event_rows(self, context_bars=0):
+        """
+            Returns the rows of self.df where a trade is entered or exited, and the context_bars rows before and
+            after each of them
+        """
+        mask = self.get_event_mask()
+        if context_bars > 0:
+            mask = np.convolve(mask, np.ones(2 * context_bars + 1), mode='same') > 0
+        return self.df[mask]
+
+    def get_trades_ledger(self):
+        """
+            Returns one row per trade of this test case, see stats_utils.get_trades_ledger()
+        """
+        return stats_utils.get_trades_ledger(self.df)
+
+    def get_statistics(self):
+        """
+            Returns the row of Statistics of this test case
+        """
         # self.stats.max_conseq_wins, self.stats.max_conseq_losses = stats_utils.get_consecutives(self.df)
         self.stats.min_win_loose_index, self.stats.max_win_loose_index = stats_utils.get_win_loss_indexes(self.df)
-        results = {
-                'Test #': self.params['Test_Num'],
-                'Exchange': self.exchange.NAME,
-                'Pair': self.params['Pair'],
-                'From': self.params['From_Time'].strftime("%Y-%m-%d"),
-                'To': self.params['To_Time'].strftime("%Y-%m-%d"),
-                'Interval': self.params['Interval'],
-                'Init Capital': f'{self.params["Initial_Capital"]:,.2f}',
-                'TP %': self.params['Take_Profit_PCT'],
-                'SL %': self.params['Stop_Loss_PCT'],
-                'Maker Fee %': self.MAKER_FEE_PCT * 100,
-                'Taker Fee %': self.TAKER_FEE_PCT * 100,
-                'Strategy': self.NAME,
-
-                'Wins': int(self.stats.nb_wins),
-                'Losses': int(self.stats.nb_losses),
-                'Trades': int(self.stats.total_trades),
-                'Win Rate': f'{self.stats.win_rate:.1f}%',
-                'Loss Idx': self.stats.min_win_loose_index,
-                'Win Idx': self.stats.max_win_loose_index,
-                'Wins $': f'{self.stats.total_wins:,.2f}',
-                'Losses $': f'{self.stats.total_losses:,.2f}',
-                'Fees $': f'{self.stats.total_fees_paid:,.2f}',
-                'Total P/L': f'{self.stats.total_pl:,.2f}',
-                'Details': self.get_strategy_text_details()
-            }
-
-        # Store results in Results DataFrame
-        self.params['Statistics'] = self.params['Statistics'].append(results, ignore_index=True)
-
-        df = pd.DataFrame().append([results], ignore_index=True)
+        return {
+            'Test #': self.params['Test_Num'],
+            'Original Test #': self.params.get('Original_Test_Num', self.params['Test_Num']),
+            'Exchange': self.exchange.NAME,
+            'Pair': self.params['Pair'],
+            'From': self.params['From_Time'],
+            'To': self.params['To_Time'],
+            'Interval': self.params['Interval'],
+            'Init Capital': self.params['Initial_Capital'],
+            'TP %': self.params['Take_Profit_PCT'],
+            'SL %': self.params['Stop_Loss_PCT'],
+            'Maker Fee %': self.MAKER_FEE_PCT * 100,
+            'Taker Fee %': self.TAKER_FEE_PCT * 100,
+            'Strategy': self.NAME,
+
+            'Wins': int(self.stats.nb_wins),
+            'Losses': int(self.stats.nb_losses),
+            'Trades': int(self.stats.total_trades),
+            'Win Rate': self.stats.win_rate,
+            'Loss Idx': self.stats.min_win_loose_index,
+            'Win Idx': self.stats.max_win_loose_index,
+            'Wins $': self.stats.total_wins,
+            'Losses $': self.stats.total_losses,
+            'Fees $': self.stats.total_fees_paid,
+            'Total P/L': self.stats.total_pl,
+            'Details': self.get_strategy_text_details(),
+            'Stop Reason': self.stop_reason
+        }
+
+    # Step 6: Write Statistics to the Results accumulator
+    def finalize_stats(self):
+        results = self.get_statistics()
+
+        # Store results in the Results accumulator
+        self.params['Statistics'].append(results)
+
+        df = ResultsAccumulator.format_dataframe(self.params['Statistics'].to_dataframe(last=1))
         del df['Init Capital']
         del df['Details']
         print('\n'+df.to_string(index=False)+'\n')
 
-        if self.config['database']['historical_data_stored_in_db']:
+        if self.db_engine is not None:
             self.save_stats_to_db()
 
+        if self.result_key is not None:
+            ResultStore.get_store(self.db_engine).put(self.result_key, results)
+
     def save_stats_to_db(self):
         table_name = 'Test_Results_Statistics'
-        stats_df = self.params['Statistics'].iloc[[-1]]
+        stats_df = self.params['Statistics'].to_dataframe(last=1)
         now = dt.datetime.now().strftime(constants.DATETIME_FMT)  # Get current no milliseconds
         now = datetime.strptime(now, constants.DATETIME_FMT)  # convert str back to datetime
 
         # Use: (df.loc[:,'New_Column']='value') or (df = df.assign(New_Column='value'))
         # instead of: df['New_Column']='value' <-- Generates warnings
         stats_df = stats_df.assign(Timestamp=now)
+        if self.result_key is not None:
+            stats_df = stats_df.assign(**{ResultStore.KEY_COLUMN: self.result_key})
         stats_df.set_index('Timestamp', inplace=True)
-        stats_df.to_sql(table_name, self.db_engine, index=True, if_exists='append')
+        # Written in batches by a background thread
+        DbResultsWriter.get_writer(self.db_engine).submit(table_name, stats_df)
+
+        if self.trades_ledger is not None:
+            self.save_trades_to_db(now)
+
+    def save_trades_to_db(self, timestamp):
+        """
+            Queue the trades of this test case for the Test_Results_Trades table, one row per trade.
+            Rows are linked to the row of Test_Results_Statistics by their Timestamp and Test #.
+        """
+        table_name = 'Test_Results_Trades'
+        trades_df = self.trades_ledger.reset_index()
+        trades_df.insert(0, 'Timestamp', timestamp)
+        trades_df.insert(1, 'Test #', self.params['Test_Num'])
+        trades_df.insert(2, 'Pair', self.params['Pair'])
+        trades_df.insert(3, 'Strategy', self.NAME)
+        if self.result_key is not None:
+            trades_df = trades_df.assign(**{ResultStore.KEY_COLUMN: self.result_key})
+        trades_df.set_index('Timestamp', inplace=True)
+        DbResultsWriter.get_writer(self.db_engine).submit(table_name, trades_df)
 
     # Call this method each time a processed to update progress on console
     def update_progress_dots(self):
@@ -3,7 +3,6 @@
     version of strategies
 """
 import datetime as dt
-import sys
 from abc import abstractmethod
 
 import pandas as pd
@@ -363,5 +362,4 @@ class BaseStrategy_X(BaseStrategy):
         return self.df
 
     def process_trades_exit_on_next_entry(self):
-        print(f"Exit_Strategy[{self.params['Exit_Strategy']}] not implemented.")
-        sys.exit(1)
+        raise Exception(f"Exit_Strategy[{self.params['Exit_Strategy']}] not implemented.")
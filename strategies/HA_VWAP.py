@@ -1,5 +1,3 @@
-import sys
-
 import numpy as np
 import pandas as pd
 import rapidjson
@@ -36,6 +34,10 @@ class HA_VWAP(BaseStrategy):
     # Cannot run Strategy on datasets less than this value
     MIN_DATA_SIZE = settings['EMA']
 
+    INDICATOR_SETTINGS = ['EMA']
+
+    VALID_SETTINGS_KEYS = list(settings.keys())
+
     def __init__(self, params):
         super().__init__(params)
         self.NAME = self.__class__.__name__
@@ -44,22 +46,22 @@ class HA_VWAP(BaseStrategy):
         self.prev_row_ha = {}
 
         if self.settings['Nb_Signals'] not in [1, 2, 3, 4]:
-            print(f"Invalid value: {self.settings['Nb_Signals']} for Nb_Signals.")
-            sys.exit(1)
+            raise Exception(f"Invalid value: {self.settings['Nb_Signals']} for Nb_Signals.")
 
     def validate_exit_strategy(self):
         if self.params["Exit_Strategy"] != 'VWAP_Touch':
-            print(f'Exit strategy ({self.params["Exit_Strategy"]}) not supported by {self.params["Strategy"]}.')
-            sys.exit(1)
+            raise Exception(f'Exit strategy ({self.params["Exit_Strategy"]}) '
+                            f'not supported by {self.params["Strategy"]}.')
 
     def decode_param_settings(self):
+        # Instance copy of the default settings, the class defaults are shared by all the test cases
+        self.settings = dict(self.settings)
         _settings = self.params['StrategySettings']
         if _settings:
             # Validate that all keys are valid
             for k in _settings.keys():
-                if k not in self.settings.keys():
-                    print(f'Invalid key [{k}] in strategy settings dictionary.')
-                    sys.exit(1)
+                if k not in self.VALID_SETTINGS_KEYS:
+                    raise Exception(f'Invalid key [{k}] in strategy settings dictionary.')
             # Parameters override default values hardcoded in the class
             for k in _settings.keys():
                 self.settings[k] = _settings[k]
@@ -103,7 +105,7 @@ class HA_VWAP(BaseStrategy):
         self.df[['HA_Open', 'HA_Close']] = self.df.apply(self.heikin_ashi, axis=1).apply(pd.Series)
 
         # EMA: Exponential Moving Average
-        self.df['EMA'] = talib.EMA(self.df['close'], timeperiod=self.settings['EMA'])
+        self.df['EMA'] = self.get_indicator(talib.EMA, 'close', timeperiod=self.settings['EMA'])
 
         # Drop rows with no EMA (usually first 200 rows for EMA200)
         self.df.dropna(subset=['EMA'], how='all', inplace=True)
@@ -239,13 +241,9 @@ class HA_VWAP(BaseStrategy):
         self.df.loc[:, 'exit_fee'] = 0.0
 
         if self.params['Exit_Strategy'] == 'VWAP_Touch':
-            self.prev_row = {}
-            self.df[['trade_status', 'entry_price', 'take_profit', 'stop_loss', 'wallet',
-                     'staked_amount', 'win', 'loss', 'entry_fee', 'exit_fee']] = \
-                self.df.apply(self.get_all_trade_details_vwap_touch, axis=1).apply(pd.Series)
+            self.apply_trade_details(self.get_all_trade_details_vwap_touch)
         else:
-            print(f'Unimplemented exit strategy.')
-            sys.exit(1)
+            raise Exception(f'Unimplemented exit strategy [{self.params["Exit_Strategy"]}].')
 
         # Statistics
         self.stats.nb_wins = self.df['win'].astype(bool).sum(axis=0)
@@ -1,5 +1,3 @@
-import sys
-
 import numpy as np
 import talib
 
@@ -26,6 +24,10 @@ class MACD(BaseStrategy):
     # Cannot run Strategy on data set less than this value
     MIN_DATA_SIZE = EMA
 
+    INDICATOR_SETTINGS = ['EMA', 'MACD_FAST', 'MACD_SLOW', 'MACD_SIGNAL', 'ADX']
+
+    VALID_SETTINGS_KEYS = ['EMA', 'MACD_FAST', 'MACD_SLOW', 'MACD_SIGNAL', 'ADX', 'ADX_THRESHOLD']
+
     # Indicator column names
     ema_col_name = 'EMA' + str(EMA)
     adx_col_name = 'ADX' + str(ADX)
@@ -40,14 +42,12 @@ class MACD(BaseStrategy):
             Expected dictionary format: {"EMA": 200, "MACD_FAST": 12, "MACD_SLOW": 26, "MACD_SIGNAL": 9,
                                          "ADX": 14, "ADX_THRESHOLD": 0}
         """
-        valid_keys = ['EMA', 'MACD_FAST', 'MACD_SLOW', 'MACD_SIGNAL', 'ADX', 'ADX_THRESHOLD']
         settings = self.params['StrategySettings']
         if settings:
             # Validate that all keys are valid
             for k in settings.keys():
-                if k not in valid_keys:
-                    print(f'Invalid key [{k}] in strategy settings dictionary.')
-                    sys.exit(1)
+                if k not in self.VALID_SETTINGS_KEYS:
+                    raise Exception(f'Invalid key [{k}] in strategy settings dictionary.')
             try:
                 if settings['EMA']:
                     self.EMA = int(settings['EMA'])
@@ -83,19 +83,19 @@ class MACD(BaseStrategy):
         # self.df = self.df[self.df.columns.intersection(final_table_columns)]
 
         # MACD - Moving Average Convergence/Divergence
-        macd, macdsignal, macdhist = talib.MACD(self.df['close'],
-                                                fastperiod=self.MACD_FAST,
-                                                slowperiod=self.MACD_SLOW,
-                                                signalperiod=self.MACD_SIGNAL)
+        macd, macdsignal, macdhist = self.get_indicator(talib.MACD, 'close',
+                                                        fastperiod=self.MACD_FAST,
+                                                        slowperiod=self.MACD_SLOW,
+                                                        signalperiod=self.MACD_SIGNAL)
         self.df['MACD'] = macd
         self.df['MACDSIG'] = macdsignal
 
         # EMA - Exponential Moving Average 200
-        self.df[self.ema_col_name] = talib.EMA(self.df['close'], timeperiod=self.EMA)
+        self.df[self.ema_col_name] = self.get_indicator(talib.EMA, 'close', timeperiod=self.EMA)
 
         # ADX
         self.df[self.adx_col_name] = \
-            talib.ADX(self.df['high'], self.df['low'], self.df['close'], timeperiod=self.ADX)
+            self.get_indicator(talib.ADX, 'high', 'low', 'close', timeperiod=self.ADX)
 
         # Identify the trend
         # self.df.loc[self.df['close'] > self.df[self.ema_col_name], 'trend'] = 'Up'
@@ -1,5 +1,3 @@
-import sys
-
 import numpy as np
 import talib
 
@@ -45,12 +43,17 @@ class MACD_BB_Freeman(BaseStrategy):
     ADX = 3
     ADX_THRESHOLD = 0
 
+    # Slow MA needs to be calculated first to then calculate BB
+    MIN_DATA_SIZE = MACD_SLOW + BB_PERIODS
+
+    INDICATOR_SETTINGS = ['MA_TYPE', 'MACD_FAST', 'MACD_SLOW', 'ADX']
+
+    VALID_SETTINGS_KEYS = ['MA_TYPE', 'MACD_FAST', 'MACD_SLOW', 'BB_PERIODS', 'BB_MULT', 'ADX', 'ADX_THRESHOLD']
+
     def __init__(self, params):
         super().__init__(params)
         self.NAME = self.__class__.__name__
 
-        # Slow MA needs to be calculated first to then calculate BB
-        self.MIN_DATA_SIZE = self.MACD_SLOW + self.BB_PERIODS
         assert(self.MA_TYPE in self.MA_CALCULATION_TYPE_VALUES)
 
         self.up_arrow = u"\u2191"
@@ -71,14 +74,12 @@ class MACD_BB_Freeman(BaseStrategy):
                 "ADX_THRESHOLD": 30
             }
         """
-        valid_keys = ['MA_TYPE', 'MACD_FAST', 'MACD_SLOW', 'BB_PERIODS', 'BB_MULT', 'ADX', 'ADX_THRESHOLD']
         settings = self.params['StrategySettings']
         if settings:
             # Validate that all keys are valid
             for k in settings.keys():
-                if k not in valid_keys:
-                    print(f'Invalid key [{k}] in strategy settings dictionary.')
-                    sys.exit(1)
+                if k not in self.VALID_SETTINGS_KEYS:
+                    raise Exception(f'Invalid key [{k}] in strategy settings dictionary.')
             try:
                 if settings['MA_TYPE']:
                     if settings['MA_TYPE'] not in self.MA_CALCULATION_TYPE_VALUES:
@@ -122,23 +123,23 @@ class MACD_BB_Freeman(BaseStrategy):
 
         match self.MA_TYPE:
             case 'SMA':
-                self.df['MA_Fast'] = talib.SMA(self.df['close'], timeperiod=self.MACD_FAST)
-                self.df['MA_Slow'] = talib.SMA(self.df['close'], timeperiod=self.MACD_SLOW)
+                self.df['MA_Fast'] = self.get_indicator(talib.SMA, 'close', timeperiod=self.MACD_FAST)
+                self.df['MA_Slow'] = self.get_indicator(talib.SMA, 'close', timeperiod=self.MACD_SLOW)
             case 'EMA':
-                self.df['MA_Fast'] = talib.EMA(self.df['close'], timeperiod=self.MACD_FAST)
-                self.df['MA_Slow'] = talib.EMA(self.df['close'], timeperiod=self.MACD_SLOW)
+                self.df['MA_Fast'] = self.get_indicator(talib.EMA, 'close', timeperiod=self.MACD_FAST)
+                self.df['MA_Slow'] = self.get_indicator(talib.EMA, 'close', timeperiod=self.MACD_SLOW)
             case 'WMA':
-                self.df['MA_Fast'] = talib.WMA(self.df['close'], timeperiod=self.MACD_FAST)
-                self.df['MA_Slow'] = talib.WMA(self.df['close'], timeperiod=self.MACD_SLOW)
+                self.df['MA_Fast'] = self.get_indicator(talib.WMA, 'close', timeperiod=self.MACD_FAST)
+                self.df['MA_Slow'] = self.get_indicator(talib.WMA, 'close', timeperiod=self.MACD_SLOW)
             case 'Linear':
-                self.df['MA_Fast'] = talib.LINEARREG(self.df['close'], timeperiod=self.MACD_FAST)
-                self.df['MA_Slow'] = talib.LINEARREG(self.df['close'], timeperiod=self.MACD_SLOW)
+                self.df['MA_Fast'] = self.get_indicator(talib.LINEARREG, 'close', timeperiod=self.MACD_FAST)
+                self.df['MA_Slow'] = self.get_indicator(talib.LINEARREG, 'close', timeperiod=self.MACD_SLOW)
 
         # MACD
         self.df['MACD'] = self.df['MA_Fast'] - self.df['MA_Slow']
 
         # Volatility Indicator. ADX
-        self.df['ADX'] = talib.ADX(self.df['high'], self.df['low'], self.df['close'], timeperiod=self.ADX)
+        self.df['ADX'] = self.get_indicator(talib.ADX, 'high', 'low', 'close', timeperiod=self.ADX)
 
         # Bollinger Bands
         self.df['BB_Upper'], self.df['BB_Basis'], self.df['BB_Lower'] = \
@@ -1,5 +1,4 @@
 import datetime
-import sys
 
 import numpy as np
 import talib
@@ -40,6 +39,11 @@ class ScalpEmaRsiAdx(BaseStrategy):
     # Cannot run Strategy on data set less than this value
     MIN_DATA_SIZE = EMA
 
+    INDICATOR_SETTINGS = ['EMA', 'RSI', 'ADX']
+
+    VALID_SETTINGS_KEYS = ['EMA', 'EMA_TOLERANCE', 'RSI', 'RSI_MIN_SIGNAL', 'RSI_MAX_SIGNAL',
+                           'RSI_MIN_ENTRY', 'RSI_MAX_ENTRY', 'ADX', 'ADX_THRESHOLD', 'CONFIRM_FILTER']
+
     # Indicator column names
     ema_col_name = 'EMA' + str(EMA)
     rsi_col_name = 'RSI' + str(RSI)
@@ -66,15 +70,12 @@ class ScalpEmaRsiAdx(BaseStrategy):
                 "CONFIRM_FILTER": False
             }
         """
-        valid_keys = ['EMA', 'EMA_TOLERANCE', 'RSI', 'RSI_MIN_SIGNAL', 'RSI_MAX_SIGNAL',
-                      'RSI_MIN_ENTRY', 'RSI_MAX_ENTRY', 'ADX', 'ADX_THRESHOLD', 'CONFIRM_FILTER']
         settings = self.params['StrategySettings']
         if settings:
             # Validate that all keys are valid
             for k in settings.keys():
-                if k not in valid_keys:
-                    print(f'Invalid key [{k}] in strategy settings dictionary.')
-                    sys.exit(1)
+                if k not in self.VALID_SETTINGS_KEYS:
+                    raise Exception(f'Invalid key [{k}] in strategy settings dictionary.')
             try:
                 if settings['EMA']:
                     self.EMA = int(settings['EMA'])
@@ -117,14 +118,13 @@ class ScalpEmaRsiAdx(BaseStrategy):
         print('Adding indicators and signals to data.')
 
         # Trend Indicator. EMA-50
-        self.df[self.ema_col_name] = talib.EMA(self.df['close'], timeperiod=self.EMA)
+        self.df[self.ema_col_name] = self.get_indicator(talib.EMA, 'close', timeperiod=self.EMA)
 
         # Momentum Indicator. RSI-3
-        self.df[self.rsi_col_name] = talib.RSI(self.df['close'], timeperiod=self.RSI)
+        self.df[self.rsi_col_name] = self.get_indicator(talib.RSI, 'close', timeperiod=self.RSI)
 
         # Volatility Indicator. ADX-5
-        self.df[self.adx_col_name] = talib.ADX(self.df['high'], self.df['low'], self.df['close'],
-                                               timeperiod=self.ADX)
+        self.df[self.adx_col_name] = self.get_indicator(talib.ADX, 'high', 'low', 'close', timeperiod=self.ADX)
 
     # Step 2: Add trade entry points
     # When we get a signal, we only enter the trade when the RSI exists the oversold/overbought area
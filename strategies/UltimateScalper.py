@@ -1,5 +1,3 @@
-import sys
-
 import numpy as np
 import pandas as pd
 import rapidjson
@@ -48,6 +46,10 @@ class UltimateScalper(BaseStrategy):
     # Cannot run Strategy on datasets less than this value
     MIN_DATA_SIZE = settings['EMA_Trend']
 
+    INDICATOR_SETTINGS = ['EMA_Fast', 'EMA_Slow', 'EMA_Trend', 'RSI', 'ADX', 'MACD_Fast', 'MACD_Slow', 'MACD_Signal']
+
+    VALID_SETTINGS_KEYS = list(settings.keys())
+
     def __init__(self, params):
         super().__init__(params)
         self.NAME = self.__class__.__name__
@@ -57,38 +59,21 @@ class UltimateScalper(BaseStrategy):
         self.df_1m = None
         self.get_1m_candle_data()
 
+    @classmethod
+    def get_candle_data_intervals(cls, params):
+        return super().get_candle_data_intervals(params) + [('1m', cls.MIN_DATA_SIZE)]
+
     def get_1m_candle_data(self):
-        if self.config['database']['historical_data_stored_in_db']:
-            self.df_1m = self.db_reader.get_candle_data(
-                self.params['Pair'],
-                self.params['From_Time'],
-                self.params['To_Time'],
-                '1m',
-                include_prior=self.MIN_DATA_SIZE,
-                verbose=True)
-            if self.df_1m is None:
+        self.df_1m = self.read_candle_data('1m', self.MIN_DATA_SIZE)
+        if self.df_1m is None:
+            if self.config['database']['historical_data_stored_in_db']:
                 raise Exception(f"No data returned by the database. Unable to backtest strategy.")
-            elif len(self.df_1m) <= self.MIN_DATA_SIZE:
-                print(
-                    f'\nData rows = {len(self.df_1m)}, less than MIN_DATA_SIZE={self.MIN_DATA_SIZE}. '
-                    f'Unable to backtest strategy.')
-                raise Exception("Unable to Run Strategy on Data Set")
-        else:
-            self.df_1m = self.exchange.get_candle_data(
-                self.params['Pair'],
-                self.params['From_Time'],
-                self.params['To_Time'],
-                '1m',
-                include_prior=self.MIN_DATA_SIZE,
-                write_to_file=True,
-                verbose=True)
-            if self.df_1m is None:
-                raise Exception(f"No data returned by {self.exchange.NAME}. Unable to backtest strategy.")
-            elif len(self.df_1m) <= self.MIN_DATA_SIZE:
-                print(
-                    f'\nData rows = {len(self.df_1m)}, less than MIN_DATA_SIZE={self.MIN_DATA_SIZE}. '
-                    f'Unable to backtest strategy.')
-                raise Exception("Unable to Run Strategy on Data Set")
+            raise Exception(f"No data returned by {self.exchange.NAME}. Unable to backtest strategy.")
+        elif len(self.df_1m) <= self.MIN_DATA_SIZE:
+            print(
+                f'\nData rows = {len(self.df_1m)}, less than MIN_DATA_SIZE={self.MIN_DATA_SIZE}. '
+                f'Unable to backtest strategy.')
+            raise Exception("Unable to Run Strategy on Data Set")
 
         # Set proper data types
         self.df_1m['open'] = self.df_1m['open'].astype(float)
@@ -99,13 +84,14 @@ class UltimateScalper(BaseStrategy):
         self.df_1m['end_time'] = self.df_1m.index + timedelta(minutes=1)
 
     def decode_param_settings(self):
+        # Instance copy of the default settings, the class defaults are shared by all the test cases
+        self.settings = dict(self.settings)
         _settings = self.params['StrategySettings']
         if _settings:
             # Validate that all keys are valid
             for k in _settings.keys():
-                if k not in self.settings.keys():
-                    print(f'Invalid key [{k}] in strategy settings dictionary.')
-                    sys.exit(1)
+                if k not in self.VALID_SETTINGS_KEYS:
+                    raise Exception(f'Invalid key [{k}] in strategy settings dictionary.')
 
             # Parameters override default values hardcoded in the class
             for k in _settings.keys():
@@ -129,24 +115,24 @@ class UltimateScalper(BaseStrategy):
         self.df['end_time'] = self.df.index + timedelta(minutes=minutes)
 
         # EMA: Exponential Moving Average
-        self.df['EMA_Fast'] = talib.EMA(self.df['close'], timeperiod=self.settings['EMA_Fast'])
-        self.df['EMA_Slow'] = talib.EMA(self.df['close'], timeperiod=self.settings['EMA_Slow'])
-        self.df['EMA_Trend'] = talib.EMA(self.df['close'], timeperiod=self.settings['EMA_Trend'])
+        self.df['EMA_Fast'] = self.get_indicator(talib.EMA, 'close', timeperiod=self.settings['EMA_Fast'])
+        self.df['EMA_Slow'] = self.get_indicator(talib.EMA, 'close', timeperiod=self.settings['EMA_Slow'])
+        self.df['EMA_Trend'] = self.get_indicator(talib.EMA, 'close', timeperiod=self.settings['EMA_Trend'])
 
         # RSI: Momentum Indicator
-        self.df['RSI'] = talib.RSI(self.df['close'], timeperiod=self.settings['RSI'])
+        self.df['RSI'] = self.get_indicator(talib.RSI, 'close', timeperiod=self.settings['RSI'])
 
         # ADX: Volatility Indicator
-        self.df['ADX'] = talib.ADX(self.df['high'], self.df['low'], self.df['close'], timeperiod=self.settings['ADX'])
+        self.df['ADX'] = self.get_indicator(talib.ADX, 'high', 'low', 'close', timeperiod=self.settings['ADX'])
 
         # Drop rows with no EMA_Trend (usually first 200 rows for EMA200)
         self.df.dropna(subset=['EMA_Trend'], how='all', inplace=True)
 
         # Calculate MACD  and Bollinger bands on 1m timeframe
-        macd, macdsignal, macdhist = talib.MACD(self.df_1m['close'],
-                                                fastperiod=self.settings["MACD_Fast"],
-                                                slowperiod=self.settings["MACD_Slow"],
-                                                signalperiod=self.settings["MACD_Signal"])
+        macd, macdsignal, macdhist = self.get_indicator(talib.MACD, 'close', interval='1m',
+                                                        fastperiod=self.settings["MACD_Fast"],
+                                                        slowperiod=self.settings["MACD_Slow"],
+                                                        signalperiod=self.settings["MACD_Signal"])
         self.df_1m['MACDHist'] = macdhist
         self.df_1m['BB_Basis'] = talib.EMA(self.df_1m['MACDHist'], self.settings['BB_Length'])
         self.df_1m['BB_Mult'] = self.settings['BB_Mult']
@@ -1,41 +1,114 @@
 import datetime as dt
+import re
 from datetime import timedelta
 
-import dask.dataframe as dd
+import numpy as np
 import pandas as pd
 from openpyxl import load_workbook, Workbook
 from openpyxl.utils.dataframe import dataframe_to_rows
 
-import constants
-
-# Adjust from_time to include prior X entries for that interval for ema200
 from Configuration import Configuration
 
+INTERVAL_REGEX = re.compile(r'^(\d+)([mhdwM])$')
 
+
+# Adjust from_time to include prior X entries for that interval for ema200
 def adjust_from_time(from_time, interval, include_prior):
-    if interval not in constants.VALID_INTERVALS:
+    if not is_valid_interval(interval):
         raise Exception(f'Invalid interval value: {interval}')
 
     delta = include_prior - 1
-    if 'm' in interval:
-        interval = interval.replace('m', '')
-        from_time = from_time - timedelta(minutes=int(interval) * delta)
-    elif 'h' in interval:
-        interval = interval.replace('h', '')
-        from_time = from_time - timedelta(hours=int(interval) * delta)
-    elif 'd' in interval:
-        from_time = from_time - timedelta(days=delta)
-    elif 'w' in interval:
-        from_time = from_time - timedelta(weeks=delta)
+    amount, unit = parse_interval(interval)
+    if unit == 'm':
+        from_time = from_time - timedelta(minutes=amount * delta)
+    elif unit == 'h':
+        from_time = from_time - timedelta(hours=amount * delta)
+    elif unit == 'd':
+        from_time = from_time - timedelta(days=amount * delta)
+    elif unit == 'w':
+        from_time = from_time - timedelta(weeks=amount * delta)
     return from_time
 
 
+def parse_interval(interval):
+    """
+        Split an interval string into its amount and unit. Ex: '15m' => (15, 'm'), '1M' => (1, 'M')
+        Units: m=minute, h=hour, d=day, w=week, M=month
+    """
+    match = INTERVAL_REGEX.match(str(interval))
+    if match is None:
+        raise Exception(f'Invalid interval value: {interval}')
+    return int(match.group(1)), match.group(2)
+
+
+# Intervals are not limited to constants.VALID_INTERVALS, any well-formed
+# interval can be derived from the 1m candles (Ex: '7m', '3h', '2d')
+def is_valid_interval(interval):
+    match = INTERVAL_REGEX.match(str(interval))
+    return match is not None and int(match.group(1)) > 0
+
+
+# Convert a datetime to a timestamp in milliseconds. Naive datetimes are converted as is,
+# the same way they are stored in the datetime64 index of the candle DataFrames
+def datetime_to_ms(value):
+    return int(pd.Timestamp(value).value // 1000000)
+
+
+# Convert a timestamp in milliseconds to a naive UTC datetime
+def ms_to_datetime(value):
+    return pd.Timestamp(int(value), unit='ms').to_pydatetime()
+
+
+# Current time as a naive UTC datetime, same convention as the candle index
+def utc_now():
+    return dt.datetime.now(dt.timezone.utc).replace(tzinfo=None)
+
+
+# Convert naive local times (index of the candles loaded before they were indexed in UTC) to naive UTC
+def local_to_utc(value):
+    if isinstance(value, pd.DatetimeIndex):
+        ms = np.array([round(x.timestamp() * 1000) for x in value.to_pydatetime()], dtype=np.int64)
+        return pd.DatetimeIndex(ms.astype('datetime64[ms]'), name=value.name)
+    return dt.datetime.fromtimestamp(value.timestamp(), dt.timezone.utc).replace(tzinfo=None)
+
+
+OHLCV_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+
+
+def ohlcv_to_dataframe(rows, pair=None, unit='ms', timestamp_column=None):
+    """
+        Convert exchange candles [[timestamp, open, high, low, close, volume, ...], ...] (ccxt fetch_ohlcv() format,
+        values can be numbers or numeric strings) into a DataFrame with float64 OHLCV columns
+        and a datetime64[ms] index of the candle open time in UTC.
+        All rows are converted in a single numpy array, no per row or per column conversion.
+        unit: unit of the timestamps, 'ms' or 's'
+        timestamp_column: name of the column where the raw timestamps are kept (in ms), not kept by default
+    """
+    if len(rows) == 0:
+        data = np.empty((0, 6), dtype=np.float64)
+    else:
+        data = np.asarray([row[:6] for row in rows] if len(rows[0]) > 6 else rows, dtype=np.float64)
+    timestamps = data[:, 0].astype(np.int64)
+    if unit == 's':
+        timestamps *= 1000
+
+    columns = {}
+    if pair is not None:
+        columns['pair'] = pair
+    if timestamp_column is not None:
+        columns[timestamp_column] = timestamps
+    for i, column in enumerate(OHLCV_COLUMNS):
+        columns[column] = data[:, i + 1]
+    return pd.DataFrame(columns, index=pd.DatetimeIndex(timestamps.astype('datetime64[ms]')))
+
+
 # Convert an index value of type numpy.datetime64 to type datetime
 def idx2datetime(index_value):
     return dt.datetime.utcfromtimestamp(index_value.astype('O') / 1e9)
 
 
-def save_trades_to_file(test_num, exchange, pair, from_time, to_time, interval, df, include_time=False, verbose=True):
+def save_trades_to_file(test_num, exchange, pair, from_time, to_time, interval, df, include_time=False, verbose=True,
+                        suffix='Trades'):
     config = Configuration.get_config()
     test_num = str(test_num)
     pair = pair.replace('/', '-')
@@ -48,19 +121,21 @@ def save_trades_to_file(test_num, exchange, pair, from_time, to_time, interval,
         to_str = to_time.strftime('%Y-%m-%d')
 
     filename = f'{exchange} {pair} [{interval}] {from_str} to {to_str}'
-    filename = f"{config['output']['results_path']}\\{test_num} {filename} Trades"
+    filename = f"{config['output']['results_path']}\\{test_num} {filename} {suffix}"
 
     if 'csv' in config['output']['output_file_format']:
-        filename = filename + '.csv'
-        df.to_csv(filename, index=True, header=True)
+        df.to_csv(filename + '.csv', index=True, header=True)
         if verbose:
-            print(f'Trades file created => [{filename}]')
+            print(f'{suffix} file created => [{filename}.csv]')
     if 'xlsx' in config['output']['output_file_format']:
-        filename = filename + '.xlsx'
-        df.to_excel(filename, index=True, header=True)
+        df.to_excel(filename + '.xlsx', index=True, header=True)
         # to_excel_formatted(df, filename)
         if verbose:
-            print(f'Trades file created => [{filename}]')
+            print(f'{suffix} file created => [{filename}.xlsx]')
+    if 'parquet' in config['output']['output_file_format']:
+        df.to_parquet(filename + '.parquet', index=True)
+        if verbose:
+            print(f'{suffix} file created => [{filename}.parquet]')
 
 
 # TODO: Find a way to format the Excel workbook prior to saving to file
@@ -79,27 +154,25 @@ def to_excel_formatted(df, filename):
 
 
 def convert_interval_to_min(interval):
-    if interval not in constants.VALID_INTERVALS:
+    if not is_valid_interval(interval):
         raise Exception(f'Invalid interval value: {interval}')
 
-    if 'm' in interval:
-        interval = interval.replace('m', '')
-        return int(interval)
-    elif 'h' in interval:
-        interval = interval.replace('h', '')
-        return int(interval) * 60
-    elif 'd' in interval:
-        interval = interval.replace('d', '')
-        return int(interval) * 1440
-    elif 'w' in interval:
-        interval = interval.replace('w', '')
-        return int(interval) * 10080
+    amount, unit = parse_interval(interval)
+    if unit == 'm':
+        return amount
+    elif unit == 'h':
+        return amount * 60
+    elif unit == 'd':
+        return amount * 1440
+    elif unit == 'w':
+        return amount * 10080
     else:
         return 0
 
 
 def read_excel_to_dataframe(filename):
-    wb = load_workbook(filename)
+    # Read only mode streams the rows instead of loading every cell object of the workbook
+    wb = load_workbook(filename, read_only=True)
     ws = wb['Sheet1']
 
     # To convert a worksheet to a Dataframe you can use the value's property.
@@ -117,13 +190,13 @@ def read_excel_to_dataframe(filename):
     idx = [r[0] for r in data]
     data = (islice(r, 1, None) for r in data)
     df = pd.DataFrame(data, index=idx, columns=cols)
+    wb.close()
 
     return df
 
 
 def read_csv_to_dataframe(filename):
-    dask_df = dd.read_csv(filename, parse_dates=['Unnamed: 0']).set_index('Unnamed: 0')
-    df = dask_df.compute()
+    df = pd.read_csv(filename, index_col=0, parse_dates=True)
     df.index.name = None
     # print(f'from:{from_time} to:{to_time}')
     # print(df.to_string())
@@ -131,11 +204,9 @@ def read_csv_to_dataframe(filename):
 
 
 def read_csv_to_dataframe_by_range(filename, from_time, to_time):
-    dask_df = dd.read_csv(filename, parse_dates=['Unnamed: 0']).set_index('Unnamed: 0')
-    dask_df = dask_df.loc[from_time:to_time]
-    df = dask_df.compute()
-    df.dropna(inplace=True)
-    df.index.name = None
+    df = read_csv_to_dataframe(filename)
+    df = df.loc[from_time:to_time]
+    df = df.dropna()
     # print(f'from:{from_time} to:{to_time}')
     # print(df.to_string())
     return df